@@ -20,10 +20,17 @@ submission.
 """
 from datetime import datetime, timedelta
 import os
+import shutil
+import subprocess
+import sys
+from typing import Any, Tuple
 import pygame
+import pytest
 from pytest import approx
 from bikeshare import Ride, Station
-from simulation import Simulation, create_stations, create_rides
+from container import HeapPriorityQueue
+from simulation import (Simulation, create_stations, create_rides,
+                        index_rides, iter_rides, parse_time, DATETIME_FORMAT)
 
 
 ###############################################################################
@@ -177,6 +184,1372 @@ def test_ride_ends_outside_run():
     )
 
 
+def test_ride_integer_times():
+    """Rides store their times as minutes but still expose datetimes."""
+    stations = create_stations('stations.json')
+    ride = Ride(stations['6134'], stations['6721'],
+                (datetime(2017, 6, 1, 7, 31), datetime(2017, 6, 1, 7, 54)))
+    assert ride.end_minute - ride.start_minute == 23
+    assert ride.start_time == datetime(2017, 6, 1, 7, 31)
+    assert ride.end_time == datetime(2017, 6, 1, 7, 54)
+
+    same = Ride.from_minutes(ride.start, ride.end, ride.start_minute,
+                             ride.end_minute)
+    assert same.start_time == ride.start_time
+    assert same.speed == approx(ride.speed)
+    assert not hasattr(ride, '__dict__')
+    assert not hasattr(ride.start, '__dict__')
+
+
+###############################################################################
+# Tests for HeapPriorityQueue
+###############################################################################
+class _Item:
+    """A queue item whose priority is independent of its identity."""
+    def __init__(self, priority: int, label: str) -> None:
+        self.priority = priority
+        self.label = label
+
+    def __lt__(self, other: '_Item') -> bool:
+        return self.priority < other.priority
+
+
+def test_heap_priority_queue_fifo_ties():
+    """Equal items are removed in the order they were added."""
+    pq = HeapPriorityQueue()
+    for priority, label in [(2, 'a'), (1, 'b'), (2, 'c'), (1, 'd'), (0, 'e')]:
+        pq.add(_Item(priority, label))
+
+    labels = []
+    while not pq.is_empty():
+        labels.append(pq.remove().label)
+    assert labels == ['e', 'b', 'd', 'a', 'c']
+
+
+def test_heap_priority_queue_add_many():
+    """Bulk-loaded items keep FIFO ties with items added individually."""
+    pq = HeapPriorityQueue([_Item(1, 'a'), _Item(0, 'b')])
+    pq.add(_Item(1, 'c'))
+    pq.add_many([_Item(0, 'd'), _Item(1, 'e')])
+
+    labels = []
+    while not pq.is_empty():
+        labels.append(pq.remove().label)
+    assert labels == ['b', 'd', 'a', 'c', 'e']
+
+
+def test_heap_priority_queue_add_few_to_large():
+    """Adding a few items to a large queue keeps it ordered."""
+    pq = HeapPriorityQueue([_Item(priority % 97, str(priority))
+                            for priority in range(1000)])
+    pq.add_many([_Item(50, 'x'), _Item(-1, 'y')])
+
+    items = []
+    while not pq.is_empty():
+        items.append(pq.remove())
+    assert items[0].label == 'y'
+    assert [item.priority for item in items] == sorted(
+        item.priority for item in items)
+    assert [item.label for item in items if item.priority == 50][-1] == 'x'
+
+
+def test_heap_priority_queue_add_first():
+    """Ties go to items added with first=True, in the order they were
+    added.
+    """
+    pq = HeapPriorityQueue([_Item(1, 'a'), _Item(0, 'b')])
+    pq.add_many([_Item(1, 'c'), _Item(0, 'd')], first=True)
+    pq.add(_Item(0, 'e'))
+    pq.add_many([_Item(1, 'f')], first=True)
+
+    labels = []
+    while not pq.is_empty():
+        labels.append(pq.remove().label)
+    assert labels == ['d', 'b', 'e', 'c', 'f', 'a']
+
+
+###############################################################################
+# Tests for the event-driven run
+###############################################################################
+def test_run_event_driven_matches_run():
+    """The event-driven run gives the same statistics as stepping through
+    every minute of the same period.
+    """
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+
+    stepped = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    stepped.initialize_queue(start, end)
+    time = start
+    while time != end:
+        stepped._update_active_rides_fast(time)
+        stepped.update_statistics()
+        time += timedelta(minutes=1)
+
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    sim.run_event_driven(start, end)
+
+    assert sim.calculate_statistics() == stepped.calculate_statistics()
+    for station_id, station in sim.all_stations.items():
+        assert station.stats == stepped.all_stations[station_id].stats
+        assert station.num_bikes == stepped.all_stations[station_id].num_bikes
+
+
+def test_run_event_driven_low_time():
+    """The event-driven run counts low availability and low unoccupied time
+    for stations that never change.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    sim.run_event_driven(datetime(2017, 6, 1, 9, 30, 0),
+                         datetime(2017, 6, 1, 9, 45, 0))
+    stats = sim.calculate_statistics()
+
+    assert stats['max_time_low_availability'] == ('15e avenue / Masson', 900)
+    assert stats['max_time_low_unoccupied'] == ('10e Avenue / Rosemont', 900)
+
+
+###############################################################################
+# Tests for headless simulations
+###############################################################################
+def test_headless_run():
+    """A headless simulation returns from run and computes the same
+    statistics as test_statistics_simple.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    assert sim.visualizer is None
+
+    sim.run(datetime(2017, 6, 1, 9, 30, 0),
+            datetime(2017, 6, 1, 9, 45, 0))
+    stats = sim.calculate_statistics()
+
+    assert stats['max_start'] == (sim.all_stations['6091'].name, 1)
+    assert stats['max_end'] == (sim.all_stations['6052'].name, 1)
+    assert stats['max_time_low_availability'] == ('15e avenue / Masson', 900)
+    assert stats['max_time_low_unoccupied'] == ('10e Avenue / Rosemont', 900)
+
+
+def test_headless_does_not_import_pygame():
+    """A headless simulation never imports pygame."""
+    code = (
+        'import sys\n'
+        'from datetime import datetime\n'
+        'from simulation import Simulation\n'
+        'sim = Simulation("stations.json", "sample_rides.csv", headless=True)\n'
+        'sim.run(datetime(2017, 6, 1, 9, 30), datetime(2017, 6, 1, 9, 45))\n'
+        'assert "pygame" not in sys.modules\n'
+    )
+    subprocess.run([sys.executable, '-c', code], check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+###############################################################################
+# Tests for the columnar station store
+###############################################################################
+def test_columnar_matches_objects():
+    """A columnar simulation computes the same statistics and station
+    state as one using ordinary Station objects, in both run modes.
+    """
+    pytest.importorskip('numpy')
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+
+    expected = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    expected.run(start, end)
+
+    stepped = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                         columnar=True)
+    stepped.run(start, end)
+    jumped = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                        columnar=True)
+    jumped.run_event_driven(start, end)
+
+    for sim in (stepped, jumped):
+        assert sim.calculate_statistics() == expected.calculate_statistics()
+        for station_id, station in sim.all_stations.items():
+            assert station.stats == expected.all_stations[station_id].stats
+            assert (station.num_bikes ==
+                    expected.all_stations[station_id].num_bikes)
+
+
+###############################################################################
+# Tests for statistic leaders
+###############################################################################
+def test_top_k_leaders():
+    """Tracked leaders agree with a full scan of the stations, in both run
+    modes.
+    """
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    expected = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    expected.run(start, end)
+
+    stepped = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                         track_leaders=True)
+    stepped.run(start, end)
+    jumped = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                        track_leaders=True)
+    jumped.run_event_driven(start, end)
+
+    for sim in (stepped, jumped):
+        assert sim.calculate_statistics() == expected.calculate_statistics()
+        for stat in ['ride_starts', 'ride_finishes', 'low_availability',
+                     'low_unoccupied']:
+            assert sim.top_k(stat, 5) == expected.top_k(stat, 5)
+    assert expected.top_k('ride_starts', 1) == [
+        (expected.calculate_statistics()['max_start'])]
+
+
+def test_top_k_leaders_mid_run():
+    """Leaders asked for in the middle of an event-driven run agree with a
+    run that ends at that time.
+    """
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    stats = ['ride_starts', 'ride_finishes', 'low_availability',
+             'low_unoccupied']
+    seen = {}
+
+    def query(sim: Simulation, time: datetime) -> None:
+        seen[time] = ([sim.top_k(stat, 5) for stat in stats],
+                      sim.get_optimal_stat('low_availability'))
+
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                     track_leaders=True)
+    sim.add_periodic_task(timedelta(minutes=25), query)
+    sim.run_event_driven(start, end)
+
+    assert len(seen) == 4
+    for time, leaders in seen.items():
+        expected = Simulation('stations.json', 'sample_rides.csv',
+                              headless=True)
+        expected.run_event_driven(start, time)
+        assert leaders == ([expected.top_k(stat, 5) for stat in stats],
+                           expected.get_optimal_stat('low_availability'))
+
+
+###############################################################################
+# Tests for the visualizer
+###############################################################################
+def test_visualizer_sprite_cache():
+    """Each sprite file is loaded once, and every frame is timed."""
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'                 # Ignore this line
+    from visualizer import Visualizer
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    visualizer = Visualizer()
+
+    drawables = list(stations.values()) + rides[:3]
+    visualizer.render_drawables(drawables, rides[0].start_time)
+    visualizer.render_drawables(drawables, rides[0].end_time)
+
+    assert len(visualizer._map._sprites) == 2
+    assert visualizer.frame_count == 2
+    assert visualizer.total_frame_time >= visualizer.last_frame_time > 0
+    assert visualizer.average_frame_time() == approx(
+        visualizer.total_frame_time / 2)
+
+
+def test_map_view_cache():
+    """The scaled map view is reused until the view is panned or zoomed,
+    and zooming back to a recent zoom level reuses the earlier view.
+    """
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'                 # Ignore this line
+    from visualizer import Map
+    pygame.init()
+    pygame.display.set_mode((960, 787))
+    view_map = Map((960, 787))
+
+    view = view_map.get_current_view()
+    assert view_map.get_current_view() is view
+
+    view_map.zoom(0.1)
+    zoomed = view_map.get_current_view()
+    assert zoomed is not view
+    assert zoomed.get_size() == (960, 787)
+
+    view_map.zoom(-0.1)
+    assert view_map.get_current_view() is view
+    view_map.zoom(0.1)
+    assert view_map.get_current_view() is zoomed
+
+    view_map.pan((-10, -10))
+    assert view_map.get_current_view() is not zoomed
+
+
+def test_ride_positions_batch():
+    """Batched ride positions and screen coordinates are the same as those
+    computed one ride at a time.
+    """
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'                 # Ignore this line
+    from bikeshare import ride_positions
+    from visualizer import Map
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    view_map = Map((960, 787))
+    view_map.zoom(0.3)
+    view_map.pan((-25, -40))
+
+    time = datetime(2017, 6, 1, 8, 15, 0)
+    positions = ride_positions(rides, time)
+    assert positions.shape == (len(rides), 2)
+    assert positions.tolist() == [list(ride.get_position(time))
+                                  for ride in rides]
+    assert view_map._latlong_to_screen_array(positions).tolist() == [
+        list(view_map._latlong_to_screen(ride.get_position(time)))
+        for ride in rides]
+    assert ride_positions([], time).shape == (0, 2)
+
+
+def test_render_without_numpy(monkeypatch):
+    """Without NumPy, objects are drawn where the batched path draws them."""
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'                 # Ignore this line
+    pytest.importorskip('numpy')
+    from visualizer import Map
+    pygame.init()
+    pygame.display.set_mode((960, 787))
+    stations = create_stations('stations.json')
+    drawables = list(stations.values()) + create_rides('sample_rides.csv',
+                                                        stations)
+    view_map = Map((960, 787))
+    time = datetime(2017, 6, 1, 8, 15, 0)
+
+    batched = pygame.Surface((960, 787))
+    view_map.render_objects(drawables, batched, time)
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    single = pygame.Surface((960, 787))
+    view_map.render_objects(drawables, single, time)
+
+    assert (pygame.image.tobytes(single, 'RGB') ==
+            pygame.image.tobytes(batched, 'RGB'))
+
+
+###############################################################################
+# Tests for the ride loader
+###############################################################################
+def test_parse_time():
+    """parse_time agrees with datetime.strptime."""
+    for text in ['2017-06-01 07:31', '2017-06-01 8:00', '2017-12-31 23:59']:
+        assert parse_time(text) == datetime.strptime(text, DATETIME_FORMAT)
+
+
+def test_iter_rides_chunks():
+    """iter_rides yields the same rides as create_rides, in chunks."""
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    chunks = list(iter_rides('sample_rides.csv', stations, chunk_size=4))
+
+    assert all(len(chunk) == 4 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 4
+    streamed = [ride for chunk in chunks for ride in chunk]
+    assert ([(r.start, r.end, r.start_time, r.end_time) for r in streamed] ==
+            [(r.start, r.end, r.start_time, r.end_time) for r in rides])
+
+
+def test_create_rides_window():
+    """Rides outside the window are never loaded, and loading only the
+    window's rides does not change the simulation's results.
+    """
+    start = datetime(2017, 6, 1, 9, 30, 0)
+    end = datetime(2017, 6, 1, 9, 45, 0)
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations, (start, end))
+    assert len(rides) == 1
+    assert rides[0].start is stations['6091']
+
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                     window=(start, end))
+    sim.run_event_driven(start, end)
+    assert sim.calculate_statistics()['max_end'] == (
+        sim.all_stations['6052'].name, 1)
+
+
+###############################################################################
+# Tests for the binary cache
+###############################################################################
+def test_cache_round_trip(tmp_path):
+    """Loading through the cache gives the same stations and rides as
+    parsing the files, and a changed source file invalidates its cache.
+    """
+    pytest.importorskip('numpy')
+    import ridecache
+    stations_file = str(tmp_path / 'stations.json')
+    rides_file = str(tmp_path / 'rides.csv')
+    shutil.copy('stations.json', stations_file)
+    shutil.copy('sample_rides.csv', rides_file)
+    expected_stations = create_stations('stations.json')
+    expected_rides = create_rides('sample_rides.csv', expected_stations)
+
+    for _ in range(2):  # The second pass reads from the cache
+        stations = ridecache.load_stations(stations_file)
+        rides = ridecache.load_rides(rides_file, stations)
+        assert os.path.isdir(ridecache.cache_dir(rides_file))
+        assert list(stations) == list(expected_stations)
+        for station_id, station in stations.items():
+            expected = expected_stations[station_id]
+            assert (station.name, station.location, station.capacity,
+                    station.num_bikes) == (expected.name, expected.location,
+                                           expected.capacity,
+                                           expected.num_bikes)
+        assert ([(r.start.name, r.end.name, r.start_time, r.end_time)
+                 for r in rides] ==
+                [(r.start.name, r.end.name, r.start_time, r.end_time)
+                 for r in expected_rides])
+
+    window = (datetime(2017, 6, 1, 9, 30), datetime(2017, 6, 1, 9, 45))
+    assert len(ridecache.load_rides(rides_file, stations, window)) == 1
+
+    with open(rides_file, 'a') as file:
+        file.write('2017-06-01 09:50,6091,2017-06-01 09:55,6052,300,1\n')
+    assert len(ridecache.load_rides(rides_file, stations)) == \
+        len(expected_rides) + 1
+
+
+def test_cache_rebuild_keeps_mapped_columns(tmp_path):
+    """Rebuilding a cache replaces its files, so columns already
+    memory-mapped from the old cache keep their contents.
+    """
+    np = pytest.importorskip('numpy')
+    import ridecache
+    rides_file = str(tmp_path / 'rides.csv')
+    shutil.copy('sample_rides.csv', rides_file)
+    ridecache.load_ride_columns(rides_file)  # Builds the cache
+    old = ridecache.load_ride_columns(rides_file)  # Memory-maps it
+    start_minutes = np.array(old['start_minute'])
+
+    with open(rides_file, 'w') as file:
+        file.write('2017-06-01 09:50,6091,2017-06-01 09:55,6052,300,1\n')
+    new = ridecache.load_ride_columns(rides_file)
+    assert len(new['start_minute']) == 1
+    assert np.array_equal(old['start_minute'], start_minutes)
+    assert sorted(os.listdir(tmp_path)) == ['rides.csv', 'rides.csv.cache']
+    assert len(ridecache.load_ride_columns(rides_file)['start_minute']) == 1
+
+
+###############################################################################
+# Tests for parameter sweeps
+###############################################################################
+def test_run_sweep():
+    """Each scenario's results match a separate headless run, and
+    scenario overrides change the initial station state.
+    """
+    from sweep import Scenario, run_sweep, sweep_table
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    scenarios = [
+        Scenario('morning', start, end),
+        Scenario('late', datetime(2017, 6, 1, 9, 30), datetime(2017, 6, 1,
+                                                                9, 45)),
+        Scenario('empty', datetime(2017, 6, 1, 9, 30),
+                 datetime(2017, 6, 1, 9, 45), num_bikes={'6091': 0})
+    ]
+    results = run_sweep('stations.json', 'sample_rides.csv', scenarios,
+                        max_workers=2)
+
+    assert [result.scenario for result in results] == [
+        'morning', 'late', 'empty']
+    for result, scenario in zip(results[:2], scenarios):
+        sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+        sim.run_event_driven(scenario.start, scenario.end)
+        assert result.statistics == sim.calculate_statistics()
+        for station_id, station in sim.all_stations.items():
+            assert result.stations[station_id]['ride_starts'] == \
+                station.stats['ride_starts']
+            assert result.stations[station_id]['num_bikes'] == \
+                station.num_bikes
+
+    # With no bikes at 6091, the only ride in the window cannot start.
+    assert results[2].statistics['max_start'][1] == 0
+    assert results[2].stations['6091']['num_bikes'] == 0
+
+    rows = sweep_table(results)
+    assert len(rows) == 3 * len(results[0].stations)
+    assert rows[0]['scenario'] == 'morning'
+
+
+def _add_shared(item: int) -> Tuple[int, int]:
+    """Return <item> plus the shared data, and the id of this process."""
+    from workers import shared
+    return item + shared(), os.getpid()
+
+
+def test_map_shared():
+    """Every item sees the shared data, and it is cleared afterwards."""
+    from functools import partial
+    import workers
+    results = workers.map_shared(_add_shared, range(6), partial(int, '10'),
+                                 max_workers=2)
+    assert [value for value, _ in results] == list(range(10, 16))
+    assert all(pid != os.getpid() for _, pid in results)
+    assert workers.shared() is workers._NOT_LOADED
+
+
+###############################################################################
+# Tests for checkpoints
+###############################################################################
+class _Interrupted(Exception):
+    """Raised to stop a simulation part-way through a run."""
+
+
+def _interrupt(sim: Simulation, time: datetime) -> None:
+    """A periodic task that stops the simulation at 8:15."""
+    if time >= datetime(2017, 6, 1, 8, 15):
+        raise _Interrupted
+
+
+def test_checkpoint_resume(tmp_path):
+    """A run resumed from a checkpoint finishes with the same results as
+    an uninterrupted run.
+    """
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    path = str(tmp_path / 'sim.ckpt')
+    expected = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    expected.run_event_driven(start, end)
+
+    interrupted = Simulation('stations.json', 'sample_rides.csv',
+                             headless=True)
+    interrupted.add_periodic_task(timedelta(minutes=15), _interrupt)
+    with pytest.raises(_Interrupted):
+        interrupted.run_event_driven(start, end, path, timedelta(minutes=20))
+
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    sim.resume(path, end)
+
+    assert sim.calculate_statistics() == expected.calculate_statistics()
+    for station_id, station in sim.all_stations.items():
+        assert station.stats == expected.all_stations[station_id].stats
+        assert station.num_bikes == expected.all_stations[station_id].num_bikes
+    assert ([(ride.start_time, ride.end_time) for ride in sim.active_rides] ==
+            [(ride.start_time, ride.end_time)
+             for ride in expected.active_rides])
+
+
+def test_checkpoint_rerouted(tmp_path):
+    """A resumed run counts the rides rerouted before it was interrupted."""
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    path = str(tmp_path / 'sim.ckpt')
+    sims = []
+    for _ in range(3):
+        sim = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                         reroute=True)
+        for i, station in enumerate(sim.all_stations.values()):
+            if i % 2:
+                station.num_bikes = station.capacity
+        sims.append(sim)
+    expected, interrupted, resumed = sims
+    expected.run_event_driven(start, end)
+    interrupted.add_periodic_task(timedelta(minutes=15), _interrupt)
+    with pytest.raises(_Interrupted):
+        interrupted.run_event_driven(start, end, path, timedelta(minutes=20))
+    resumed.resume(path, end)
+
+    assert 0 < interrupted.num_rerouted < expected.num_rerouted
+    assert resumed.num_rerouted == expected.num_rerouted
+
+
+def test_checkpoint_ride_rows_once(tmp_path, monkeypatch):
+    """The rows of the rides are found once per run, not per checkpoint."""
+    import checkpoint
+    calls = []
+
+    def ride_rows(sim: Simulation) -> dict:
+        calls.append(sim)
+        return {ride: row for row, ride in enumerate(sim.all_rides)}
+
+    monkeypatch.setattr(checkpoint, 'ride_rows', ride_rows)
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    sim.run_event_driven(datetime(2017, 6, 1, 7, 0, 0),
+                         datetime(2017, 6, 1, 9, 0, 0),
+                         str(tmp_path / 'sim.ckpt'), timedelta(minutes=10))
+    assert calls == [sim]
+
+
+def test_settle_part_minutes(tmp_path):
+    """Settling the low time statistics, or checkpointing, at times that
+    are not whole minutes does not change the results of a run.
+    """
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    expected = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    expected.run_event_driven(start, end)
+
+    settled = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    settled.add_periodic_task(timedelta(seconds=45),
+                              Simulation.settle_low_time)
+    settled.run_event_driven(start, end)
+    saved = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    saved.run_event_driven(start, end, str(tmp_path / 'sim.ckpt'),
+                           timedelta(seconds=45))
+
+    for sim in (settled, saved):
+        assert sim.calculate_statistics() == expected.calculate_statistics()
+        for station_id, station in sim.all_stations.items():
+            assert station.stats == expected.all_stations[station_id].stats
+
+
+###############################################################################
+# Tests for the occupancy recorder
+###############################################################################
+def test_occupancy_recorder(tmp_path):
+    """The recording starts with every station's initial state, then has
+    one row per ride start and end, ending at each station's final state.
+    """
+    from recorder import OccupancyRecorder, read_occupancy
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    path = str(tmp_path / 'occupancy')
+    for run_mode in ['run', 'run_event_driven']:
+        sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+        initial = {station_id: station.num_bikes
+                   for station_id, station in sim.all_stations.items()}
+        sim.recorder = OccupancyRecorder(path, sim.all_stations, chunk_size=7)
+        getattr(sim, run_mode)(start, end)
+        recording = read_occupancy(path)
+
+        ids = recording['station_ids']
+        moves = sum(station.stats['ride_starts'] +
+                    station.stats['ride_finishes']
+                    for station in sim.all_stations.values())
+        assert len(recording['minute']) == len(ids) + moves
+        assert [initial[ids[i]] for i in recording['station'][:len(ids)]] \
+            == list(recording['num_bikes'][:len(ids)])
+
+        final = {}
+        for index, num_bikes in zip(recording['station'],
+                                    recording['num_bikes']):
+            final[ids[index]] = num_bikes
+        for station_id, station in sim.all_stations.items():
+            assert final[station_id] == station.num_bikes
+
+
+###############################################################################
+# Tests for the spatial index
+###############################################################################
+def test_station_grid_nearest():
+    """Grid queries agree with checking the distance to every station."""
+    from spatial import StationGrid, has_free_dock
+    stations = create_stations('stations.json')
+    grid = StationGrid(stations, cell_size=300)
+    for location in [(-73.57, 45.50), (-73.60, 45.55), (-73.80, 45.40)]:
+        for accept in [None, has_free_dock]:
+            candidates = [station for station in stations.values()
+                          if accept is None or accept(station)]
+            candidates.sort(key=lambda station: grid.distance(
+                location, station.location))
+            assert grid.nearest(location, 5, accept) == candidates[:5]
+            radius = grid.distance(location, candidates[9].location)
+            assert grid.within(location, radius, accept) == candidates[:10]
+
+
+def test_reroute_full_station():
+    """With rerouting, a ride ending at a full station ends at the nearest
+    station with a free dock instead.
+    """
+    start = datetime(2017, 6, 1, 9, 30, 0)
+    end = datetime(2017, 6, 1, 9, 45, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                     reroute=True)
+    full = sim.all_stations['6052']
+    full.num_bikes = full.capacity
+    nearest = sim.station_grid.nearest(full.location, 2)[1]
+    bikes = nearest.num_bikes
+
+    sim.run_event_driven(start, end)
+
+    assert full.stats['ride_finishes'] == 0
+    assert nearest.stats['ride_finishes'] == 1
+    assert nearest.num_bikes == bikes + 1
+    assert sim.num_rerouted == 1
+
+
+###############################################################################
+# Tests for streaming simulations
+###############################################################################
+def _station_state(sim: Simulation) -> dict:
+    """Return the number of bikes and statistics of each station in <sim>.
+    """
+    return {station_id: (station.num_bikes, dict(station.stats))
+            for station_id, station in sim.all_stations.items()}
+
+
+@pytest.mark.parametrize('use_cache', [False, True])
+@pytest.mark.parametrize('lookahead', [0, 20, 24 * 60])
+def test_stream_matches_loaded(tmp_path, use_cache, lookahead):
+    """Streaming rides gives the same results as loading them all."""
+    from datetime import timedelta
+    from benchmark import generate_rides
+    # The caches are written beside the files, so both are in tmp_path.
+    stations_file = str(tmp_path / 'stations.json')
+    shutil.copy('stations.json', stations_file)
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides(stations_file, rides_file, 3000, days=2)
+    start = datetime(2017, 6, 1, 9, 17, 0)
+    end = datetime(2017, 6, 2, 17, 0, 0)
+
+    loaded = Simulation(stations_file, rides_file, headless=True)
+    loaded.run_event_driven(start, end)
+    streamed = Simulation(stations_file, rides_file, headless=True,
+                          use_cache=use_cache, stream=True,
+                          lookahead=timedelta(minutes=lookahead))
+    streamed.run_event_driven(start, end)
+
+    assert streamed.all_rides == []
+    assert _station_state(streamed) == _station_state(loaded)
+    assert list(streamed.active_rides) != []
+    assert len(streamed.active_rides) == len(loaded.active_rides)
+
+
+@pytest.mark.parametrize('lookahead', [0, 60])
+def test_stream_rides_under_way(tmp_path, lookahead):
+    """Rides under way when the run starts end in time order, however long
+    ago they started.
+    """
+    from benchmark import generate_rides
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides('stations.json', rides_file, 2000, days=1,
+                   median_duration=90, duration_sigma=1.0)
+    with open(rides_file) as file:
+        lines = file.readlines()
+    lines[:0] = ['2017-06-01 07:00,6184,2017-06-01 09:30,6003,9000,1\n',
+                 '2017-06-01 08:01,6184,2017-06-01 09:10,6003,4140,1\n']
+    lines.sort(key=lambda line: parse_time(line.split(',')[0]))
+    with open(rides_file, 'w') as file:
+        file.writelines(lines)
+    start = datetime(2017, 6, 1, 9, 0, 0)
+    end = datetime(2017, 6, 1, 12, 0, 0)
+
+    loaded = Simulation('stations.json', rides_file, headless=True)
+    loaded.run_event_driven(start, end)
+    streamed = Simulation('stations.json', rides_file, headless=True,
+                          stream=True, lookahead=timedelta(minutes=lookahead))
+    streamed.run_event_driven(start, end)
+
+    assert _station_state(streamed) == _station_state(loaded)
+    assert loaded.all_stations['6003'].stats['low_availability'] > 0
+
+
+def test_stream_unsorted(tmp_path):
+    """A ride file that is not sorted by start time is rejected."""
+    rides_file = str(tmp_path / 'rides.csv')
+    with open('sample_rides.csv') as file:
+        lines = file.readlines()
+    with open(rides_file, 'w') as file:
+        file.writelines(reversed(lines))
+    sim = Simulation('stations.json', rides_file, headless=True, stream=True)
+    with pytest.raises(ValueError):
+        sim.run_event_driven(datetime(2017, 6, 1, 0, 0, 0),
+                             datetime(2017, 6, 2, 0, 0, 0))
+
+
+def test_stream_unsupported(tmp_path):
+    """Minute-stepped runs and checkpoints need all rides loaded."""
+    start = datetime(2017, 6, 1, 8, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True,
+                     stream=True)
+    with pytest.raises(ValueError):
+        sim.run(start, end)
+    with pytest.raises(ValueError):
+        sim.run_event_driven(start, end, str(tmp_path / 'checkpoint'))
+
+
+###############################################################################
+# Tests for sorting ride files
+###############################################################################
+def test_sort_rides(tmp_path, monkeypatch):
+    """Unsorted ride files are merged into one sorted file, dropping the
+    rows create_rides would ignore, and its cache matches the file.
+    """
+    import random
+    np = pytest.importorskip('numpy')
+    import sortrides
+    from benchmark import generate_rides
+    from ridecache import load_ride_columns, parse_ride_columns
+    generate_rides('stations.json', str(tmp_path / 'sorted.csv'), 2000,
+                   days=2)
+    with open(str(tmp_path / 'sorted.csv')) as file:
+        lines = file.readlines()
+    random.Random(0).shuffle(lines)
+    lines[10:10] = ['start_date,start_station_code,end_date\n', '\n',
+                    '2017-06-01 10:00,9999,2017-06-01 10:05,6134,300,1\n',
+                    '2017-06-01 10:00,6134,2017-06-01 10:00,6134,0,1\n']
+    inputs = [str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')]
+    for path, part in zip(inputs, [lines[:1200], lines[1200:]]):
+        with open(path, 'w') as file:
+            file.writelines(part)
+
+    # Force more runs than can be merged at once.
+    monkeypatch.setattr(sortrides, 'MERGE_FAN_IN', 4)
+    output = str(tmp_path / 'out.csv')
+    result = sortrides.sort_rides(inputs, create_stations('stations.json'),
+                                  output, write_cache=True, run_size=100)
+    assert result == (2004, 2000, 20)
+
+    stations = create_stations('stations.json')
+    rides = create_rides(output, stations)
+    assert len(rides) == 2000
+    starts = [ride.start_minute for ride in rides]
+    assert starts == sorted(starts)
+    assert sorted(starts) == sorted(ride.start_minute for ride in
+                                    create_rides(str(tmp_path / 'sorted.csv'),
+                                                 stations))
+
+    cached = load_ride_columns(output)
+    parsed = parse_ride_columns(output)
+    for name, column in parsed.items():
+        assert np.array_equal(cached[name], column)
+
+
+###############################################################################
+# Tests for the demand model
+###############################################################################
+def test_demand_model_fit_and_sample(tmp_path):
+    """A fitted model's rates match its rides, and sampling is sorted and
+    reproducible.
+    """
+    from benchmark import generate_rides
+    from demand import DemandModel
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides('stations.json', rides_file, 4000, days=4)
+    stations = create_stations('stations.json')
+    model = DemandModel.fit(rides_file, stations)
+
+    assert model.days == 4
+    assert sum(model.rate(hour) for hour in range(24)) * 60 * 4 == approx(
+        4000)
+
+    start = datetime(2017, 6, 5, 0, 0, 0)
+    end = datetime(2017, 6, 7, 0, 0, 0)
+    rides = list(model.sample_rides(stations, start, end, 'a'))
+    assert len(rides) == approx(2000, rel=0.1)
+    starts = [ride.start_minute for ride in rides]
+    assert starts == sorted(starts)
+    assert all(start <= ride.start_time < ride.end_time and
+               ride.start_time < end for ride in rides)
+    again = list(model.sample_rides(stations, start, end, 'a'))
+    assert [(ride.start, ride.end, ride.start_minute, ride.end_minute)
+            for ride in again] == [(ride.start, ride.end, ride.start_minute,
+                                    ride.end_minute) for ride in rides]
+
+
+def test_run_replicates(tmp_path):
+    """Replicates depend only on the seed, and are summarized per
+    statistic.
+    """
+    from benchmark import generate_rides
+    from demand import DemandModel, run_replicates, summarize
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides('stations.json', rides_file, 2000, days=2)
+    model = DemandModel.fit(rides_file, create_stations('stations.json'))
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 10, 0, 0)
+
+    results = run_replicates(model, 'stations.json', start, end, 4, seed=7,
+                             max_workers=2)
+    assert results == run_replicates(model, 'stations.json', start, end, 4,
+                                     seed=7, max_workers=1)
+    assert results != run_replicates(model, 'stations.json', start, end, 4,
+                                     seed=8, max_workers=2)
+
+    summary = summarize(results)
+    assert set(summary) == set(results[0])
+    for stat, result in summary.items():
+        values = [replicate[stat][1] for replicate in results]
+        assert result.low <= result.mean <= result.high
+        assert result.mean == approx(sum(values) / 4)
+        assert 0 < result.share <= 1
+
+
+###############################################################################
+# Tests for rebalancing
+###############################################################################
+def _rebalancing_simulation(num_trucks: int) -> Simulation:
+    """Return a simulation of the sample data with <num_trucks> trucks,
+    whose stations alternate between empty and full.
+    """
+    from rebalance import Rebalancer, Truck
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    stations = list(sim.all_stations.values())
+    for i, station in enumerate(stations):
+        station.num_bikes = 0 if i % 2 else station.capacity
+    sim.rebalancer = Rebalancer([Truck(stations[i * 7])
+                                 for i in range(num_trucks)])
+    return sim
+
+
+def test_rebalance_plan():
+    """Each idle truck is sent to the nearest station with bikes to spare,
+    for the stations that need bikes the most.
+    """
+    sim = _rebalancing_simulation(3)
+    events = sim.rebalancer.plan(sim, datetime(2017, 6, 1, 8, 0))
+    assert len(events) == 3
+    assert all(truck.busy for truck in sim.rebalancer.trucks)
+    assert sim.rebalancer.plan(sim, datetime(2017, 6, 1, 8, 0)) == []
+    for event in events:
+        assert sim.rebalancer.surplus(event.station) > 0
+        assert sim.rebalancer.surplus(event.target) < 0
+        assert event.station == sim.station_grid.nearest(
+            event.target.location, 1,
+            lambda station: sim.rebalancer.surplus(station) >= 3)[0]
+        assert 0 < event.num_bikes <= event.truck.capacity
+
+
+def test_rebalance_conserves_bikes():
+    """Trucks move bikes between stations without creating or losing any.
+    """
+    from rebalance import Rebalancer, Truck
+    stations = create_stations('stations.json')
+    for i, station in enumerate(stations.values()):
+        station.num_bikes = 0 if i % 3 else station.capacity
+    total = sum(station.num_bikes for station in stations.values())
+    sim = Simulation.from_data(stations, [])
+    sim.rebalancer = Rebalancer([Truck(station) for station in
+                                 list(stations.values())[:10]])
+    sim.run_event_driven(datetime(2017, 6, 1), datetime(2017, 6, 1, 12))
+
+    assert sim.rebalancer.bikes_moved > 0
+    assert (sum(station.num_bikes for station in stations.values()) +
+            sum(truck.load for truck in sim.rebalancer.trucks)) == total
+
+
+def test_rebalance_checkpoint_resume(tmp_path):
+    """Runs with trucks on the road can be checkpointed and resumed."""
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    path = str(tmp_path / 'sim.ckpt')
+    expected = _rebalancing_simulation(5)
+    expected.run_event_driven(start, end)
+
+    interrupted = _rebalancing_simulation(5)
+    interrupted.add_periodic_task(timedelta(minutes=15), _interrupt)
+    with pytest.raises(_Interrupted):
+        interrupted.run_event_driven(start, end, path, timedelta(minutes=20))
+
+    sim = _rebalancing_simulation(5)
+    sim.resume(path, end)
+    assert sim.calculate_statistics() == expected.calculate_statistics()
+    assert sim.rebalancer.bikes_moved > 0
+    for station_id, station in sim.all_stations.items():
+        assert station.num_bikes == expected.all_stations[station_id].num_bikes
+    for truck, other in zip(sim.rebalancer.trucks,
+                            expected.rebalancer.trucks):
+        assert truck.station.location == other.station.location
+        assert (truck.load, truck.busy) == (other.load, other.busy)
+
+    with pytest.raises(ValueError):
+        _rebalancing_simulation(4).resume(path, end)
+
+
+def test_rebalance_run_unsupported():
+    """Trucks are only simulated by event-driven runs."""
+    sim = _rebalancing_simulation(1)
+    with pytest.raises(ValueError):
+        sim.run(datetime(2017, 6, 1, 8, 0), datetime(2017, 6, 1, 8, 5))
+
+
+def test_rebalance_plan_many_trucks():
+    """With 40 trucks and stations to spare, every truck is sent out, each
+    to a different station in need.
+
+    The time this takes is measured by benchmark.run_benchmark.
+    """
+    sim = _rebalancing_simulation(40)
+    events = sim.rebalancer.plan(sim, datetime(2017, 6, 1, 8, 0))
+    assert len(events) == 40
+    assert all(truck.busy for truck in sim.rebalancer.trucks)
+    assert len({event.target for event in events}) == 40
+
+
+###############################################################################
+# Tests for what-if sweeps
+###############################################################################
+def test_whatif_matches_runs():
+    """Every scenario of a what-if sweep has the same results as a separate
+    event-driven run from the same initial state.
+    """
+    np = pytest.importorskip('numpy')
+    from whatif import fill_scenarios, run_whatif
+    start = datetime(2017, 6, 1, 7, 30, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    num_bikes = fill_scenarios(stations, [0.0, 0.1, 0.5, 1.0])
+    num_bikes[1, :10] = 0
+    result = run_whatif(stations, rides, start, end, num_bikes)
+    assert len(result) == 4
+
+    for scenario in range(4):
+        sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+        for station, bikes in zip(sim.all_stations.values(),
+                                  num_bikes[scenario]):
+            station.num_bikes = int(bikes)
+        sim.run_event_driven(start, end)
+        assert (result.scenario_statistics(scenario) ==
+                sim.calculate_statistics())
+        for column, station in enumerate(sim.all_stations.values()):
+            assert result.num_bikes[scenario, column] == station.num_bikes
+            for stat, value in station.stats.items():
+                assert result.stats[stat][scenario, column] == value
+
+    _, values = result.calculate_statistics()['max_start']
+    assert values[0] == 0
+    assert np.array_equal(values, result.stats['ride_starts'].max(axis=1))
+
+
+def test_whatif_invalid_scenario():
+    """Scenarios cannot give a station more bikes than it can hold."""
+    from whatif import fill_scenarios, run_whatif
+    stations = create_stations('stations.json')
+    num_bikes = fill_scenarios(stations, [1.0])
+    with pytest.raises(ValueError):
+        run_whatif(stations, [], datetime(2017, 6, 1, 7),
+                   datetime(2017, 6, 1, 8), num_bikes + 1)
+    result = run_whatif(stations, [], datetime(2017, 6, 1, 7),
+                        datetime(2017, 6, 1, 8), num_bikes + 1,
+                        num_bikes + 1)
+    assert (result.num_bikes == num_bikes + 1).all()
+
+
+###############################################################################
+# Tests for live feeds
+###############################################################################
+def test_live_feed_matches_run(tmp_path):
+    """Records that arrive out of order, but within the lateness, give the
+    same results as an event-driven run of the sorted rides.
+    """
+    import asyncio
+    import random
+    from benchmark import generate_rides
+    from livefeed import LiveFeed, consume_queue
+    from simulation import parse_minutes
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides('stations.json', rides_file, 3000, days=1)
+    start = datetime(2017, 6, 1, 6, 0)
+    end = datetime(2017, 6, 2, 4, 0)
+
+    stations = create_stations('stations.json')
+    expected = Simulation.from_data(stations, [
+        ride for ride in create_rides(rides_file, stations)
+        if ride.start_time >= start])
+    expected.run_event_driven(start, end)
+
+    # Delay each minute's records by up to 9 minutes, keeping the records
+    # of each minute in order.
+    with open(rides_file) as file:
+        records = file.readlines()
+    rng = random.Random(1)
+    delays = [rng.random() * 9 for _ in range(24 * 60)]
+
+    def arrival(record: str) -> float:
+        """Return when <record> arrives, in minutes."""
+        minute = parse_minutes(record.split(',')[0])
+        return minute + delays[minute % len(delays)]
+    records.sort(key=arrival)
+    records.append('not,a,ride\n')
+    records.append('2017-06-01 06:30,6184,2017-06-01 06:40,6184,600,1\n')
+
+    async def feed_records() -> LiveFeed:
+        """Feed the records through a queue, as they arrive."""
+        feed = LiveFeed(Simulation.from_data(create_stations('stations.json'),
+                                             []),
+                        start, timedelta(minutes=10))
+        queue = asyncio.Queue()
+        consumer = asyncio.create_task(consume_queue(feed, queue))
+        for record in records:
+            await queue.put(record)
+        await queue.put(None)
+        await consumer
+        return feed
+
+    feed = asyncio.run(feed_records())
+    assert feed.watermark < end
+    assert feed.statistics()[0] <= feed.watermark
+    feed.close(end)
+    assert feed.num_received == len(records)
+    assert feed.num_invalid == 1
+    late = sum(ride.start_time < start
+               for ride in create_rides(rides_file, stations)) + 1
+    assert feed.num_late == late
+    assert feed.statistics() == (end, expected.calculate_statistics())
+    for station_id, station in feed.simulation.all_stations.items():
+        assert station.stats == stations[station_id].stats
+        assert station.num_bikes == stations[station_id].num_bikes
+    with pytest.raises(ValueError):
+        LiveFeed(Simulation.from_data(create_stations('stations.json'), []),
+                 end).close(start)
+
+
+def test_live_feed_socket():
+    """Records sent to a feed's TCP server are ingested."""
+    import asyncio
+    from livefeed import LiveFeed, serve
+    with open('sample_rides.csv') as file:
+        records = file.read()
+    feed = LiveFeed(Simulation.from_data(create_stations('stations.json'),
+                                         []),
+                    datetime(2017, 6, 1, 7, 0), timedelta(minutes=5),
+                    timedelta(minutes=1))
+
+    async def received() -> None:
+        """Wait until the feed has received every record."""
+        while feed.num_received < records.count('\n'):
+            await asyncio.sleep(0.01)
+
+    async def send() -> None:
+        """Send the sample rides to the feed's server, and wait for them to
+        be received.
+        """
+        server = await serve(feed)
+        try:
+            port = server.sockets[0].getsockname()[1]
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection('127.0.0.1', port), 10)
+            writer.write(records.encode())
+            await asyncio.wait_for(writer.drain(), 10)
+            writer.close()
+            await asyncio.wait_for(received(), 10)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(send())
+    assert feed.statistics()[0] == feed.watermark
+    feed.close()
+    expected = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    expected.run_event_driven(datetime(2017, 6, 1, 7, 0), feed.watermark)
+    assert feed.statistics()[1] == expected.calculate_statistics()
+
+
+###############################################################################
+# Tests for the statistics server
+###############################################################################
+def _get_json(address: Tuple[str, int], path: str) -> Tuple[int, Any]:
+    """Return the status and JSON body of a GET request for <path> from the
+    server at <address>.
+    """
+    import http.client
+    import json
+    connection = http.client.HTTPConnection(*address, timeout=10)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        body = response.read()
+        return response.status, (json.loads(body) if response.status == 200
+                                 else None)
+    finally:
+        connection.close()
+
+
+def _latest_json(address: Tuple[str, int], path: str, time: str) -> Any:
+    """Return the JSON body of <path> from the server at <address>, once
+    its snapshot has been taken at the simulated <time>.
+    """
+    import time as clock
+    deadline = clock.monotonic() + 10
+    while True:
+        body = _get_json(address, path)[1]
+        if body['time'] == time or clock.monotonic() > deadline:
+            return body
+        clock.sleep(0.01)
+
+
+def test_stat_server():
+    """The server serves the statistics of each snapshot, as the simulation
+    takes them.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from statserver import StatServer
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    server = StatServer(sim, timedelta(minutes=15))
+    address = server.start()
+    seen = []
+
+    def check(sim: Simulation, time: datetime) -> None:
+        """Check the snapshot taken at <time> is being served."""
+        body = _latest_json(address, '/statistics',
+                            time.strftime(DATETIME_FORMAT))
+        seen.append(body['time'])
+        assert body['active_rides'] == len(sim.active_rides)
+        assert ({stat: tuple(value)
+                 for stat, value in body['statistics'].items()} ==
+                sim.calculate_statistics())
+
+    try:
+        assert _get_json(address, '/statistics')[1]['time'] is None
+        sim.add_periodic_task(timedelta(minutes=30), check)
+        sim.run_event_driven(datetime(2017, 6, 1, 7, 0),
+                             datetime(2017, 6, 1, 9, 0))
+        assert seen == ['2017-06-01 07:30', '2017-06-01 08:00',
+                        '2017-06-01 08:30', '2017-06-01 09:00']
+        assert server.snapshots > len(seen)
+
+        stations = _latest_json(address, '/stations', '2017-06-01 09:00')
+        assert len(stations['stations']) == len(sim.all_stations)
+        for station in stations['stations']:
+            assert (station['num_bikes'] ==
+                    sim.all_stations[station['id']].num_bikes)
+        assert _get_json(address, '/nothing')[0] == 404
+
+        with ThreadPoolExecutor(16) as executor:
+            statuses = list(executor.map(
+                lambda _: _get_json(address, '/statistics')[0], range(200)))
+        assert statuses == [200] * 200
+    finally:
+        server.stop()
+    assert server.address is None
+    assert [task.callback for task in sim._periodic_tasks] == [check]
+
+
+def test_stat_server_connections():
+    """Requests on one connection are answered in order, and the server
+    closes the connection when asked to, or after a bad request.
+    """
+    import re
+    import socket
+    from statserver import StatServer
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    server = StatServer(sim)
+    address = server.start()
+
+    def exchange(requests: bytes) -> bytes:
+        """Send <requests> on a new connection, and return everything
+        received until the server closes it.
+        """
+        with socket.create_connection(address, timeout=10) as sock:
+            sock.sendall(requests)
+            received = b''
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return received
+                received += data
+
+    try:
+        replies = exchange(b'GET /statistics HTTP/1.1\r\n\r\n'
+                           b'GET /nothing HTTP/1.1\r\n\r\n'
+                           b'GET /stations?x=1 HTTP/1.1\r\n'
+                           b'Connection: close\r\n\r\n'
+                           b'GET /statistics HTTP/1.1\r\n\r\n')
+        assert re.findall(rb'HTTP/1\.1 (\d+) ', replies) == [b'200', b'404',
+                                                           b'200']
+        assert b'"stations"' in replies
+        assert exchange(b'POST /statistics HTTP/1.1\r\n\r\n').startswith(
+            b'HTTP/1.1 400 ')
+        assert _get_json(address, '/statistics')[0] == 200
+    finally:
+        server.stop()
+
+
+###############################################################################
+# Tests for the benchmarks
+###############################################################################
+def test_generate_rides(tmp_path):
+    """Synthetic rides are valid, sorted, and the same for the same seed."""
+    from benchmark import generate_rides
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides('stations.json', rides_file, 500, days=2, seed=3)
+    stations = create_stations('stations.json')
+    rides = create_rides(rides_file, stations)
+
+    assert len(rides) == 500
+    assert [ride.start_time for ride in rides] == sorted(
+        ride.start_time for ride in rides)
+    assert all(datetime(2017, 6, 1) <= ride.start_time < ride.end_time <
+               datetime(2017, 6, 3, 3) for ride in rides)
+
+    with open(rides_file) as file:
+        first = file.read()
+    generate_rides('stations.json', rides_file, 500, days=2, seed=3)
+    with open(rides_file) as file:
+        assert file.read() == first
+
+
+def test_run_benchmark(tmp_path):
+    """Every phase is timed."""
+    from benchmark import generate_rides, run_benchmark
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides('stations.json', rides_file, 200, days=1)
+    timings = run_benchmark('stations.json', rides_file,
+                            datetime(2017, 6, 1), datetime(2017, 6, 2))
+
+    assert set(timings) == {'create_stations', 'create_rides',
+                            'initialize_queue', 'run', 'run_fast',
+                            'run_event_driven', 'calculate_statistics',
+                            'rebalance_plan'}
+    assert all(seconds >= 0 for seconds in timings.values())
+
+
+###############################################################################
+# Tests for the profiler
+###############################################################################
+def test_profiler_summary(tmp_path):
+    """Each phase is counted and timed, and profiling can be turned off."""
+    import json
+    start = datetime(2017, 6, 1, 8, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    profiler = sim.enable_profiling(trace=True)
+    sim.run(start, end)
+
+    summary = profiler.summary()
+    assert summary['phases']['update_active_rides']['calls'] == 60
+    assert summary['phases']['update_statistics']['calls'] == 60
+    assert summary['max_active_rides'] >= 1
+    assert summary['max_event_queue'] >= 1
+
+    trace_file = str(tmp_path / 'trace.json')
+    profiler.write_trace(trace_file)
+    with open(trace_file) as file:
+        events = json.load(file)['traceEvents']
+    assert len([event for event in events if event['ph'] == 'X']) == 120
+
+    sim.disable_profiling()
+    assert sim.profiler is None
+    assert 'update_statistics' not in vars(sim)
+    sim.run(start, end)
+    assert summary == profiler.summary()
+
+
+def test_profiler_event_driven():
+    """Every event processed by an event-driven run is counted."""
+    start = datetime(2017, 6, 1, 8, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', headless=True)
+    profiler = sim.enable_profiling()
+    sim.run_event_driven(start, end)
+
+    # Each ride starting in the run has a start event, and an end event if
+    # it ends before the run does.
+    num_events = 0
+    for ride in sim.all_rides:
+        if start <= ride.start_time < end:
+            num_events += 1 + (ride.end_time < end)
+        elif ride.start_time < start < ride.end_time < end:
+            num_events += 1
+    calls = profiler.summary()['phases']['process_event']['calls']
+    assert num_events > 0
+    assert calls == num_events
+
+
+###############################################################################
+# Tests for the ride index
+###############################################################################
+def test_index_rides():
+    """Each ride is indexed under both its start and end times."""
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    index = index_rides(rides)
+
+    assert index[datetime(2017, 6, 1, 7, 31, 0)] == [rides[0]]
+    assert index[datetime(2017, 6, 1, 7, 54, 0)] == [rides[0]]
+    assert sum(len(bucket) for bucket in index.values()) == 2 * len(rides)
+    for time, bucket in index.items():
+        for ride in bucket:
+            assert time in (ride.start_time, ride.end_time)
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['a1_test_sample.py'])
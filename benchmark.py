@@ -0,0 +1,272 @@
+"""Assignment 1 - Benchmarks
+
+=== Module Description ===
+
+This file contains a generator of synthetic ride files at Bixi scale, and
+a harness that times each phase of a simulation on them, so that the
+performance of different versions of the code can be compared.
+
+Synthetic rides use the real stations in stations.json. Start times follow
+a weekday demand curve with morning and evening peaks, durations follow a
+log-normal distribution, and most rides end at one of the stations nearest
+to where they start.
+
+Run this file to generate ride files of each requested size and benchmark
+them, for example:
+
+    python benchmark.py --sizes 10000 100000 1000000 --output results.json
+
+The results are JSON: a list with one object per ride count, holding the
+number of seconds each phase took, plus details of the run for comparing
+results across commits.
+"""
+import argparse
+import bisect
+from datetime import datetime, timedelta
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from bikeshare import minutes_to_time, time_to_minutes
+from rebalance import Rebalancer, Truck
+from simulation import Simulation, create_rides, create_stations
+from spatial import StationGrid
+
+# The first day synthetic rides can start on
+START = datetime(2017, 6, 1)
+# Default number of days synthetic rides are spread over
+DAYS = 30
+# Default ride counts to benchmark
+SIZES = (10000, 100000, 1000000)
+# Relative number of rides starting in each hour of the day
+HOURLY_DEMAND = (2, 1, 1, 1, 1, 3, 8, 20, 32, 18, 11, 12,
+                 15, 14, 13, 16, 24, 34, 25, 17, 12, 9, 6, 4)
+# Default median and log-space spread of ride durations, in minutes
+MEDIAN_DURATION = 12.0
+DURATION_SIGMA = 0.6
+# Longest synthetic ride, in minutes
+MAX_DURATION = 180
+# Chance that a ride ends near where it starts, and how many of the nearest
+# stations count as near
+LOCAL_SHARE = 0.7
+NEARBY_STATIONS = 30
+# Chance that a ride is taken by a member
+MEMBER_SHARE = 0.8
+# Number of trucks in the rebalancing plan benchmark
+REBALANCE_TRUCKS = 40
+
+
+def generate_rides(stations_file: str, rides_file: str, num_rides: int,
+                   start: datetime = START, days: int = DAYS,
+                   seed: int = 0, median_duration: float = MEDIAN_DURATION,
+                   duration_sigma: float = DURATION_SIGMA) -> None:
+    """Write <num_rides> synthetic rides between the stations in
+    <stations_file> to <rides_file>, in the format of sample_rides.csv.
+
+    Rides start during the <days> days from <start>, and are written in
+    order of start time. The same <seed> always gives the same rides.
+    """
+    rng = random.Random(seed)
+    stations = create_stations(stations_file)
+    station_ids = list(stations)
+    ids = {station: station_id for station_id, station in stations.items()}
+    grid = StationGrid(stations)
+    nearby = {station_id: [ids[other] for other in grid.nearest(
+        station.location, NEARBY_STATIONS + 1) if other is not station]
+              for station_id, station in stations.items()}
+
+    cumulative = []
+    total = 0
+    for demand in HOURLY_DEMAND:
+        total += demand
+        cumulative.append(total)
+    first_minute = time_to_minutes(start)
+    starts = []
+    for _ in range(num_rides):
+        hour = bisect.bisect_right(cumulative, rng.random() * total)
+        starts.append(first_minute + rng.randrange(days) * 1440 +
+                      hour * 60 + rng.randrange(60))
+    starts.sort()
+
+    mu = math.log(median_duration)
+    with open(rides_file, 'w') as file:
+        for start_minute in starts:
+            duration = min(max(round(rng.lognormvariate(mu, duration_sigma)),
+                               1), MAX_DURATION)
+            start_id = rng.choice(station_ids)
+            if rng.random() < LOCAL_SHARE:
+                end_id = rng.choice(nearby[start_id])
+            else:
+                end_id = rng.choice(station_ids)
+            file.write('{:%Y-%m-%d %H:%M},{},{:%Y-%m-%d %H:%M},{},{},{}\n'
+                       .format(minutes_to_time(start_minute), start_id,
+                               minutes_to_time(start_minute + duration),
+                               end_id, duration * 60,
+                               int(rng.random() < MEMBER_SHARE)))
+
+
+def run_benchmark(stations_file: str, rides_file: str, start: datetime,
+                  end: datetime) -> Dict[str, float]:
+    """Return the number of seconds each phase of simulating the rides in
+    <rides_file> from <start> to <end> takes.
+
+    Each way of running the simulation starts from freshly loaded stations
+    and rides, so that no run sees the state left by another.
+    """
+    timings = {}
+    stations = _timed(timings, 'create_stations', create_stations,
+                      stations_file)
+    rides = _timed(timings, 'create_rides', create_rides, rides_file,
+                   stations)
+    sim = Simulation.from_data(stations, rides)
+    _timed(timings, 'initialize_queue', sim.initialize_queue, start, end)
+    _timed(timings, 'run', _step, sim, start, end, sim._update_active_rides)
+    _timed(timings, 'calculate_statistics', sim.calculate_statistics)
+
+    sim = _fresh_simulation(stations_file, rides_file)
+    sim.initialize_queue(start, end)
+    _timed(timings, 'run_fast', _step, sim, start, end,
+           sim._update_active_rides_fast)
+
+    sim = _fresh_simulation(stations_file, rides_file)
+    _timed(timings, 'run_event_driven', sim.run_event_driven, start, end)
+
+    sim = _unbalanced_simulation(stations_file, REBALANCE_TRUCKS)
+    _timed(timings, 'rebalance_plan', sim.rebalancer.plan, sim, start)
+    return timings
+
+
+def run_benchmarks(stations_file: str, sizes: List[int], data_dir: str,
+                   days: int = DAYS, seed: int = 0) -> Dict[str, Any]:
+    """Return the results of benchmarking synthetic ride files of each of
+    the given <sizes>, generating any file not already in <data_dir>.
+
+    Each ride file is simulated over all <days> days it covers.
+    """
+    results = []
+    for size in sizes:
+        rides_file = os.path.join(data_dir, 'rides_{}_{}d_{}.csv'.format(
+            size, days, seed))
+        if not os.path.exists(rides_file):
+            generate_rides(stations_file, rides_file, size, days=days,
+                           seed=seed)
+        end = START + timedelta(days=days)
+        results.append({'rides': size,
+                        'seconds': run_benchmark(stations_file, rides_file,
+                                                 START, end)})
+    return {'commit': _commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'days': days,
+            'seed': seed,
+            'results': results}
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Generate ride files and benchmark them, as described by the command
+    line <args>, and write the results as JSON.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the simulation on synthetic rides.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='ride counts to benchmark')
+    parser.add_argument('--days', type=int, default=DAYS,
+                        help='number of days the rides are spread over')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for the generated rides')
+    parser.add_argument('--stations', default='stations.json',
+                        help='the stations file to use')
+    parser.add_argument('--data-dir', default=None,
+                        help='directory to keep generated ride files in '
+                             '(default: a temporary directory)')
+    parser.add_argument('--output', default=None,
+                        help='file to write the results to '
+                             '(default: standard output)')
+    options = parser.parse_args(args)
+
+    if options.data_dir is None:
+        with tempfile.TemporaryDirectory() as data_dir:
+            report = run_benchmarks(options.stations, options.sizes,
+                                    data_dir, options.days, options.seed)
+    else:
+        os.makedirs(options.data_dir, exist_ok=True)
+        report = run_benchmarks(options.stations, options.sizes,
+                                options.data_dir, options.days, options.seed)
+
+    if options.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(options.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+def _timed(timings: Dict[str, float], phase: str, function: Callable,
+           *args: Any) -> Any:
+    """Call <function> with <args>, record how many seconds it took in
+    <timings> under <phase>, and return its result.
+    """
+    phase_start = perf_counter()
+    result = function(*args)
+    timings[phase] = perf_counter() - phase_start
+    return result
+
+
+def _step(sim: Simulation, start: datetime, end: datetime,
+          update: Callable[[datetime], None]) -> None:
+    """Step <sim> one minute at a time from <start> to <end>, as
+    Simulation.run does, updating its active rides with <update>.
+    """
+    step = timedelta(minutes=1)
+    while start < end:
+        update(start)
+        sim.update_simulation(start)
+        start += step
+
+
+def _fresh_simulation(stations_file: str, rides_file: str) -> Simulation:
+    """Return a headless simulation of newly loaded stations and rides.
+    """
+    stations = create_stations(stations_file)
+    return Simulation.from_data(stations, create_rides(rides_file, stations))
+
+
+def _unbalanced_simulation(stations_file: str, num_trucks: int
+                           ) -> Simulation:
+    """Return a headless simulation of newly loaded stations, with no rides,
+    whose stations alternate between empty and full, and <num_trucks> idle
+    trucks spread over them.
+    """
+    stations = create_stations(stations_file)
+    for i, station in enumerate(stations.values()):
+        station.num_bikes = 0 if i % 2 else station.capacity
+    sim = Simulation.from_data(stations, [])
+    spread = list(stations.values())[::max(1, len(stations) // num_trucks)]
+    sim.rebalancer = Rebalancer([Truck(station)
+                                 for station in spread[:num_trucks]])
+    return sim
+
+
+def _commit() -> Optional[str]:
+    """Return the git commit of the code being benchmarked, or None if it
+    cannot be found.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    main()
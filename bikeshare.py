@@ -14,15 +14,26 @@ objects in this simulation.
 There is also an abstract Drawable class that is the superclass for both
 Station and Ride. It enables the simulation to visualize these objects in
 a graphical window.
+
+Stations and rides use __slots__, and rides store their times as whole
+minutes since EPOCH, so that millions of rides fit in memory.
 """
-from datetime import datetime
-from typing import Tuple
+from datetime import datetime, timedelta
+from typing import Any, Sequence, Tuple
 
 
 # Sprite files
 STATION_SPRITE = 'stationsprite.png'
 RIDE_SPRITE = 'bikesprite.png'
 
+# The statistics tracked for each station
+STAT_NAMES = ('ride_starts', 'ride_finishes', 'low_availability',
+              'low_unoccupied')
+
+# Ride times are stored as the number of whole minutes since this time
+EPOCH = datetime(1970, 1, 1)
+ONE_MINUTE = timedelta(minutes=1)
+
 
 class Drawable:
     """A base class for objects that the graphical renderer can be drawn.
@@ -31,6 +42,7 @@ class Drawable:
     sprite:
         The filename of the image to be drawn for this object.
     """
+    __slots__ = ('sprite',)
     sprite: str
 
     def __init__(self, sprite_file: str) -> None:
@@ -68,6 +80,7 @@ class Station(Drawable):
     - stats['low_unoccupied'] >= 0
 
     """
+    __slots__ = ('name', 'location', 'capacity', 'num_bikes', 'stats')
     name: str
     location: Tuple[float, float]
     capacity: int
@@ -85,10 +98,7 @@ class Station(Drawable):
         self.capacity = cap
         self.num_bikes = num_bikes
         self.name = name
-        self.stats = {'ride_starts': 0, 'ride_finishes': 0,
-                      'low_availability': 0,
-                      'low_unoccupied': 0
-                     }
+        self.stats = {stat: 0 for stat in STAT_NAMES}
 
     def get_position(self, time: datetime) -> Tuple[float, float]:
         """Return the (lat, long) position of this station for the given time.
@@ -108,32 +118,75 @@ class Ride(Drawable):
         the station where this ride starts
     end:
         the station where this ride ends
+    start_minute:
+        the time this ride starts, in whole minutes since EPOCH
+    end_minute:
+        the time this ride ends, in whole minutes since EPOCH
     start_time:
-        the time this ride starts
+        the time this ride starts, as a datetime
     end_time:
-        the time this ride ends
+        the time this ride ends, as a datetime
     speed:
         the amount of distance the ride travels in both x and y direactions
         to reach its destination at the correct time. can be both positive
-        or negative based on the direction of travel.
+        or negative based on the direction of travel. It is computed each
+        time it is needed, rather than stored in every ride.
     === Representation Invariants ===
     - start_time < end_time
     """
+    __slots__ = ('start', 'end', 'start_minute', 'end_minute')
     start: Station
     end: Station
-    start_time: datetime
-    end_time: datetime
-    speed: Tuple[float, float]
+    start_minute: int
+    end_minute: int
 
     def __init__(self, start: Station, end: Station,
                  times: Tuple[datetime, datetime]) -> None:
         """Initialize a ride object with the given start and end information.
+
+        Times are stored to the minute; any seconds are dropped.
         """
         super(Ride, self).__init__(RIDE_SPRITE)
         self.start, self.end = start, end
-        self.start_time, self.end_time = times[0], times[1]
-        self.speed = determine_speed(self.start, self.end, self.start_time,
-                                     self.end_time)
+        self.start_minute = time_to_minutes(times[0])
+        self.end_minute = time_to_minutes(times[1])
+
+    @classmethod
+    def from_minutes(cls, start: Station, end: Station, start_minute: int,
+                     end_minute: int) -> 'Ride':
+        """Return a ride between the given stations and times, given in
+        whole minutes since EPOCH.
+        """
+        ride = cls.__new__(cls)
+        ride.sprite = RIDE_SPRITE
+        ride.start, ride.end = start, end
+        ride.start_minute, ride.end_minute = start_minute, end_minute
+        return ride
+
+    @property
+    def start_time(self) -> datetime:
+        """The time this ride starts."""
+        return minutes_to_time(self.start_minute)
+
+    @start_time.setter
+    def start_time(self, time: datetime) -> None:
+        self.start_minute = time_to_minutes(time)
+
+    @property
+    def end_time(self) -> datetime:
+        """The time this ride ends."""
+        return minutes_to_time(self.end_minute)
+
+    @end_time.setter
+    def end_time(self, time: datetime) -> None:
+        self.end_minute = time_to_minutes(time)
+
+    @property
+    def speed(self) -> Tuple[float, float]:
+        """The distance this ride travels per minute, in (x, y) directions.
+        """
+        return determine_speed(self.start, self.end, self.start_time,
+                               self.end_time)
 
     def get_position(self, time: datetime):
         """Return the position of this ride for the given time.
@@ -141,16 +194,57 @@ class Ride(Drawable):
         A ride travels in a straight line between its start and end stations
         at a constant speed.
         """
-        diff = (time - self.start_time).total_seconds() // 60
-        move_x = self.speed[0] * diff
-        move_y = self.speed[1] * diff
-        init_position = self.start.get_position(datetime.now())
+        diff = time_to_minutes(time) - self.start_minute
+        speed = self.speed
+        move_x = speed[0] * diff
+        move_y = speed[1] * diff
+        init_position = self.start.location
 
         return (init_position[0] + move_x, init_position[1] + move_y)
 
 # Helper Functions
 
 
+def time_to_minutes(time: datetime) -> int:
+    """Return <time> as the number of whole minutes since EPOCH.
+
+    >>> time_to_minutes(datetime(1970, 1, 1, 1, 30, 59))
+    90
+    """
+    return (time - EPOCH) // ONE_MINUTE
+
+
+def minutes_to_time(minutes: int) -> datetime:
+    """Return the time <minutes> whole minutes after EPOCH.
+
+    >>> minutes_to_time(90)
+    datetime.datetime(1970, 1, 1, 1, 30)
+    """
+    return EPOCH + timedelta(minutes=minutes)
+
+
+def ride_positions(rides: Sequence[Ride], time: datetime) -> Any:
+    """Return the positions of <rides> at <time>, as a NumPy array with one
+    (long, lat) row per ride, in order.
+
+    Each row is equal to the ride's get_position(time), but the positions
+    are computed together instead of one ride at a time.
+    """
+    # Imported here so that NumPy is only needed when it is used.
+    import numpy as np
+    ends = np.array([(ride.start.location[0], ride.start.location[1],
+                      ride.end.location[0], ride.end.location[1])
+                     for ride in rides], dtype=float).reshape(-1, 4)
+    minutes = np.array([(ride.start_minute, ride.end_minute)
+                        for ride in rides], dtype=np.int64).reshape(-1, 2)
+    starts = ends[:, :2]
+    delta_time = minutes[:, 1] - minutes[:, 0]
+    delta_time[delta_time == 0] = 1  # delta time must never be 0.
+    speeds = (ends[:, 2:] - starts) / delta_time[:, np.newaxis]
+    diff = time_to_minutes(time) - minutes[:, 0]
+    return starts + speeds * diff[:, np.newaxis]
+
+
 def determine_speed(start: Station, end: Station, start_time: datetime,
                     end_time: datetime) -> Tuple[float, float]:
     """
@@ -180,10 +274,8 @@ def get_start_end_position_delta(start_station: 'Station',
     A helper function that returns a tuple containing the difference in position
     between <start_station> and <end_station>
     """
-    x1_distance = start_station.get_position(datetime.now())[0]
-    x2_distance = end_station.get_position(datetime.now())[0]
-    y1_distance = start_station.get_position(datetime.now())[1]
-    y2_distance = end_station.get_position(datetime.now())[1]
+    x1_distance, y1_distance = start_station.location
+    x2_distance, y2_distance = end_station.location
 
     return (x2_distance - x1_distance, y2_distance - y1_distance)
 
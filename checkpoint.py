@@ -0,0 +1,300 @@
+"""Assignment 1 - Simulation checkpoints
+
+=== Module Description ===
+
+This file contains functions that save the state of a running Simulation
+to a compact binary file, and restore it, so that a long event-driven run
+can be continued with Simulation.resume after it is interrupted.
+
+A checkpoint does not contain the stations or rides themselves, only their
+changing state: stations are identified by their position in all_stations
+and rides by their position in all_rides. It must therefore be restored
+into a simulation created from the same input files.
+
+=== File format ===
+
+The file starts with MAGIC, followed by the length of a JSON header as a
+4-byte little-endian unsigned integer, and the header itself. Besides the
+sizes of the sections below, the header holds the simulated time and the
+number of rides rerouted so far. The rest of the file is 8-byte signed
+integers, in the byte order named in the header:
+  - for each station, in order: num_bikes, capacity, and its statistics in
+    STAT_NAMES order
+  - the row in all_rides of each active ride
+  - for each truck of the simulation's rebalancer, if it has one: the
+    position in all_stations of its station, its load, and whether it is
+    busy
+  - for each pending event, in the order they would be processed:
+    EVENT_FIELDS integers, which are its kind (see EVENT_KINDS), its time
+    in minutes since bikeshare.EPOCH, and then, padded with zeros:
+      - for a ride event, the row in all_rides of its ride
+      - for a pickup event, the position of its truck in the rebalancer's
+        trucks, the positions in all_stations of its station and target,
+        and its number of bikes
+      - for a dropoff event, the position of its truck, and the position in
+        all_stations of its station
+"""
+from array import array
+from datetime import datetime
+import json
+import os
+import struct
+import sys
+from typing import Dict, List, Optional
+import zlib
+
+from bikeshare import (Ride, STAT_NAMES, Station, minutes_to_time,
+                       time_to_minutes)
+from container import HeapPriorityQueue
+from leaders import StatLeaders
+from rebalance import Truck
+from simulation import (Event, RebalanceDropoffEvent, RebalancePickupEvent,
+                        RebalancePlanEvent, RideEndEvent, RideStartEvent,
+                        Simulation)
+
+MAGIC = b'BIKECKPT'
+VERSION = 3
+# Codes identifying each kind of event in a checkpoint
+EVENT_KINDS = {RideStartEvent: 0, RideEndEvent: 1, RebalancePlanEvent: 2,
+               RebalancePickupEvent: 3, RebalanceDropoffEvent: 4}
+# Number of integers saved per station, per truck and per event
+STATION_FIELDS = 2 + len(STAT_NAMES)
+TRUCK_FIELDS = 3
+EVENT_FIELDS = 6
+
+
+def save_checkpoint(sim: Simulation, path: str, time: datetime,
+                    rides: Optional[Dict[Ride, int]] = None) -> None:
+    """Save the state of <sim> at the simulated time <time> to <path>.
+
+    <rides> maps each ride in sim.all_rides to its row, as ride_rows
+    returns. Building it looks at every ride, so a run that saves many
+    checkpoints should build it once and pass it to each of them; by
+    default it is built for this checkpoint alone.
+
+    The file is replaced atomically, so an interruption while saving leaves
+    the previous checkpoint intact.
+
+    Raise a ValueError if <sim> is a streaming simulation, or has a pending
+    event of a kind that cannot be saved.
+    """
+    if sim.is_streaming():
+        raise ValueError('a streaming simulation cannot be checkpointed')
+    # Credit low availability time up to now, so the statistics are complete
+    sim.settle_low_time(time)
+
+    stations = array('q')
+    for station in sim.all_stations.values():
+        stations.append(station.num_bikes)
+        stations.append(station.capacity)
+        for stat in STAT_NAMES:
+            stations.append(station.stats[stat])
+
+    if rides is None:
+        rides = ride_rows(sim)
+    active = array('q', [rides[ride] for ride in sim.active_rides])
+    rows = _Rows(sim, rides)
+    trucks = array('q')
+    for truck in rows.trucks:
+        trucks.extend([rows.stations[truck.station], truck.load,
+                       int(truck.busy)])
+    events = array('q')
+    for event in sim.event_queue.items():
+        events.extend(_encode_event(event, rows))
+
+    header = json.dumps({
+        'version': VERSION,
+        'byteorder': sys.byteorder,
+        'clock': time_to_minutes(time),
+        'stations': len(sim.all_stations),
+        'station_ids': _station_ids_crc(sim),
+        'rides': len(sim.all_rides),
+        'active': len(active),
+        'trucks': len(rows.trucks),
+        'events': len(events) // EVENT_FIELDS,
+        'rerouted': sim.num_rerouted
+    }).encode()
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<I', len(header)))
+        file.write(header)
+        stations.tofile(file)
+        active.tofile(file)
+        trucks.tofile(file)
+        events.tofile(file)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(sim: Simulation, path: str) -> datetime:
+    """Restore the state saved in <path> into <sim>, and return the
+    simulated time it was saved at.
+
+    Raise a ValueError if <sim> is a streaming simulation, or <path> is not
+    a checkpoint, or was saved from a simulation of different stations or
+    rides.
+    """
+    if sim.is_streaming():
+        raise ValueError('a streaming simulation cannot be checkpointed')
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a simulation checkpoint'.format(path))
+        header_size = struct.unpack('<I', file.read(4))[0]
+        header = json.loads(file.read(header_size).decode())
+        if header['version'] != VERSION:
+            raise ValueError('unsupported checkpoint version {}'.format(
+                header['version']))
+        rows = _Rows(sim, {})
+        if (header['stations'] != len(sim.all_stations) or
+                header['station_ids'] != _station_ids_crc(sim) or
+                header['rides'] != len(sim.all_rides) or
+                header['trucks'] != len(rows.trucks)):
+            raise ValueError('checkpoint {} was saved from a simulation of '
+                             'different stations, rides or trucks'.format(
+                                 path))
+        stations = _read_ints(file, header['stations'] * STATION_FIELDS,
+                              header['byteorder'])
+        active = _read_ints(file, header['active'], header['byteorder'])
+        trucks = _read_ints(file, header['trucks'] * TRUCK_FIELDS,
+                            header['byteorder'])
+        events = _read_ints(file, header['events'] * EVENT_FIELDS,
+                            header['byteorder'])
+
+    for i, station in enumerate(sim.all_stations.values()):
+        fields = stations[i * STATION_FIELDS:(i + 1) * STATION_FIELDS]
+        station.capacity = fields[1]
+        station.num_bikes = fields[0]
+        for stat, value in zip(STAT_NAMES, fields[2:]):
+            station.stats[stat] = value
+    if sim.leaders is not None:
+        sim.leaders = StatLeaders(sim.all_stations.values())
+
+    station_list = list(sim.all_stations.values())
+    for i, truck in enumerate(rows.trucks):
+        fields = trucks[i * TRUCK_FIELDS:(i + 1) * TRUCK_FIELDS]
+        truck.station = station_list[fields[0]]
+        truck.load = fields[1]
+        truck.busy = bool(fields[2])
+
+    sim.num_rerouted = header['rerouted']
+    rides = sim.all_rides
+    sim.active_rides = {rides[row]: None for row in active}
+    sim.event_queue = HeapPriorityQueue(
+        _decode_event(sim, rides, station_list, rows.trucks,
+                      events[i:i + EVENT_FIELDS])
+        for i in range(0, len(events), EVENT_FIELDS))
+    return minutes_to_time(header['clock'])
+
+
+def ride_rows(sim: Simulation) -> Dict[Ride, int]:
+    """Return a mapping of each ride in sim.all_rides to its row, for
+    save_checkpoint.
+    """
+    return {ride: row for row, ride in enumerate(sim.all_rides)}
+
+
+class _Rows:
+    """The positions that stand for objects of a simulation in a checkpoint.
+
+    === Attributes ===
+    rides:
+        maps each ride to its row in all_rides
+    stations:
+        maps each station to its position in all_stations
+    trucks:
+        the trucks of the simulation's rebalancer, in order; empty if it has
+        no rebalancer
+    truck_rows:
+        maps each truck to its position in trucks
+    """
+    rides: Dict[Ride, int]
+    stations: Dict[Station, int]
+    trucks: List[Truck]
+    truck_rows: Dict[Truck, int]
+
+    def __init__(self, sim: Simulation, rides: Dict[Ride, int]) -> None:
+        """Initialize the positions of the objects of <sim>, given the rows
+        of its <rides>.
+        """
+        self.rides = rides
+        self.stations = {station: row for row, station
+                         in enumerate(sim.all_stations.values())}
+        self.trucks = ([] if sim.rebalancer is None
+                       else list(sim.rebalancer.trucks))
+        self.truck_rows = {truck: row for row, truck in enumerate(self.trucks)}
+
+
+def _encode_event(event: Event, rows: _Rows) -> List[int]:
+    """Return the EVENT_FIELDS integers that describe <event>.
+
+    Raise a ValueError if <event> is of a kind that cannot be saved.
+    """
+    kind = EVENT_KINDS.get(type(event))
+    if kind is None:
+        raise ValueError('cannot checkpoint events of type {}'.format(
+            type(event).__name__))
+    fields = [kind, time_to_minutes(event.time)]
+    if isinstance(event, (RideStartEvent, RideEndEvent)):
+        fields.append(rows.rides[event.ride])
+    elif isinstance(event, RebalancePickupEvent):
+        fields.extend([rows.truck_rows[event.truck],
+                       rows.stations[event.station],
+                       rows.stations[event.target], event.num_bikes])
+    elif isinstance(event, RebalanceDropoffEvent):
+        fields.extend([rows.truck_rows[event.truck],
+                       rows.stations[event.station]])
+    return fields + [0] * (EVENT_FIELDS - len(fields))
+
+
+def _decode_event(sim: Simulation, rides: List[Ride],
+                  stations: List[Station], trucks: List[Truck],
+                  fields: array) -> Event:
+    """Return the event described by the saved <fields>.
+    """
+    kind, minute, first, second, third, fourth = fields
+    time = minutes_to_time(minute)
+    if kind == EVENT_KINDS[RideStartEvent]:
+        return RideStartEvent(sim, time, rides[first])
+    if kind == EVENT_KINDS[RideEndEvent]:
+        return RideEndEvent(sim, time, rides[first])
+    if kind == EVENT_KINDS[RebalancePlanEvent]:
+        return RebalancePlanEvent(sim, time)
+    if kind == EVENT_KINDS[RebalancePickupEvent]:
+        return RebalancePickupEvent(sim, time, trucks[first],
+                                    stations[second], stations[third],
+                                    fourth)
+    if kind == EVENT_KINDS[RebalanceDropoffEvent]:
+        return RebalanceDropoffEvent(sim, time, trucks[first],
+                                     stations[second])
+    raise ValueError('unknown event kind {} in checkpoint'.format(kind))
+
+
+def _read_ints(file, count: int, byteorder: str) -> array:
+    """Return the next <count> 8-byte integers in <file>, which are in the
+    given byte order.
+    """
+    values = array('q')
+    values.frombytes(file.read(count * values.itemsize))
+    if len(values) != count:
+        raise ValueError('checkpoint file is truncated')
+    if byteorder != sys.byteorder:
+        values.byteswap()
+    return values
+
+
+def _station_ids_crc(sim: Simulation) -> int:
+    """Return a checksum of the ids of the stations in <sim>, in order.
+    """
+    return zlib.crc32('\n'.join(sim.all_stations).encode())
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'array', 'datetime', 'json',
+            'os', 'struct', 'sys', 'zlib', 'bikeshare', 'container',
+            'leaders', 'rebalance', 'simulation'
+        ]
+    })
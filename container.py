@@ -12,11 +12,18 @@ This module contains the Container and PriorityQueue classes.
 
 Your only task here is to implement the add method for PriorityQueue,
 according to its docstring.
+
+HeapPriorityQueue provides the same interface backed by a binary heap, for
+queues too large for the linear-time PriorityQueue.add.
 """
-from typing import Generic, List, TypeVar
+import heapq
+from typing import Generic, Iterable, List, Optional, TypeVar
 
 # Ignore this line; it is only used to facilitate PyCharm's typechecking.
 T = TypeVar('T')
+# Sequence number of the first item added to a HeapPriorityQueue with
+# first=True; smaller than that of any item added without it
+FIRST_SEQ = -(1 << 62)
 
 
 class Container(Generic[T]):
@@ -119,12 +126,186 @@ class PriorityQueue(Container[T]):
         return not self._queue
 
 
+class _HeapEntry(Generic[T]):
+    """An item stored in a HeapPriorityQueue, tagged with its insertion order.
+
+    === Attributes ===
+    item:
+        the item stored in the queue
+    seq:
+        the number of items added to the queue before this one; used to break
+        ties between equal items in FIFO order
+    """
+    __slots__ = ('item', 'seq')
+    item: T
+    seq: int
+
+    def __init__(self, item: T, seq: int) -> None:
+        """Initialize a new heap entry."""
+        self.item = item
+        self.seq = seq
+
+    def __lt__(self, other: '_HeapEntry') -> bool:
+        """Return whether this entry should be removed before <other>.
+        """
+        if self.item < other.item:
+            return True
+        if other.item < self.item:
+            return False
+        return self.seq < other.seq
+
+
+class HeapPriorityQueue(Container[T]):
+    """A queue of items that operates in FIFO-priority order.
+
+    This has the same behaviour as PriorityQueue: the item with the smallest
+    priority (compared with '<') is removed first, and ties are resolved in
+    first-in-first-out (FIFO) order. Items are kept in a binary heap, so add
+    and remove take O(log n) time.
+
+    === Private Attributes ===
+    _heap:
+      The entries of this queue, arranged as a binary heap.
+    _count:
+      The number of items ever added to this queue without first=True.
+    _first_count:
+      FIRST_SEQ plus the number of items ever added with first=True.
+
+    === Representation Invariants ===
+    - all items in _heap are of the same type
+    - _heap satisfies the heap invariant used by the heapq module
+    - the seq attributes of the entries in _heap are distinct, and each is
+      either less than _first_count or between 0 and _count
+    - fewer than -FIRST_SEQ items are ever added with first=True
+    """
+    _heap: List[_HeapEntry]
+    _count: int
+    _first_count: int
+
+    def __init__(self, items: Optional[Iterable[T]] = None) -> None:
+        """Initialize this to a HeapPriorityQueue containing <items>.
+
+        <items> are added in iteration order, as if by add_many.
+        """
+        self._heap = []
+        self._count = 0
+        self._first_count = FIRST_SEQ
+        if items is not None:
+            self.add_many(items)
+
+    def add(self, item: T) -> None:
+        """Add <item> to this HeapPriorityQueue.
+        """
+        heapq.heappush(self._heap, _HeapEntry(item, self._count))
+        self._count += 1
+
+    def add_many(self, items: Iterable[T], first: bool = False) -> None:
+        """Add all of <items> to this HeapPriorityQueue, in iteration order.
+
+        If <first> is True, ties between these items and items that were
+        not added with first=True go to these items, as if they had been
+        added before all of them.
+
+        Takes O(min(n + k, k log(n + k))) time, where n is the size of the
+        queue and k is the number of items added.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add_many(['fred', 'arju', 'monalisa', 'hat'])
+        >>> pq.remove()
+        'arju'
+        """
+        count = self._first_count if first else self._count
+        entries = []
+        for item in items:
+            entries.append(_HeapEntry(item, count))
+            count += 1
+        if first:
+            self._first_count = count
+        else:
+            self._count = count
+        heap = self._heap
+        if len(entries) * max(len(heap).bit_length(), 1) < len(heap):
+            # Only a few items: sifting each one in beats rebuilding the heap.
+            for entry in entries:
+                heapq.heappush(heap, entry)
+        else:
+            heap.extend(entries)
+            heapq.heapify(heap)
+
+    def remove(self) -> T:
+        """Remove and return the next item from this HeapPriorityQueue.
+
+        Precondition: this priority queue is non-empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add('fred')
+        >>> pq.add('arju')
+        >>> pq.add('monalisa')
+        >>> pq.add('hat')
+        >>> pq.remove()
+        'arju'
+        >>> pq.remove()
+        'fred'
+        >>> pq.remove()
+        'hat'
+        >>> pq.remove()
+        'monalisa'
+        """
+        return heapq.heappop(self._heap).item
+
+    def peek(self) -> T:
+        """Return the next item that would be removed from this
+        HeapPriorityQueue, without removing it.
+
+        Precondition: this priority queue is non-empty.
+
+        >>> pq = HeapPriorityQueue(['fred', 'arju'])
+        >>> pq.peek()
+        'arju'
+        >>> pq.remove()
+        'arju'
+        """
+        return self._heap[0].item
+
+    def items(self) -> List[T]:
+        """Return the items in this HeapPriorityQueue, in the order they
+        would be removed, without removing them.
+
+        Adding the returned items, in order, to an empty HeapPriorityQueue
+        gives a queue that removes items in the same order as this one.
+
+        >>> pq = HeapPriorityQueue(['fred', 'arju', 'monalisa'])
+        >>> pq.items()
+        ['arju', 'fred', 'monalisa']
+        >>> len(pq)
+        3
+        """
+        return [entry.item for entry in sorted(self._heap)]
+
+    def __len__(self) -> int:
+        """Return the number of items in this HeapPriorityQueue.
+        """
+        return len(self._heap)
+
+    def is_empty(self) -> bool:
+        """Return True iff this HeapPriorityQueue is empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.is_empty()
+        True
+        >>> pq.add('fred')
+        >>> pq.is_empty()
+        False
+        """
+        return not self._heap
+
+
 if __name__ == '__main__':
     # import doctest
     # doctest.testmod()
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'doctest', 'python_ta', 'typing'
+            'doctest', 'python_ta', 'typing', 'heapq'
         ],
     })
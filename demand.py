@@ -0,0 +1,287 @@
+"""Assignment 1 - Stochastic ride demand
+
+=== Module Description ===
+
+This file contains the DemandModel class, which describes ride demand as a
+Poisson process for each pair of stations and each hour of the day, fitted
+from an existing ride file. Sampling the model gives new, random rides with
+the same average demand, which can be simulated instead of the recorded
+rides.
+
+Sampled rides are generated one at a time, in order of start time, and fed
+to a streaming Simulation (see Simulation.from_stream), so no replicate
+ever holds all of its rides in memory.
+
+run_replicates simulates many independent samples of the same model in
+parallel worker processes, and summarize reports a confidence interval for
+each of the statistics of calculate_statistics over those replicates.
+"""
+import bisect
+from datetime import datetime, timedelta
+from functools import partial
+import math
+import random
+import statistics
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from bikeshare import Ride, Station, time_to_minutes
+from simulation import (Simulation, STREAM_LOOKAHEAD, create_stations,
+                        iter_rides)
+from workers import map_shared, shared
+
+# Largest number of observed durations kept for each pair of stations
+DURATION_SAMPLES = 64
+# Default confidence level of the intervals reported by summarize
+CONFIDENCE = 0.95
+MINUTES_PER_DAY = 24 * 60
+
+
+class DemandModel:
+    """Ride demand between stations, by hour of the day.
+
+    In each hour of the day, rides from station a to station b start as a
+    Poisson process, at the average rate seen at that hour in the rides the
+    model was fitted to. Every day is treated alike. A sampled ride lasts as
+    long as a randomly chosen ride between the same stations in the fitted
+    data.
+
+    === Attributes ===
+    days:
+        the number of days the fitted rides span
+    pairs:
+        for each hour of the day, the (start id, end id) station pairs with
+        rides starting in that hour
+    cumulative:
+        for each hour of the day, the running totals of the rates, in rides
+        per minute, of the pairs in that hour
+    durations:
+        maps each (start id, end id) pair to a sample of the durations, in
+        minutes, of its rides
+
+    === Representation Invariants ===
+    - len(pairs) == len(cumulative) == 24
+    - len(pairs[hour]) == len(cumulative[hour]) for every hour
+    - every pair in pairs has a non-empty list of durations
+    """
+    days: int
+    pairs: List[List[Tuple[str, str]]]
+    cumulative: List[List[float]]
+    durations: Dict[Tuple[str, str], List[int]]
+
+    def __init__(self, counts: Dict[Tuple[int, str, str], int], days: int,
+                 durations: Dict[Tuple[str, str], List[int]]) -> None:
+        """Initialize a model of <counts> rides over <days> days.
+
+        <counts> maps each (hour, start id, end id) to the number of rides
+        between those stations that started in that hour of the day.
+        """
+        self.days = days
+        self.pairs = [[] for _ in range(24)]
+        self.cumulative = [[] for _ in range(24)]
+        self.durations = durations
+        for (hour, start_id, end_id), count in sorted(counts.items()):
+            total = self.cumulative[hour][-1] if self.pairs[hour] else 0.0
+            self.pairs[hour].append((start_id, end_id))
+            self.cumulative[hour].append(total + count / days / 60)
+
+    @classmethod
+    def fit(cls, rides_file: str, stations: Dict[str, Station]
+            ) -> 'DemandModel':
+        """Return the model of the rides between <stations> in the given
+        CSV file.
+
+        The rides are read one chunk at a time. Each ride is counted in the
+        hour it starts.
+        """
+        ids = {station: station_id
+               for station_id, station in stations.items()}
+        counts = {}
+        durations = {}
+        seen = {}
+        rng = random.Random(0)
+        first_day = last_day = None
+        for chunk in iter_rides(rides_file, stations):
+            for ride in chunk:
+                pair = (ids[ride.start], ids[ride.end])
+                hour = ride.start_minute // 60 % 24
+                key = (hour,) + pair
+                counts[key] = counts.get(key, 0) + 1
+
+                # Keep a uniform sample of each pair's durations.
+                duration = ride.end_minute - ride.start_minute
+                sample = durations.setdefault(pair, [])
+                seen[pair] = seen.get(pair, 0) + 1
+                if len(sample) < DURATION_SAMPLES:
+                    sample.append(duration)
+                else:
+                    slot = rng.randrange(seen[pair])
+                    if slot < DURATION_SAMPLES:
+                        sample[slot] = duration
+
+                day = ride.start_minute // MINUTES_PER_DAY
+                if first_day is None or day < first_day:
+                    first_day = day
+                if last_day is None or day > last_day:
+                    last_day = day
+        days = 1 if first_day is None else last_day - first_day + 1
+        return cls(counts, days, durations)
+
+    def rate(self, hour: int) -> float:
+        """Return the expected number of rides per minute in <hour> of the
+        day, over all pairs of stations.
+        """
+        cumulative = self.cumulative[hour]
+        return cumulative[-1] if cumulative else 0.0
+
+    def sample_rides(self, stations: Dict[str, Station], start: datetime,
+                     end: datetime, seed: str) -> Iterator[Ride]:
+        """Yield random rides between <stations> that start from <start> up
+        to <end>, in order of start time.
+
+        The same <seed> always gives the same rides. Rides only start at or
+        after <start>, so a run from <start> begins with no rides under way.
+        """
+        rng = random.Random(seed)
+        end_minute = time_to_minutes(end)
+        clock = float(time_to_minutes(start))
+        while clock < end_minute:
+            hour_start = math.floor(clock / 60) * 60
+            hour_end = min(hour_start + 60, end_minute)
+            hour = hour_start // 60 % 24
+            rate = self.rate(hour)
+            # Arrivals are memoryless, so the process can restart at each
+            # change of rate.
+            if rate > 0:
+                clock += rng.expovariate(rate)
+            if rate <= 0 or clock >= hour_end:
+                clock = hour_end
+                continue
+            cumulative = self.cumulative[hour]
+            index = bisect.bisect_right(cumulative, rng.random() * rate)
+            pair = self.pairs[hour][min(index, len(cumulative) - 1)]
+            start_minute = int(clock)
+            yield Ride.from_minutes(stations[pair[0]], stations[pair[1]],
+                                    start_minute,
+                                    start_minute +
+                                    rng.choice(self.durations[pair]))
+
+
+class StatSummary(NamedTuple):
+    """A statistic of calculate_statistics, over many replicates.
+
+    === Attributes ===
+    mean:
+        the mean value of the statistic
+    stdev:
+        the sample standard deviation of the value
+    low:
+        the lower end of the confidence interval for the mean
+    high:
+        the upper end of the confidence interval for the mean
+    station:
+        the station most often reported with the statistic
+    share:
+        the fraction of replicates that reported that station
+    """
+    mean: float
+    stdev: float
+    low: float
+    high: float
+    station: str
+    share: float
+
+
+class _Replicates(NamedTuple):
+    """The data shared by every replicate of a run_replicates call.
+
+    === Attributes ===
+    model:
+        the model rides are sampled from
+    station_file:
+        the stations file every run starts from
+    start:
+        the time every run starts
+    end:
+        the time every run ends
+    lookahead:
+        how far ahead of the next event each run reads rides
+    """
+    model: DemandModel
+    station_file: str
+    start: datetime
+    end: datetime
+    lookahead: timedelta
+
+
+def run_replicates(model: DemandModel, station_file: str, start: datetime,
+                   end: datetime, replicates: int, seed: int = 0,
+                   max_workers: Optional[int] = None,
+                   lookahead: timedelta = STREAM_LOOKAHEAD
+                   ) -> List[Dict[str, Tuple[str, float]]]:
+    """Return the result of calculate_statistics for each of <replicates>
+    runs from <start> to <end>, each with new rides sampled from <model>.
+
+    Every run starts from the stations in <station_file>. Replicate i uses
+    the seed '<seed>:<i>', so the results only depend on <seed>, not on
+    the number of worker processes. The runs are made in up to
+    <max_workers> processes (by default, one per CPU), and each reads
+    rides from its sample at most <lookahead> ahead of the next event.
+    Where workers are forked, they inherit the model instead of unpickling
+    it.
+    """
+    return map_shared(run_replicate,
+                      ['{}:{}'.format(seed, i) for i in range(replicates)],
+                      partial(_Replicates, model, station_file, start, end,
+                              lookahead),
+                      max_workers)
+
+
+def run_replicate(seed: str) -> Dict[str, Tuple[str, float]]:
+    """Return the statistics of one run of this process's shared model,
+    with rides sampled using <seed>.
+
+    Precondition: this is run by run_replicates.
+    """
+    model, station_file, start, end, lookahead = shared()
+    stations = create_stations(station_file)
+    sim = Simulation.from_stream(
+        stations, partial(model.sample_rides, stations, seed=seed),
+        lookahead=lookahead)
+    sim.run_event_driven(start, end)
+    return sim.calculate_statistics()
+
+
+def summarize(results: List[Dict[str, Tuple[str, float]]],
+              confidence: float = CONFIDENCE) -> Dict[str, StatSummary]:
+    """Return a summary of each statistic in <results>, the statistics of
+    several replicates.
+
+    The interval for the mean uses the normal approximation, which suits
+    the dozens of replicates these runs are usually made with.
+
+    Precondition: len(results) >= 2
+    """
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    summaries = {}
+    for stat in results[0]:
+        values = [result[stat][1] for result in results]
+        names = [result[stat][0] for result in results]
+        mean = statistics.mean(values)
+        stdev = statistics.stdev(values)
+        margin = z * stdev / math.sqrt(len(values))
+        station = max(sorted(set(names)), key=names.count)
+        summaries[stat] = StatSummary(mean, stdev, mean - margin,
+                                      mean + margin, station,
+                                      names.count(station) / len(names))
+    return summaries
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'bisect', 'datetime',
+            'functools', 'math', 'random', 'statistics', 'bikeshare',
+            'simulation', 'workers'
+        ]
+    })
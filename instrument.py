@@ -0,0 +1,183 @@
+"""Assignment 1 - Simulation profiler
+
+=== Module Description ===
+
+This file contains the Profiler class, which measures how long each phase
+of a simulation run takes, how often each phase runs, and how large the
+event queue and the set of active rides grow.
+
+A profiler is attached to a simulation with Simulation.enable_profiling.
+It works by wrapping the methods of that one simulation (and its
+visualizer) that carry out each phase, so a simulation without a profiler
+runs exactly the same code as before.
+
+The measurements can be read as a dictionary with summary, or written with
+write_trace as a Chrome trace (JSON) file, which can be opened in a
+timeline viewer such as chrome://tracing or https://ui.perfetto.dev.
+"""
+import json
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from simulation import Simulation
+
+# The methods of a Simulation that are measured, and the phase each one is
+# recorded as
+SIMULATION_PHASES = (('_update_active_rides', 'update_active_rides'),
+                     ('_update_active_rides_fast', 'update_active_rides_fast'),
+                     ('process_events', 'process_events'),
+                     ('_process_event', 'process_event'),
+                     ('update_statistics', 'update_statistics'))
+# The method of a Visualizer that is measured, and its phase
+RENDER_PHASE = ('render_drawables', 'render_drawables')
+
+
+class Profiler:
+    """Wall-clock times, call counts and high-water marks of a simulation.
+
+    === Attributes ===
+    seconds:
+        maps each phase to the total wall-clock time, in seconds, spent in
+        it. Time spent in a phase called from another phase counts towards
+        both.
+    calls:
+        maps each phase to the number of times it ran
+    max_event_queue:
+        the largest number of events seen in the event queue
+    max_active_rides:
+        the largest number of active rides seen
+    trace:
+        whether each call is kept for write_trace
+
+    === Private Attributes ===
+    _simulation:
+        the simulation this profiler is attached to, or None
+    _originals:
+        the (object, method name) pairs wrapped by this profiler
+    _origin:
+        the perf_counter time this profiler was attached
+    _spans:
+        if tracing, one (phase, start, duration, event queue size, number of
+        active rides) tuple per call, with times in seconds since _origin
+    """
+    seconds: Dict[str, float]
+    calls: Dict[str, int]
+    max_event_queue: int
+    max_active_rides: int
+    trace: bool
+    _simulation: Optional[Simulation]
+    _originals: List[Tuple[Any, str]]
+    _origin: float
+    _spans: List[Tuple[str, float, float, int, int]]
+
+    def __init__(self, trace: bool = False) -> None:
+        """Initialize a profiler that is not attached to any simulation.
+
+        If <trace> is True, every call is also kept, so that it can be
+        written with write_trace.
+        """
+        self.seconds = {}
+        self.calls = {}
+        self.max_event_queue = 0
+        self.max_active_rides = 0
+        self.trace = trace
+        self._simulation = None
+        self._originals = []
+        self._origin = perf_counter()
+        self._spans = []
+
+    def attach(self, simulation: Simulation) -> None:
+        """Start measuring the phases of <simulation>.
+
+        Precondition: this profiler is not attached to a simulation.
+        """
+        self._simulation = simulation
+        self._origin = perf_counter()
+        for method, phase in SIMULATION_PHASES:
+            self._wrap(simulation, method, phase)
+        if simulation.visualizer is not None:
+            self._wrap(simulation.visualizer, *RENDER_PHASE)
+
+    def detach(self) -> None:
+        """Stop measuring, and restore the methods of the simulation.
+
+        The measurements made so far are kept.
+        """
+        for target, method in self._originals:
+            delattr(target, method)
+        self._originals = []
+        self._simulation = None
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the measurements made so far.
+
+        The result maps 'phases' to a dictionary with the 'calls',
+        'seconds' and 'mean_seconds' of each phase that has run, and
+        'max_event_queue' and 'max_active_rides' to the high-water marks.
+        """
+        phases = {}
+        for phase, seconds in self.seconds.items():
+            calls = self.calls[phase]
+            if calls > 0:
+                phases[phase] = {'calls': calls, 'seconds': seconds,
+                                 'mean_seconds': seconds / calls}
+        return {'phases': phases,
+                'max_event_queue': self.max_event_queue,
+                'max_active_rides': self.max_active_rides}
+
+    def write_trace(self, path: str) -> None:
+        """Write every call made while tracing to <path>, as a Chrome trace.
+
+        Each call is a complete ('X') event, and the sizes of the event
+        queue and of the active rides after it are a counter ('C') event.
+        """
+        events = []
+        for phase, start, duration, queue_size, active in self._spans:
+            events.append({'name': phase, 'ph': 'X', 'pid': 1, 'tid': 1,
+                           'ts': start * 1e6, 'dur': duration * 1e6})
+            events.append({'name': 'sizes', 'ph': 'C', 'pid': 1, 'tid': 1,
+                           'ts': (start + duration) * 1e6,
+                           'args': {'event_queue': queue_size,
+                                    'active_rides': active}})
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+                      file)
+
+    def _wrap(self, target: Any, method: str, phase: str) -> None:
+        """Replace <method> of the object <target> with one that records
+        each call as <phase>.
+        """
+        function = getattr(target, method)
+        simulation = self._simulation
+        self.seconds.setdefault(phase, 0.0)
+        self.calls.setdefault(phase, 0)
+
+        def measured(*args: Any) -> Any:
+            """Call the wrapped method, and record the call."""
+            start = perf_counter()
+            result = function(*args)
+            duration = perf_counter() - start
+            self.seconds[phase] += duration
+            self.calls[phase] += 1
+            queue_size = len(simulation.event_queue)
+            active = len(simulation.active_rides)
+            if queue_size > self.max_event_queue:
+                self.max_event_queue = queue_size
+            if active > self.max_active_rides:
+                self.max_active_rides = active
+            if self.trace:
+                self._spans.append((phase, start - self._origin, duration,
+                                    queue_size, active))
+            return result
+
+        setattr(target, method, measured)
+        self._originals.append((target, method))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'json', 'time', 'simulation'
+        ]
+    })
@@ -0,0 +1,109 @@
+"""Assignment 1 - Statistic leaders
+
+=== Module Description ===
+
+This file contains the StatLeaders class, which keeps the stations ordered
+by each of their statistics as the simulation runs, so that the stations
+with the largest values can be found without looking at every station.
+"""
+import heapq
+from typing import Dict, Iterable, List, Tuple
+
+from bikeshare import Station, STAT_NAMES
+
+
+class StatLeaders:
+    """An index of stations ordered by each of their statistics.
+
+    For each statistic, stations are ordered from the largest value to the
+    smallest, and stations with equal values are ordered alphabetically by
+    name, as in Simulation.get_optimal_stat.
+
+    The index must be told, through update, about every change to a
+    station's statistics.
+
+    === Private Attributes ===
+    _stations:
+        the indexed stations; a station's position in this list is its row
+    _rows:
+        maps each indexed station to its row
+    _values:
+        maps each statistic to the value of that statistic for the station
+        in each row, as of the last update of that station
+    _heaps:
+        maps each statistic to a heap of (-value, name, row) entries. An
+        entry is current if value is _values[stat][row]; other entries are
+        left over from earlier values, and are dropped when they are found.
+
+    === Representation Invariants ===
+    - every row has exactly one current entry in each heap
+    - statistics never decrease, so a row has at most one entry per value
+    """
+    _stations: List[Station]
+    _rows: Dict[Station, int]
+    _values: Dict[str, List[int]]
+    _heaps: Dict[str, List[Tuple[int, str, int]]]
+
+    def __init__(self, stations: Iterable[Station]) -> None:
+        """Initialize an index of <stations> and their current statistics.
+        """
+        self._stations = list(stations)
+        self._rows = {station: row
+                      for row, station in enumerate(self._stations)}
+        self._values = {}
+        self._heaps = {}
+        for stat in STAT_NAMES:
+            self._values[stat] = [station.stats[stat]
+                                  for station in self._stations]
+            self._rebuild(stat)
+
+    def update(self, station: Station) -> None:
+        """Update the index after the statistics of <station> have changed.
+        """
+        row = self._rows[station]
+        for stat in STAT_NAMES:
+            value = station.stats[stat]
+            if value != self._values[stat][row]:
+                self._values[stat][row] = value
+                heap = self._heaps[stat]
+                heapq.heappush(heap, (-value, station.name, row))
+                if len(heap) > 2 * len(self._stations) + 16:
+                    self._rebuild(stat)
+
+    def top_k(self, stat: str, k: int) -> List[Tuple[str, int]]:
+        """Return the names and values of the <k> stations with the largest
+        values of <stat>, from largest to smallest.
+
+        Takes O(k log n) time, plus the time to drop any outdated entries
+        found along the way. The values are those of the stations' last
+        update; Simulation.top_k settles the low time statistics first.
+        """
+        heap = self._heaps[stat]
+        values = self._values[stat]
+        leaders = []
+        current = []
+        while heap and len(current) < k:
+            entry = heapq.heappop(heap)
+            if -entry[0] == values[entry[2]]:
+                current.append(entry)
+                leaders.append((entry[1], -entry[0]))
+        for entry in current:
+            heapq.heappush(heap, entry)
+        return leaders
+
+    def _rebuild(self, stat: str) -> None:
+        """Replace the heap for <stat> with one holding only current entries.
+        """
+        heap = [(-value, self._stations[row].name, row)
+                for row, value in enumerate(self._values[stat])]
+        heapq.heapify(heap)
+        self._heaps[stat] = heap
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'heapq', 'bikeshare'
+        ]
+    })
@@ -0,0 +1,270 @@
+"""Assignment 1 - Live trip feeds
+
+=== Module Description ===
+
+This file contains the LiveFeed class, which runs a simulation from trip
+records that arrive as it goes (for example, from a socket), instead of
+from a finished ride file.
+
+Each record is a line in the format of the ride CSV files. Records can
+arrive out of order, as long as none arrives more than the feed's lateness
+after a record that starts later. They are held in a reorder buffer until
+the watermark, the latest start time seen less the lateness, passes their
+start time. Nothing can arrive before the watermark any more, so the
+buffered rides before it are added to the event queue as RideStartEvents
+(which add their own RideEndEvents), and the simulation is advanced to the
+watermark. Records that arrive too late are dropped and counted.
+
+Every snapshot interval of simulated time, the statistics of the
+simulation up to the watermark are computed and kept as a snapshot.
+Readers (other coroutines, or other threads) get the latest snapshot
+without waiting for ingestion.
+
+The coroutines consume, consume_queue and serve feed records from an
+asyncio stream, an asyncio queue and a TCP server respectively.
+"""
+import asyncio
+import csv
+from datetime import datetime, timedelta
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+from bikeshare import Ride, Station, minutes_to_time, time_to_minutes
+from simulation import RideStartEvent, Simulation, parse_minutes
+
+# Default time by which a record may arrive after a record that starts later
+LATENESS = timedelta(minutes=15)
+# Default time between snapshots of the statistics
+SNAPSHOT_INTERVAL = timedelta(minutes=5)
+
+
+class LiveFeed:
+    """A simulation run that is fed trip records as they arrive.
+
+    === Attributes ===
+    simulation:
+        the simulation being run
+    lateness:
+        how long after a record that starts later a record may arrive
+    snapshot_interval:
+        the simulated time between snapshots of the statistics
+    watermark:
+        the time the simulation has been run up to. No ride that starts
+        before it is accepted any more.
+    num_received:
+        the number of records received
+    num_late:
+        the number of records dropped for arriving too late
+    num_invalid:
+        the number of records dropped for naming an unknown station, not
+        ending after they start, or not being a ride at all
+    snapshot:
+        the watermark when the statistics were last computed, and the
+        result of calculate_statistics at that time
+
+    === Private Attributes ===
+    _buffer:
+        the rides received but not yet added to the event queue, as a heap
+        of (start minute, arrival number, ride)
+    _latest:
+        the latest start time seen, in minutes since EPOCH
+    _closed:
+        whether the run has been finished
+    _next_snapshot:
+        the earliest watermark at which the next snapshot is taken
+
+    === Representation Invariants ===
+    - every ride in _buffer starts at or after watermark
+    """
+    simulation: Simulation
+    lateness: timedelta
+    snapshot_interval: timedelta
+    watermark: datetime
+    num_received: int
+    num_late: int
+    num_invalid: int
+    snapshot: Tuple[datetime, Dict[str, Tuple[str, float]]]
+    _buffer: List[Tuple[int, int, Ride]]
+    _latest: int
+    _closed: bool
+    _next_snapshot: datetime
+
+    def __init__(self, simulation: Simulation, start: datetime,
+                 lateness: timedelta = LATENESS,
+                 snapshot_interval: timedelta = SNAPSHOT_INTERVAL) -> None:
+        """Initialize a feed that runs <simulation> from <start>.
+
+        Rides are read from the feed only, so <simulation> should have no
+        rides of its own (see Simulation.from_data).
+        """
+        self.simulation = simulation
+        self.lateness = lateness
+        self.snapshot_interval = snapshot_interval
+        self.watermark = start
+        self.num_received = 0
+        self.num_late = 0
+        self.num_invalid = 0
+        self._buffer = []
+        self._latest = time_to_minutes(start)
+        self._closed = False
+        self._next_snapshot = start + snapshot_interval
+        simulation.begin_events(start)
+        self.snapshot = (start, simulation.calculate_statistics())
+
+    def add(self, record: str) -> None:
+        """Receive the trip <record>, a line in the format of the ride CSV
+        files, and advance the simulation as far as the watermark allows.
+
+        Precondition: the run has not been finished.
+        """
+        self.num_received += 1
+        ride = _parse_ride(record, self.simulation.all_stations)
+        if ride is None:
+            self.num_invalid += 1
+            return
+        if ride.start_time < self.watermark:
+            self.num_late += 1
+            return
+        heapq.heappush(self._buffer, (ride.start_minute, self.num_received,
+                                      ride))
+        if ride.start_minute > self._latest:
+            self._latest = ride.start_minute
+            self.advance(minutes_to_time(self._latest) - self.lateness)
+
+    def advance(self, time: datetime) -> None:
+        """Run the simulation up to <time>, treating every ride that starts
+        before it as received, and update the snapshot if it is due.
+
+        Records that start before <time> and arrive afterwards are dropped
+        as late. Nothing happens if <time> is not after the watermark.
+        """
+        if time <= self.watermark:
+            return
+        self._release(time)
+        self.simulation.process_until(time)
+        self.watermark = time
+        if time >= self._next_snapshot:
+            self.simulation.settle_low_time(time)
+            self.snapshot = (time, self.simulation.calculate_statistics())
+            self._next_snapshot = time + self.snapshot_interval
+
+    def statistics(self) -> Tuple[datetime, Dict[str, Tuple[str, float]]]:
+        """Return the time the simulation has been run up to, and its
+        statistics at that time.
+
+        This never waits for ingestion: it returns the latest snapshot, so
+        it can be up to snapshot_interval behind the watermark.
+        """
+        return self.snapshot
+
+    def close(self, end: Optional[datetime] = None) -> None:
+        """Finish the run at <end>, or at the latest start time received if
+        <end> is None, treating every buffered ride as received.
+
+        Raise a ValueError if <end> is before the watermark, since the
+        simulation has already been run past it.
+        """
+        if self._closed:
+            return
+        if end is None:
+            end = max(self.watermark, minutes_to_time(self._latest))
+        elif end < self.watermark:
+            raise ValueError('the feed has already been run up to {}'.format(
+                self.watermark))
+        self._release(end)
+        self._buffer = []
+        self._closed = True
+        try:
+            self.simulation.process_until(end)
+            self.simulation.finish_events(end)
+        finally:
+            self.simulation.reset_events()
+        self.watermark = end
+        self.snapshot = (self.watermark,
+                         self.simulation.calculate_statistics())
+
+    def _release(self, time: datetime) -> None:
+        """Add the start events of the buffered rides that start before
+        <time> to the event queue.
+
+        They go ahead of any events already queued for the same time, as
+        they would have if every ride had been loaded before the run, so a
+        feed gives the same results as run_event_driven on the same rides.
+        """
+        events = []
+        while self._buffer and minutes_to_time(self._buffer[0][0]) < time:
+            ride = heapq.heappop(self._buffer)[2]
+            events.append(RideStartEvent(self.simulation, ride.start_time,
+                                         ride))
+        self.simulation.event_queue.add_many(events, first=True)
+
+
+async def consume(feed: LiveFeed, reader: asyncio.StreamReader) -> None:
+    """Add each line read from <reader> to <feed>, until the end of the
+    stream.
+    """
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        feed.add(line.decode())
+
+
+async def consume_queue(feed: LiveFeed, queue: 'asyncio.Queue[str]'
+                        ) -> None:
+    """Add each record taken from <queue> to <feed>, until it gives None.
+    """
+    while True:
+        record = await queue.get()
+        try:
+            if record is None:
+                break
+            feed.add(record)
+        finally:
+            queue.task_done()
+
+
+async def serve(feed: LiveFeed, host: str = '127.0.0.1', port: int = 0
+                ) -> asyncio.AbstractServer:
+    """Return a started TCP server on <host> and <port> that adds each line
+    sent by its clients to <feed>.
+
+    Port 0 picks a free port; the server's sockets give the one chosen.
+    """
+    async def handle(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Consume the lines sent by one client."""
+        try:
+            await consume(feed, reader)
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+
+def _parse_ride(record: str, stations: Dict[str, Station]
+                ) -> Optional[Ride]:
+    """Return the ride described by the CSV line <record>, or None if it
+    would be ignored by create_rides or is not a ride.
+    """
+    try:
+        line = next(csv.reader([record]))
+        if line[1] not in stations or line[3] not in stations:
+            return None
+        start_minute = parse_minutes(line[0])
+        end_minute = parse_minutes(line[2])
+    except (IndexError, ValueError):
+        return None
+    if start_minute >= end_minute:
+        return None
+    return Ride.from_minutes(stations[line[1]], stations[line[3]],
+                             start_minute, end_minute)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'asyncio', 'csv', 'datetime',
+            'heapq', 'bikeshare', 'simulation'
+        ]
+    })
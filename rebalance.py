@@ -0,0 +1,196 @@
+"""Assignment 1 - Rebalancing trucks
+
+=== Module Description ===
+
+This file contains the Truck and Rebalancer classes, which model crews
+that drive bikes from stations with too many to stations with too few.
+
+A Rebalancer is attached to a simulation by setting its rebalancer
+attribute. Every interval of an event-driven run, a RebalancePlanEvent asks
+the rebalancer to dispatch its idle trucks. Each move is then simulated as a
+RebalancePickupEvent followed by a RebalanceDropoffEvent, with driving times
+derived from the distance between the stations.
+
+Planning looks at each station once: stations short of bikes are ordered in
+a heap by how many they need, and the nearest station with bikes to spare
+is found with the simulation's StationGrid, so no pairs of stations are
+compared.
+"""
+from datetime import datetime, timedelta
+import heapq
+import math
+from typing import Iterable, List, Optional, Set
+
+from bikeshare import Station
+from simulation import Event, RebalancePickupEvent, Simulation
+
+# Default number of bikes a truck can carry
+TRUCK_CAPACITY = 20
+# Default time between plans
+PLAN_INTERVAL = timedelta(minutes=30)
+# Default driving speed of a truck, in metres per minute
+TRUCK_SPEED = 300.0
+# Default share of a station's docks that should hold bikes
+TARGET_FILL = 0.5
+# Default smallest number of bikes worth moving
+MIN_MOVE = 3
+
+
+class Truck:
+    """A truck that moves bikes between stations.
+
+    === Attributes ===
+    capacity:
+        the number of bikes this truck can carry
+    station:
+        the station this truck is at, or last left
+    load:
+        the number of bikes on this truck
+    busy:
+        whether this truck is on its way to pick up or drop off bikes
+
+    === Representation Invariants ===
+    - 0 <= load <= capacity
+    """
+    capacity: int
+    station: Station
+    load: int
+    busy: bool
+
+    def __init__(self, station: Station,
+                 capacity: int = TRUCK_CAPACITY) -> None:
+        """Initialize an empty, idle truck at <station>.
+        """
+        self.capacity = capacity
+        self.station = station
+        self.load = 0
+        self.busy = False
+
+
+class Rebalancer:
+    """A fleet of trucks, and the plan for dispatching them.
+
+    At each plan, every station is given a target of TARGET_FILL of its
+    capacity. Stations that are short of their target by at least min_move
+    bikes are served from the one with the largest shortage down. Each is
+    sent bikes from the nearest station with at least min_move bikes over
+    its target, by the idle truck nearest to that station, until there are
+    no idle trucks or no spare bikes left.
+
+    === Attributes ===
+    trucks:
+        the trucks of this fleet
+    interval:
+        the time between plans
+    speed:
+        the driving speed of the trucks, in metres per minute
+    target_fill:
+        the share of each station's docks that should hold bikes
+    min_move:
+        the smallest number of bikes worth moving
+    hours:
+        the hours of the day in which the crews work, or None if they work
+        around the clock
+    moves:
+        the number of moves dispatched so far
+    bikes_moved:
+        the number of bikes delivered so far
+    """
+    trucks: List[Truck]
+    interval: timedelta
+    speed: float
+    target_fill: float
+    min_move: int
+    hours: Optional[Set[int]]
+    moves: int
+    bikes_moved: int
+
+    def __init__(self, trucks: List[Truck],
+                 interval: timedelta = PLAN_INTERVAL,
+                 speed: float = TRUCK_SPEED,
+                 target_fill: float = TARGET_FILL, min_move: int = MIN_MOVE,
+                 hours: Optional[Iterable[int]] = None) -> None:
+        """Initialize a rebalancer for <trucks>.
+        """
+        self.trucks = trucks
+        self.interval = interval
+        self.speed = speed
+        self.target_fill = target_fill
+        self.min_move = min_move
+        self.hours = None if hours is None else set(hours)
+        self.moves = 0
+        self.bikes_moved = 0
+
+    def travel_time(self, distance: float) -> timedelta:
+        """Return the time a truck takes to drive <distance> metres, in
+        whole minutes, and at least one minute.
+        """
+        return timedelta(minutes=max(1, math.ceil(distance / self.speed)))
+
+    def surplus(self, station: Station) -> int:
+        """Return how many bikes <station> has over its target; this is
+        negative if it has fewer.
+        """
+        return station.num_bikes - round(self.target_fill * station.capacity)
+
+    def plan(self, sim: Simulation, time: datetime) -> List[Event]:
+        """Dispatch the idle trucks at <time>, and return the pickup events
+        of their moves.
+        """
+        if self.hours is not None and time.hour not in self.hours:
+            return []
+        idle = [truck for truck in self.trucks if not truck.busy]
+        if not idle:
+            return []
+
+        spare = {}
+        needs = []
+        for index, station in enumerate(sim.all_stations.values()):
+            surplus = self.surplus(station)
+            if surplus >= self.min_move:
+                spare[station] = surplus
+            elif -surplus >= self.min_move:
+                needs.append((surplus, index, station))
+        heapq.heapify(needs)
+
+        def has_spare(station: Station) -> bool:
+            """Return whether <station> still has bikes to spare."""
+            return spare.get(station, 0) >= self.min_move
+
+        events = []
+        while idle and needs:
+            surplus, _, target = heapq.heappop(needs)
+            nearest = sim.station_grid.nearest(target.location, 1, has_spare)
+            if not nearest:
+                break
+            source = nearest[0]
+            truck = min(idle, key=lambda candidate: _distance(
+                sim, candidate.station, source))
+            idle.remove(truck)
+            num_bikes = min(spare[source], -surplus,
+                            truck.capacity - truck.load)
+            spare[source] -= num_bikes
+            truck.busy = True
+            self.moves += 1
+            events.append(RebalancePickupEvent(
+                sim, time + self.travel_time(_distance(sim, truck.station,
+                                                       source)),
+                truck, source, target, num_bikes))
+        return events
+
+
+def _distance(sim: Simulation, station1: Station, station2: Station
+              ) -> float:
+    """Return the distance in metres between two stations of <sim>.
+    """
+    return sim.station_grid.distance(station1.location, station2.location)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'datetime', 'heapq', 'math',
+            'bikeshare', 'simulation'
+        ]
+    })
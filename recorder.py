@@ -0,0 +1,162 @@
+"""Assignment 1 - Station occupancy recorder
+
+=== Module Description ===
+
+This file contains the OccupancyRecorder class, which records how the
+number of bikes at each station changes while a simulation runs, and
+read_occupancy, which reads a recording back.
+
+A recording is a directory holding one binary file per column plus a small
+JSON metadata file:
+  - minute.bin: the time of each change, in minutes since bikeshare.EPOCH,
+    as 8-byte signed integers
+  - station.bin: the index of the changed station in the station_ids list
+    of the metadata, as 4-byte signed integers
+  - num_bikes.bin: the number of bikes at the station after the change, as
+    4-byte signed integers
+  - meta.json: the station ids, the number of rows and the byte order
+
+Rows are buffered in fixed-size arrays and appended to the column files
+whenever the buffer fills, so memory use does not grow with the length of
+the run.
+"""
+from array import array
+from datetime import datetime
+import json
+import os
+import sys
+from typing import Dict, Iterable, List
+
+from bikeshare import Station, time_to_minutes
+
+# Default number of rows buffered in memory between writes
+CHUNK_SIZE = 1 << 16
+# The columns of a recording, with their array type codes
+COLUMNS = (('minute', 'q'), ('station', 'i'), ('num_bikes', 'i'))
+META_FILE = 'meta.json'
+
+
+class OccupancyRecorder:
+    """Records (minute, station index, num_bikes) rows for a set of stations.
+
+    === Attributes ===
+    path:
+        the directory the recording is written to
+    rows:
+        the number of rows recorded so far
+
+    === Private Attributes ===
+    _station_ids:
+        the id of each station, in index order
+    _indices:
+        maps each recorded station to its index
+    _buffers:
+        maps each column name to its preallocated buffer
+    _size:
+        the number of rows in the buffers that have not been written yet
+    """
+    path: str
+    rows: int
+    _station_ids: List[str]
+    _indices: Dict[Station, int]
+    _buffers: Dict[str, array]
+    _size: int
+
+    def __init__(self, path: str, stations: Dict[str, Station],
+                 chunk_size: int = CHUNK_SIZE) -> None:
+        """Initialize a recorder for <stations>, writing to the directory
+        <path>, and buffering at most <chunk_size> rows in memory.
+
+        Any earlier recording in <path> is replaced.
+        """
+        self.path = path
+        self.rows = 0
+        self._station_ids = list(stations)
+        self._indices = {station: index
+                         for index, station in enumerate(stations.values())}
+        self._buffers = {name: array(code, bytes(chunk_size *
+                                                 array(code).itemsize))
+                         for name, code in COLUMNS}
+        self._size = 0
+
+        os.makedirs(path, exist_ok=True)
+        for name, _ in COLUMNS:
+            open(self._column_path(name), 'wb').close()
+        self._write_meta()
+
+    def record(self, station: Station, time: datetime) -> None:
+        """Record the current number of bikes at <station> at <time>.
+        """
+        size = self._size
+        self._buffers['minute'][size] = time_to_minutes(time)
+        self._buffers['station'][size] = self._indices[station]
+        self._buffers['num_bikes'][size] = station.num_bikes
+        self._size = size + 1
+        self.rows += 1
+        if self._size == len(self._buffers['minute']):
+            self.flush()
+
+    def record_all(self, stations: Iterable[Station], time: datetime) -> None:
+        """Record the current number of bikes at each of <stations> at
+        <time>.
+        """
+        for station in stations:
+            self.record(station, time)
+
+    def flush(self) -> None:
+        """Write all buffered rows to the recording.
+        """
+        if self._size > 0:
+            for name, _ in COLUMNS:
+                with open(self._column_path(name), 'ab') as file:
+                    self._buffers[name][:self._size].tofile(file)
+            self._size = 0
+        self._write_meta()
+
+    def close(self) -> None:
+        """Write all buffered rows, finishing the recording.
+        """
+        self.flush()
+
+    def _column_path(self, name: str) -> str:
+        """Return the path of the file holding column <name>.
+        """
+        return os.path.join(self.path, name + '.bin')
+
+    def _write_meta(self) -> None:
+        """Write the metadata of the rows written so far.
+        """
+        with open(os.path.join(self.path, META_FILE), 'w') as file:
+            json.dump({'station_ids': self._station_ids,
+                       'rows': self.rows - self._size,
+                       'byteorder': sys.byteorder}, file)
+
+
+def read_occupancy(path: str) -> Dict[str, object]:
+    """Return the recording in the directory <path>.
+
+    The returned dictionary maps 'station_ids' to the list of station ids,
+    and each column name ('minute', 'station' and 'num_bikes') to an array
+    of that column's values.
+    """
+    with open(os.path.join(path, META_FILE)) as file:
+        meta = json.load(file)
+    result = {'station_ids': meta['station_ids']}
+    for name, code in COLUMNS:
+        values = array(code)
+        with open(os.path.join(path, name + '.bin'), 'rb') as file:
+            values.frombytes(file.read(meta['rows'] * values.itemsize))
+        if meta['byteorder'] != sys.byteorder:
+            values.byteswap()
+        result[name] = values
+    return result
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'array', 'datetime', 'json',
+            'os', 'sys', 'bikeshare'
+        ]
+    })
@@ -0,0 +1,271 @@
+"""Assignment 1 - Binary cache of parsed stations and rides
+
+=== Module Description ===
+
+This file contains functions that load stations and rides like
+create_stations and create_rides, but also save the parsed data as a
+directory of NumPy .npy files next to the source file. Later loads of the
+same, unchanged source file memory-map those arrays instead of parsing the
+JSON or CSV again.
+
+A cache is only used if the size and modification time of its source file
+match the ones recorded when it was written; otherwise it is rebuilt.
+"""
+import csv
+from datetime import datetime
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from bikeshare import Ride, Station, time_to_minutes
+from simulation import RIDE_CHUNK_SIZE, create_stations, parse_minutes
+
+# Suffix added to a source file's name to get its cache directory
+CACHE_SUFFIX = '.cache'
+# Version of the cache layout; caches of other versions are rebuilt
+CACHE_VERSION = 1
+# Name of the file recording which source a cache was built from
+META_FILE = 'meta.json'
+
+STATION_COLUMNS = ('ids', 'names', 'lon', 'lat', 'capacity', 'num_bikes')
+RIDE_COLUMNS = ('station_ids', 'start_index', 'start_minute', 'end_index',
+                'end_minute')
+
+
+def load_stations(stations_file: str) -> Dict[str, Station]:
+    """Return the stations described in the given JSON data file, as
+    create_stations does, using and updating its cache.
+    """
+    columns = read_columns(stations_file, STATION_COLUMNS)
+    if columns is None:
+        stations = create_stations(stations_file)
+        ids = list(stations)
+        columns = {
+            'ids': np.array(ids, dtype=str),
+            'names': np.array([stations[i].name for i in ids], dtype=str),
+            'lon': np.array([stations[i].location[0] for i in ids],
+                            dtype=np.float64),
+            'lat': np.array([stations[i].location[1] for i in ids],
+                            dtype=np.float64),
+            'capacity': np.array([stations[i].capacity for i in ids],
+                                 dtype=np.int64),
+            'num_bikes': np.array([stations[i].num_bikes for i in ids],
+                                  dtype=np.int64)
+        }
+        write_columns(stations_file, columns)
+        return stations
+
+    stations = {}
+    for station_id, name, lon, lat, capacity, num_bikes in zip(
+            columns['ids'].tolist(), columns['names'].tolist(),
+            columns['lon'].tolist(), columns['lat'].tolist(),
+            columns['capacity'].tolist(), columns['num_bikes'].tolist()):
+        stations[station_id] = Station((lon, lat), capacity, num_bikes, name)
+    return stations
+
+
+def load_rides(rides_file: str, stations: Dict[str, Station],
+               window: Optional[Tuple[datetime, datetime]] = None
+               ) -> List[Ride]:
+    """Return the rides described in the given CSV file, as create_rides
+    does, using and updating its cache.
+    """
+    columns = load_ride_columns(rides_file)
+    ride_stations = [stations.get(station_id)
+                     for station_id in columns['station_ids'].tolist()]
+
+    keep = ride_mask(columns, stations, window)
+    rides = []
+    for start, start_minute, end, end_minute in zip(
+            columns['start_index'][keep].tolist(),
+            columns['start_minute'][keep].tolist(),
+            columns['end_index'][keep].tolist(),
+            columns['end_minute'][keep].tolist()):
+        rides.append(Ride.from_minutes(ride_stations[start],
+                                       ride_stations[end],
+                                       start_minute, end_minute))
+    return rides
+
+
+def load_ride_chunks(rides_file: str, stations: Dict[str, Station],
+                     chunk_size: int = RIDE_CHUNK_SIZE,
+                     window: Optional[Tuple[datetime, datetime]] = None
+                     ) -> Iterator[List[Ride]]:
+    """Yield the rides described in the given CSV file, as
+    simulation.iter_rides does, using and updating its cache.
+
+    The cache is read <chunk_size> rows at a time, so only one chunk of
+    rides is in memory at a time.
+    """
+    columns = load_ride_columns(rides_file)
+    ride_stations = [stations.get(station_id)
+                     for station_id in columns['station_ids'].tolist()]
+    for first in range(0, len(columns['start_minute']), chunk_size):
+        chunk = {name: column[first:first + chunk_size]
+                 for name, column in columns.items()
+                 if name != 'station_ids'}
+        chunk['station_ids'] = columns['station_ids']
+        keep = ride_mask(chunk, stations, window)
+        rides = []
+        for start, start_minute, end, end_minute in zip(
+                chunk['start_index'][keep].tolist(),
+                chunk['start_minute'][keep].tolist(),
+                chunk['end_index'][keep].tolist(),
+                chunk['end_minute'][keep].tolist()):
+            rides.append(Ride.from_minutes(ride_stations[start],
+                                           ride_stations[end],
+                                           start_minute, end_minute))
+        if rides:
+            yield rides
+
+
+def load_ride_columns(rides_file: str) -> Dict[str, np.ndarray]:
+    """Return the columns of the cache of the given rides CSV file, building
+    the cache first if needed.
+
+    The returned dictionary maps each name in RIDE_COLUMNS to an array:
+    row i describes the i-th ride in the file whose start time is before
+    its end time. Its stations are station_ids[start_index[i]] and
+    station_ids[end_index[i]], and its times are start_minute[i] and
+    end_minute[i], in minutes since bikeshare.EPOCH.
+    """
+    columns = read_columns(rides_file, RIDE_COLUMNS)
+    if columns is None:
+        columns = parse_ride_columns(rides_file)
+        write_columns(rides_file, columns)
+    return columns
+
+
+def ride_mask(columns: Dict[str, np.ndarray], stations: Dict[str, Station],
+              window: Optional[Tuple[datetime, datetime]] = None
+              ) -> np.ndarray:
+    """Return a boolean array selecting the rows of the ride <columns> that
+    create_rides would keep for <stations> and <window>.
+    """
+    known = np.array([station_id in stations
+                      for station_id in columns['station_ids'].tolist()],
+                     dtype=bool)
+    if len(known) == 0:
+        return np.zeros(len(columns['start_minute']), dtype=bool)
+    keep = known[columns['start_index']] & known[columns['end_index']]
+    if window is not None:
+        start = columns['start_minute']
+        end = columns['end_minute']
+        sim_start = time_to_minutes(window[0])
+        sim_end = time_to_minutes(window[1])
+        # The same conditions as simulation.valid_ride_times
+        keep &= start <= sim_end
+        keep &= (start >= sim_start) | ((end > sim_start) & (end <= sim_end))
+    return keep
+
+
+def parse_ride_columns(rides_file: str) -> Dict[str, np.ndarray]:
+    """Return the columns described in load_ride_columns, parsed from the
+    given rides CSV file.
+    """
+    station_rows = {}
+    start_index, start_minute, end_index, end_minute = [], [], [], []
+    with open(rides_file) as file:
+        for line in csv.reader(file):
+            start = parse_minutes(line[0])
+            end = parse_minutes(line[2])
+            if start >= end:
+                continue
+            start_index.append(station_rows.setdefault(line[1],
+                                                       len(station_rows)))
+            end_index.append(station_rows.setdefault(line[3],
+                                                     len(station_rows)))
+            start_minute.append(start)
+            end_minute.append(end)
+
+    return {
+        'station_ids': np.array(list(station_rows), dtype=str),
+        'start_index': np.array(start_index, dtype=np.int32),
+        'start_minute': np.array(start_minute, dtype=np.int64),
+        'end_index': np.array(end_index, dtype=np.int32),
+        'end_minute': np.array(end_minute, dtype=np.int64)
+    }
+
+
+def cache_dir(source_file: str) -> str:
+    """Return the path of the cache directory for <source_file>.
+    """
+    return source_file + CACHE_SUFFIX
+
+
+def read_columns(source_file: str, names: Tuple[str, ...]
+                 ) -> Optional[Dict[str, np.ndarray]]:
+    """Return the memory-mapped columns <names> of the cache of
+    <source_file>, or None if there is no up-to-date cache.
+    """
+    directory = cache_dir(source_file)
+    try:
+        with open(os.path.join(directory, META_FILE)) as file:
+            meta = json.load(file)
+        if meta != _source_meta(source_file):
+            return None
+        return {name: np.load(os.path.join(directory, name + '.npy'),
+                              mmap_mode='r')
+                for name in names}
+    except (OSError, ValueError):
+        return None
+
+
+def write_columns(source_file: str, columns: Dict[str, np.ndarray]) -> None:
+    """Save <columns> as the cache of <source_file>.
+
+    Each file is written beside the cache first, and then moved into it
+    with os.replace. Other processes that have memory-mapped the old files
+    keep reading those, and never see a partly written column. The
+    metadata file is removed first and moved in last, so no one uses the
+    cache while it is being replaced, and an interrupted write leaves no
+    usable cache behind. If the cache cannot be written, nothing happens.
+    """
+    directory = cache_dir(source_file)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=os.path.basename(directory),
+                                    dir=os.path.dirname(directory) or '.')
+    except OSError:
+        return
+    try:
+        for name, column in columns.items():
+            np.save(os.path.join(temp_dir, name + '.npy'), column)
+        with open(os.path.join(temp_dir, META_FILE), 'w') as file:
+            json.dump(_source_meta(source_file), file)
+
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name in columns:
+            os.replace(os.path.join(temp_dir, name + '.npy'),
+                       os.path.join(directory, name + '.npy'))
+        os.replace(os.path.join(temp_dir, META_FILE), meta_path)
+    except OSError:
+        pass
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _source_meta(source_file: str) -> Dict[str, int]:
+    """Return the metadata identifying the current contents of
+    <source_file>.
+    """
+    info = os.stat(source_file)
+    return {'version': CACHE_VERSION, 'size': info.st_size,
+            'mtime_ns': info.st_mtime_ns}
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'csv', 'json', 'os', 'shutil',
+            'tempfile', 'datetime', 'numpy', 'bikeshare', 'simulation'
+        ],
+        'generated-members': 'numpy.*'
+    })
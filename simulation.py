@@ -16,15 +16,39 @@ can use to try running the simulation at any time.
 """
 import csv
 from datetime import datetime, timedelta
+from functools import lru_cache, partial
+import heapq
 import json
-from typing import Dict, List, Tuple
-
-from bikeshare import Ride, Station
-from container import PriorityQueue
-from visualizer import Visualizer
+from typing import (TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List,
+                    Optional, Tuple, Union)
+
+from bikeshare import Ride, Station, minutes_to_time, time_to_minutes
+from container import HeapPriorityQueue
+from leaders import StatLeaders
+from spatial import StationGrid, has_free_dock
+
+if TYPE_CHECKING:
+    # Only for annotations: these modules are imported when they are used,
+    # and some of them import this module.
+    from instrument import Profiler
+    from rebalance import Rebalancer
+    from recorder import OccupancyRecorder
+    from station_store import StationStore
+    from visualizer import Visualizer
 
 # Datetime format to parse the ride data
 DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+# A station with at most this many bikes (or free docks) is running low
+LOW_THRESHOLD = 5
+# Number of parsed timestamp strings remembered by parse_time
+TIME_CACHE_SIZE = 1 << 16
+# Number of rides yielded at a time by iter_rides
+RIDE_CHUNK_SIZE = 10000
+# Default time between checkpoints of an event-driven run
+CHECKPOINT_INTERVAL = timedelta(days=1)
+# Default time ahead of the next event that a streaming simulation reads
+# rides up to
+STREAM_LOOKAHEAD = timedelta(hours=1)
 
 
 class Simulation:
@@ -38,77 +62,639 @@ class Simulation:
     all_stations:
         A dictionary containing all the stations in this simulation.
     visualizer:
-        A helper class for visualizing the simulation.
+        A helper class for visualizing the simulation, or None if this
+        simulation is headless.
     active_rides:
-        A list of all active rides in the simulation meaning rides that have
-        started and are inprogress. Rides are added and removed from the list
-        as they various rides start and end.
+        All active rides in the simulation meaning rides that have
+        started and are inprogress. Rides are added and removed as they
+        various rides start and end. This is a dictionary used as an
+        insertion-ordered set: each key is an active ride, and each value
+        is None.
     event_queue:
         Is a priority queue which stores ride events based off the times the
         events are initiated. Events are added and removed as new events in
         the simulation occur.
+    station_store:
+        If this simulation is columnar, the StationStore holding the state
+        of all_stations, whose values are StationViews of it. None otherwise.
+    leaders:
+        If this simulation tracks leaders, an index of all_stations ordered
+        by each statistic, kept up to date as the simulation runs. None
+        otherwise.
+    station_grid:
+        A spatial index of all_stations, for finding nearby stations.
+    reroute:
+        Whether a ride that ends at a full station is sent on to the nearest
+        station with a free dock, instead of not being counted.
+    num_rerouted:
+        The number of rides that have been sent on to another station.
+    recorder:
+        If set, an OccupancyRecorder that records every change to the number
+        of bikes at a station, starting with every station's state when a
+        run starts. None by default.
+    profiler:
+        If set, the Profiler measuring the phases of this simulation; see
+        enable_profiling. None by default.
+    lookahead:
+        How far ahead of the next event a streaming simulation reads rides.
+    rebalancer:
+        If set, a Rebalancer whose trucks move bikes between stations during
+        event-driven runs. None by default.
 
     """
     all_stations: Dict[str, Station]
     all_rides: List[Ride]
-    visualizer: Visualizer
-    active_rides: List[Ride]
-    event_queue: PriorityQueue
-
-    def __init__(self, station_file: str, ride_file: str) -> None:
+    visualizer: Optional['Visualizer']
+    active_rides: Dict[Ride, None]
+    event_queue: HeapPriorityQueue
+    station_store: Optional['StationStore']
+    leaders: Optional[StatLeaders]
+    station_grid: StationGrid
+    reroute: bool
+    num_rerouted: int
+    recorder: Optional['OccupancyRecorder']
+    profiler: Optional['Profiler']
+    lookahead: timedelta
+    rebalancer: Optional['Rebalancer']
+    # === Private attributes ===
+    # _rides_by_minute:
+    #   Maps each time to the rides in all_rides that start or end at that
+    #   time, in the order they appear in all_rides. None until
+    #   _update_active_rides first needs it.
+    # _low_since:
+    #   While run_event_driven is running, maps each station to the time its
+    #   current state began, and whether that state is low availability and
+    #   low unoccupied. None otherwise.
+    # _clock:
+    #   While run_event_driven is running, the simulated time it has reached:
+    #   the time of the event or periodic task being processed. None
+    #   otherwise.
+    # _periodic_tasks:
+    #   The tasks to run at regular intervals of simulated time while this
+    #   simulation runs.
+    # _ride_source:
+    #   For a streaming simulation, a function that takes the start and end
+    #   of a run and returns the rides it may use, sorted by start time.
+    #   None if all rides are in all_rides.
+    # _ride_stream:
+    #   While a streaming simulation runs, the rides from _ride_source that
+    #   have not been read yet. None otherwise.
+    # _next_ride:
+    #   While a streaming simulation runs, the next ride in _ride_stream,
+    #   already read but not yet added to event_queue, or None if there is
+    #   none.
+    # _stream_window:
+    #   The start and end of the current run of a streaming simulation, in
+    #   minutes since bikeshare.EPOCH.
+    _low_since: Optional[Dict[Station, Tuple[datetime, bool, bool]]]
+    _clock: Optional[datetime]
+    _rides_by_minute: Optional[Dict[datetime, List[Ride]]]
+    _periodic_tasks: List['_PeriodicTask']
+    _ride_source: Optional[Callable[[datetime, datetime], Iterable[Ride]]]
+    _ride_stream: Optional[Iterator[Ride]]
+    _next_ride: Optional[Ride]
+    _stream_window: Tuple[int, int]
+
+    def __init__(self, station_file: str, ride_file: str,
+                 headless: bool = False, columnar: bool = False,
+                 window: Optional[Tuple[datetime, datetime]] = None,
+                 use_cache: bool = False,
+                 track_leaders: bool = False, reroute: bool = False,
+                 stream: bool = False,
+                 lookahead: timedelta = STREAM_LOOKAHEAD) -> None:
         """Initialize this simulation with the given configuration settings.
+
+        If <headless> is True, nothing is rendered and pygame is never
+        imported.
+
+        If <columnar> is True, station state is kept in a NumPy-backed
+        StationStore, which makes the per-minute statistics updates and
+        calculate_statistics faster for large numbers of stations.
+
+        If <window> is a (start, end) pair, only the rides that a run from
+        start to end would use are loaded.
+
+        If <use_cache> is True, the stations and rides are loaded through
+        binary caches kept next to the input files (see ridecache), which
+        are much faster to read than the original files.
+
+        If <track_leaders> is True, the stations with the largest value of
+        each statistic can be found at any time with top_k, without looking
+        at every station.
+
+        If <reroute> is True, a ride that ends at a full station is sent on
+        to the nearest station with a free dock.
+
+        If <stream> is True, rides are not loaded up front: each run reads
+        them from <ride_file> as the clock reaches them, at most <lookahead>
+        ahead of the next event, and forgets them once they end. The ride
+        file must then be sorted by start time, <window> is ignored, and
+        only run_event_driven can be used.
         """
-        self.visualizer = Visualizer()
-        self.all_stations = create_stations(station_file)
-        self.all_rides = create_rides(ride_file, self.all_stations)
-        self.active_rides = []
-        self.event_queue = PriorityQueue()
+        if use_cache:
+            # Imported here so that NumPy is only needed when it is used.
+            from ridecache import load_stations, load_rides
+            stations = load_stations(station_file)
+        else:
+            stations = create_stations(station_file)
+        station_store = None
+        if columnar:
+            # Imported here so that NumPy is only needed when it is used.
+            from station_store import StationStore
+            station_store = StationStore(stations)
+            stations = station_store.views()
+        if stream:
+            rides = []
+        elif use_cache:
+            rides = load_rides(ride_file, stations, window)
+        else:
+            rides = create_rides(ride_file, stations, window)
+        self._setup(stations, rides, headless, station_store, track_leaders)
+        self.reroute = reroute
+        if stream:
+            self._ride_source = partial(stream_rides, ride_file, stations,
+                                        use_cache=use_cache)
+            self.lookahead = lookahead
+
+    @classmethod
+    def from_data(cls, stations: Dict[str, Station], rides: List[Ride],
+                  headless: bool = True,
+                  station_store: Optional['StationStore'] = None,
+                  track_leaders: bool = False,
+                  reroute: bool = False) -> 'Simulation':
+        """Return a new simulation of already loaded <stations> and <rides>.
+
+        The simulation changes the state of <stations> as it runs. If the
+        stations are StationViews, <station_store> must be their store.
+        """
+        sim = cls.__new__(cls)
+        sim._setup(stations, rides, headless, station_store, track_leaders)
+        sim.reroute = reroute
+        return sim
+
+    @classmethod
+    def from_stream(cls, stations: Dict[str, Station],
+                    source: Callable[[datetime, datetime], Iterable[Ride]],
+                    headless: bool = True,
+                    lookahead: timedelta = STREAM_LOOKAHEAD,
+                    station_store: Optional['StationStore'] = None
+                    ) -> 'Simulation':
+        """Return a new streaming simulation of <stations>, whose rides come
+        from <source>.
+
+        For each run, <source> is called with the start and end of the run,
+        and must return the rides between <stations> that the run may use,
+        sorted by start time. Rides are read from it at most <lookahead>
+        ahead of the next event. Only run_event_driven can be used.
+        """
+        sim = cls.__new__(cls)
+        sim._setup(stations, [], headless, station_store, False)
+        sim._ride_source = source
+        sim.lookahead = lookahead
+        return sim
+
+    def _setup(self, stations: Dict[str, Station], rides: List[Ride],
+               headless: bool, station_store: Optional['StationStore'],
+               track_leaders: bool) -> None:
+        """Initialize the attributes of this simulation for the given
+        stations and rides.
+        """
+        if headless:
+            self.visualizer = None
+        else:
+            # Imported here so that headless simulations never load pygame.
+            from visualizer import Visualizer
+            self.visualizer = Visualizer()
+        self.all_stations = stations
+        self.station_store = station_store
+        if track_leaders:
+            self.leaders = StatLeaders(stations.values())
+        else:
+            self.leaders = None
+        self.all_rides = rides
+        self._rides_by_minute = None
+        self.active_rides = {}
+        self.event_queue = HeapPriorityQueue()
+        self._low_since = None
+        self._clock = None
+        self._periodic_tasks = []
+        self.station_grid = StationGrid(stations)
+        self.reroute = False
+        self.num_rerouted = 0
+        self.recorder = None
+        self.profiler = None
+        self.lookahead = STREAM_LOOKAHEAD
+        self.rebalancer = None
+        self._ride_source = None
+        self._ride_stream = None
+        self._next_ride = None
+        self._stream_window = (0, 0)
+
+    def enable_profiling(self, trace: bool = False) -> 'Profiler':
+        """Start measuring the time spent in each phase of this simulation,
+        and return the Profiler holding the measurements.
+
+        If <trace> is True, every call is also kept, so that the run can be
+        written out as a Chrome trace. Any earlier profiler is detached.
+        """
+        # Imported here because instrument depends on this module.
+        from instrument import Profiler
+        self.disable_profiling()
+        self.profiler = Profiler(trace)
+        self.profiler.attach(self)
+        return self.profiler
+
+    def disable_profiling(self) -> None:
+        """Stop measuring this simulation, if it is being measured.
+
+        The profiler keeps the measurements made so far.
+        """
+        if self.profiler is not None:
+            self.profiler.detach()
+            self.profiler = None
+
+    def add_periodic_task(self, interval: timedelta,
+                          callback: Callable[['Simulation', datetime], None]
+                          ) -> None:
+        """Arrange for <callback> to be called every <interval> of simulated
+        time while this simulation runs.
+
+        The callback is given this simulation and the simulated time it is
+        due at, and sees the state of the simulation at that time. If
+        several of its times pass with nothing happening, it is only called
+        for the latest of them.
+        """
+        self._periodic_tasks.append(_PeriodicTask(interval, callback))
+
+    def remove_periodic_task(self, callback: Callable[['Simulation',
+                                                       datetime], None]
+                             ) -> None:
+        """Stop calling <callback> at regular intervals.
+
+        Callbacks are compared with ==, so a bound method is found even
+        though each lookup of it makes a new method object.
+        """
+        self._periodic_tasks = [task for task in self._periodic_tasks
+                                if task.callback != callback]
+
+    def _start_periodic_tasks(self, start: datetime) -> None:
+        """Schedule every periodic task to first run one interval after
+        <start>.
+        """
+        for task in self._periodic_tasks:
+            task.next_time = start + task.interval
+
+    def _run_periodic_tasks(self, time: datetime) -> None:
+        """Run every periodic task that is due at or before <time>.
+        """
+        for task in list(self._periodic_tasks):
+            if task.next_time <= time:
+                due = task.next_time + ((time - task.next_time) //
+                                        task.interval) * task.interval
+                task.next_time = due + task.interval
+                if self._clock is not None and due > self._clock:
+                    self._clock = due
+                task.callback(self, due)
 
     def run(self, start: datetime, end: datetime) -> None:
         """Run the simulation from <start> to <end>.
+
+        A headless simulation returns as soon as it reaches <end>; otherwise
+        the window stays open until the user closes it.
         """
+        if self.is_streaming() or self.rebalancer is not None:
+            raise ValueError('streaming and rebalancing simulations can only '
+                             'be run with run_event_driven')
         step = timedelta(minutes=1)  # Each iteration spans one minute of time
 
         self.initialize_queue(start, end)
+        self._start_periodic_tasks(start)
+        if self.recorder is not None:
+            self.recorder.record_all(self.all_stations.values(), start)
 
         while start != end:
+            if self._periodic_tasks:
+                self._run_periodic_tasks(start)
             self._update_active_rides(start)
             self.update_simulation(start)  # updates graphics and statistics
             start += step
+        if self.recorder is not None:
+            self.recorder.flush()
+        if self.visualizer is None:
+            return
         while True:
             if self.visualizer.handle_window_events():
                 return  # Stop the simulation
 
-    def _update_active_rides(self, time: datetime) -> None:
-        """Update this simulation's list of active rides for the given time.
+    def run_event_driven(self, start: datetime, end: datetime,
+                         checkpoint_path: Optional[str] = None,
+                         checkpoint_interval: timedelta = CHECKPOINT_INTERVAL
+                         ) -> None:
+        """Run the simulation from <start> to <end>, one event time at a time.
+
+        Unlike run, this does not step through every minute or render
+        anything: it jumps straight from each event time to the next. Low
+        availability and low unoccupied times are added up per station over
+        the intervals between changes to that station, and give the same
+        statistics as run.
+
+        If <checkpoint_path> is given, the state of the simulation is saved
+        there every <checkpoint_interval> of simulated time, so that the run
+        can be continued with resume if it is interrupted.
+        """
+        self.initialize_queue(start, end)
+        self._run_events(start, end, checkpoint_path, checkpoint_interval)
 
-        REQUIRED IMPLEMENTATION NOTES:
-        -   Loop through `self.all_rides` and compare each Ride's start and
-            end times with <time>.
+    def resume(self, checkpoint_path: str, end: datetime,
+               checkpoint_interval: timedelta = CHECKPOINT_INTERVAL) -> None:
+        """Continue an interrupted run_event_driven run from the checkpoint
+        saved in <checkpoint_path>, until <end>.
+
+        This simulation must have been created from the same stations and
+        rides as the one that saved the checkpoint, and <end> must be the
+        end of the interrupted run. The checkpoint keeps being updated
+        every <checkpoint_interval>.
+        """
+        # Imported here because checkpoint depends on this module.
+        from checkpoint import load_checkpoint
+        clock = load_checkpoint(self, checkpoint_path)
+        self._run_events(clock, end, checkpoint_path, checkpoint_interval)
+
+    def _run_events(self, start: datetime, end: datetime,
+                    checkpoint_path: Optional[str],
+                    checkpoint_interval: timedelta) -> None:
+        """Process the events in event_queue from <start> until <end>, as
+        described in run_event_driven.
+        """
+        save = None
+        if checkpoint_path is not None:
+            if self.is_streaming():
+                raise ValueError('a streaming simulation cannot be '
+                                 'checkpointed')
+            from checkpoint import ride_rows, save_checkpoint
+            rows = None
+
+            def save(sim: Simulation, time: datetime) -> None:
+                """Save a checkpoint of <sim> at <time>.
+
+                The rows of the rides are found once, at the first
+                checkpoint of the run.
+                """
+                nonlocal rows
+                if rows is None:
+                    rows = ride_rows(sim)
+                save_checkpoint(sim, checkpoint_path, time, rows)
+            self.add_periodic_task(checkpoint_interval, save)
+
+        self.begin_events(start)
+        try:
+            self.process_until(end)
+            self.finish_events(end)
+        finally:
+            self.reset_events()
+            if save is not None:
+                self.remove_periodic_task(save)
+
+    def begin_events(self, start: datetime) -> None:
+        """Start an event-driven run at <start>, with the events already in
+        event_queue.
+
+        run_event_driven calls this; callers that add events to event_queue
+        as the run goes on (see livefeed) call it, then process_until as
+        often as needed, then finish_events and reset_events.
+        """
+        self._low_since = {}
+        for station in self.all_stations.values():
+            self._low_since[station] = (start, is_low_availability(station),
+                                        is_low_unoccupied(station))
+        self._clock = start
+        self._start_periodic_tasks(start)
+        if self.recorder is not None:
+            self.recorder.record_all(self.all_stations.values(), start)
+
+    def process_until(self, end: datetime) -> None:
+        """Process the events in event_queue that happen before <end>, and
+        those they generate, in order.
+
+        Events at or after <end> are left in the queue, and the run is taken
+        to have reached <end>.
+        """
+        while True:
+            if self._next_ride is not None:
+                self._read_rides()
+            if self.event_queue.is_empty():
+                break
+            time = self.event_queue.peek().time
+            if time >= end:
+                break
+            if self._periodic_tasks:
+                self._run_periodic_tasks(time)
+            self._clock = time
+            self._process_event(self.event_queue.remove())
+        # Every event before <end> has been processed, so nothing changes
+        # before then.
+        self._clock = end
+
+    def finish_events(self, end: datetime) -> None:
+        """Finish an event-driven run at <end>: run the periodic tasks due by
+        then, and bring every station's statistics up to <end>.
+        """
+        self._run_periodic_tasks(end)
+        self._clock = end
+        self.settle_low_time(end)
+        if self.recorder is not None:
+            self.recorder.flush()
+
+    def reset_events(self) -> None:
+        """Forget the state kept during an event-driven run, whether or not
+        it finished.
+        """
+        self._low_since = None
+        self._clock = None
+        self._ride_stream = None
+        self._next_ride = None
+
+    def is_streaming(self) -> bool:
+        """Return whether this simulation reads its rides as it runs,
+        instead of keeping them all in all_rides.
+        """
+        return self._ride_source is not None
+
+    def _read_rides(self) -> None:
+        """Add the start events of the rides in the ride stream to the
+        event queue, up to lookahead past the next event.
+
+        Rides already under way when the run starts are all read first:
+        they only have end events, which can be at any time. Every other
+        ride's event is at its start time, so afterwards no unread ride can
+        create an event before the next one in the queue.
 
-            If <time> is between the ride's start and end times (inclusive),
-            then add the ride to self.active_rides if it isn't already in
-            that list.
+        Raise a ValueError if the stream is not sorted by start time.
+        """
+        ride = self._next_ride
+        window_start, window_end = self._stream_window
+        rides = []
+        while ride is not None and ride.start_minute < window_start:
+            rides.append(ride)
+            ride = self._next_streamed_ride(ride)
+        self._add_streamed_rides(rides)
+        if ride is None:
+            self._next_ride = None
+            return
+
+        limit = ride.start_minute
+        if not self.event_queue.is_empty():
+            limit = min(limit, time_to_minutes(self.event_queue.peek().time))
+        limit += self.lookahead // timedelta(minutes=1)
+        rides = []
+        while ride is not None and ride.start_minute <= limit:
+            if ride.start_minute > window_end:
+                # No later ride can start before the run ends.
+                ride = None
+                break
+            rides.append(ride)
+            ride = self._next_streamed_ride(ride)
+        self._next_ride = ride
+        self._add_streamed_rides(rides)
 
-            Otherwise, remove the ride from self.active_rides if it is in
-            that list.
+    def _next_streamed_ride(self, ride: Ride) -> Optional[Ride]:
+        """Return the ride after <ride> in the ride stream, or None if there
+        are no more.
 
-        -   This means that if a ride started before the simulation's time
-            period but ends during or after the simulation's time period,
-            it should still be added to self.active_rides.
+        Raise a ValueError if it starts before <ride>.
+        """
+        next_ride = next(self._ride_stream, None)
+        if (next_ride is not None and
+                next_ride.start_minute < ride.start_minute):
+            raise ValueError('streamed rides are not sorted by start time')
+        return next_ride
+
+    def _add_streamed_rides(self, rides: List[Ride]) -> None:
+        """Add the events of <rides>, read from the ride stream, to the event
+        queue.
+        """
+        if rides:
+            # Ties go to streamed events before events generated by the run,
+            # so events are processed in the same order as if every ride
+            # had been added to the queue when the run started.
+            window_start, window_end = self._stream_window
+            events = []
+            events.extend(self.create_ride_start_events(
+                rides, minutes_to_time(window_start),
+                minutes_to_time(window_end), events))
+            self.event_queue.add_many(events, first=True)
+
+    def _process_event(self, event: 'Event') -> None:
+        """Process <event>, and add any events it generates to the queue.
+        """
+        generated_events = event.process()
+        if generated_events is not None:
+            self.event_queue.add_many(generated_events)
+
+    def settle_low_time(self, time: datetime) -> None:
+        """During an event-driven run, add the low availability and low
+        unoccupied time of every station up to <time> to its statistics.
 
+        Afterwards, the statistics of every station are exactly what they
+        would be if the run had ended at <time>. Stations that have already
+        been brought up to a later time are left as they are.
+        """
+        if self._low_since is None:
+            return
+        for station in self.all_stations.values():
+            since, low_availability, low_unoccupied = self._low_since[station]
+            if since >= time:
+                continue
+            # Only whole minutes are added, so the rest of a minute is kept
+            # to be added later.
+            elapsed = self._add_low_time(station, time)
+            self._low_since[station] = (since + timedelta(seconds=elapsed),
+                                        low_availability, low_unoccupied)
+            if self.leaders is not None:
+                self.leaders.update(station)
+
+    def _settle_low_stat(self, stat: str) -> None:
+        """If <stat> is a low time statistic and an event-driven run is
+        going on, bring it up to the simulated time the run has reached.
+
+        Low time is otherwise only added when a station changes, so it would
+        be missing the time since each station last changed.
         """
-        for ride in self.all_rides:
+        if (stat in ('low_availability', 'low_unoccupied')
+                and self._clock is not None):
+            self.settle_low_time(self._clock)
+
+    def record_station_change(self, station: Station, time: datetime) -> None:
+        """Record that the number of bikes at <station> changed at <time>.
+
+        Events call this after changing a station, so that run_event_driven
+        can account for the time the station spent in its previous state.
+        """
+        if self._low_since is not None:
+            self._add_low_time(station, time)
+            self._low_since[station] = (time, is_low_availability(station),
+                                        is_low_unoccupied(station))
+        if self.leaders is not None:
+            self.leaders.update(station)
+        if self.recorder is not None:
+            self.recorder.record(station, time)
+
+    def reroute_ride(self, ride: Ride, time: datetime) -> Optional[Station]:
+        """End <ride> at <time> at the station with a free dock nearest to
+        its full end station, and return that station.
+
+        Return None, and change nothing, if every station is full.
+        """
+        nearest = self.station_grid.nearest(ride.end.location, 1,
+                                            has_free_dock)
+        if not nearest:
+            return None
+        station = nearest[0]
+        station.num_bikes += 1
+        station.stats['ride_finishes'] += 1
+        self.num_rerouted += 1
+        self.record_station_change(station, time)
+        return station
+
+    def _add_low_time(self, station: Station, time: datetime) -> int:
+        """Add the time <station> spent in its current state up to <time> to
+        its low availability and low unoccupied statistics, in whole minutes,
+        and return the number of seconds added.
+        """
+        since, low_availability, low_unoccupied = self._low_since[station]
+        elapsed = int((time - since).total_seconds() // 60) * 60
+        assert elapsed >= 0, 'events must be processed in time order'
+        if low_availability:
+            station.stats['low_availability'] += elapsed
+        if low_unoccupied:
+            station.stats['low_unoccupied'] += elapsed
+        return elapsed
+
+    def _update_active_rides(self, time: datetime) -> None:
+        """Update this simulation's list of active rides for the given time.
+
+        Only the rides that start or end at <time> are looked at, using an
+        index of all_rides built the first time this method is called.
+
+        A ride starting at <time> is added to self.active_rides if its start
+        station has a bike available. A ride ending at <time> is removed from
+        self.active_rides if it is in there; rides that could not start are
+        never active, so they do not end either.
+        """
+        if self._rides_by_minute is None:
+            self._rides_by_minute = index_rides(self.all_rides)
+        for ride in self._rides_by_minute.get(time, []):
             if ride.start_time == time:
-                validated = validate_ride_start_event(ride)
-                if validated:
-                    self.active_rides.append(ride)
-                else:  # if the station has no more bikes to employ remove it.
-                    self.all_rides.remove(ride)
+                if validate_ride_start_event(ride):
+                    self.active_rides[ride] = None
+                    self.record_station_change(ride.start, time)
 
-            if ride.end_time == time:
-                self.active_rides.remove(ride)
-                validate_ride_end_event(ride)
+            elif ride in self.active_rides:
+                del self.active_rides[ride]
+                if validate_ride_end_event(ride):
+                    self.record_station_change(ride.end, time)
+                elif self.reroute:
+                    self.reroute_ride(ride, time)
 
     def calculate_statistics(self) -> Dict[str, Tuple[str, float]]:
         """Return a dictionary containing statistics for this simulation.
@@ -147,6 +733,13 @@ class Simulation:
          value for the inputed statistic.
 
          """
+        self._settle_low_stat(stat)
+        if self.leaders is not None:
+            leaders = self.leaders.top_k(stat, 1)
+            return leaders[0] if leaders else (None, -1)
+        if self.station_store is not None:
+            return self.station_store.optimal_stat(stat)
+
         max_value = -1
         max_station = None
 
@@ -160,6 +753,26 @@ class Simulation:
 
         return (max_station, max_value)
 
+    def top_k(self, stat: str, k: int) -> List[Tuple[str, int]]:
+        """Return the names and values of the <k> stations with the largest
+        values of <stat>, from largest to smallest.
+
+        Stations with equal values are ordered alphabetically by name. This
+        takes O(k log n) time if this simulation tracks leaders, and looks at
+        every station otherwise.
+
+        During an event-driven run, the low time statistics are first
+        brought up to the simulated time the run has reached (see
+        settle_low_time), which looks at every station.
+        """
+        self._settle_low_stat(stat)
+        if self.leaders is not None:
+            return self.leaders.top_k(stat, k)
+        best = heapq.nsmallest(
+            k, self.all_stations.values(),
+            key=lambda station: (-station.stats[stat], station.name))
+        return [(station.name, station.stats[stat]) for station in best]
+
     def _update_active_rides_fast(self, time: datetime) -> None:
         """Update this simulation's list of active rides for the given time.
 
@@ -181,41 +794,70 @@ class Simulation:
         responsile for updating the low_availability and low_unoccupancy
         statistics of all the stations every minute that goes by.
         """
+        if self.station_store is not None:
+            self.station_store.add_low_time(60)
+            if self.leaders is not None:
+                for station in self.all_stations.values():
+                    self.leaders.update(station)
+            return
+
         for station in self.all_stations.values():
-            if station.num_bikes <= 5:
+            low_availability = is_low_availability(station)
+            low_unoccupied = is_low_unoccupied(station)
+            if low_availability:
                 station.stats['low_availability'] += 60
                 # The station has at most 5 bikes available
-            if station.capacity - station.num_bikes <= 5:
+            if low_unoccupied:
                 station.stats['low_unoccupied'] += 60
                 # the station has at most 5 unoccupied spots.
+            if self.leaders is not None and (low_availability or
+                                             low_unoccupied):
+                self.leaders.update(station)
 
     def initialize_queue(self, start: datetime, end: datetime) -> None:
         """
         A helper function which initializes the event queue before the <start>
         time of the simulationby creating
         corresponding ride start events for all the valid rides.
+
+        If this simulation has a rebalancer, its first plan is made at
+        <start>.
         """
         lst = self.create_ride_start_events(self.all_rides, start, end)
-        for event in lst:
-            self.event_queue.add(event)
+        self.event_queue.add_many(lst)
+        if self.rebalancer is not None:
+            self.event_queue.add(RebalancePlanEvent(self, start))
+        if self.is_streaming():
+            self._ride_stream = iter(self._ride_source(start, end))
+            self._next_ride = next(self._ride_stream, None)
+            self._stream_window = (time_to_minutes(start),
+                                   time_to_minutes(end))
 
     def create_ride_start_events(self, rides_list: List['Ride'],
                                  sim_start: 'datetime',
-                                 sim_end: 'datetime') -> List:
+                                 sim_end: 'datetime',
+                                 end_events: Optional[List['Event']] = None
+                                 ) -> List:
         """
         Goes through <rides_list> and generates a list of corresponding of
         ridestart events to be used by a priority queue. If the ride is already
         going on before the <sim_start> then the ride is added directly to
         active rides list.
+
+        The end events of rides already going on are added to the event
+        queue, or appended to <end_events> if it is given.
         """
         all_ride_events = []
         for ride in rides_list:
             # generates and adds a ride start event if valid.
             if valid_ride(ride, sim_start, sim_end):
                 if ride.start_time < sim_start and ride.end_time <= sim_end:
-                    self.active_rides.append(ride)
+                    self.active_rides[ride] = None
                     end_event = RideEndEvent(self, ride.end_time, ride)
-                    self.event_queue.add(end_event)
+                    if end_events is None:
+                        self.event_queue.add(end_event)
+                    else:
+                        end_events.append(end_event)
                 else:
                     event = RideStartEvent(self, ride.start_time, ride)
                     all_ride_events.append(event)
@@ -243,8 +885,10 @@ class Simulation:
             maintaining what is rendered.
         """
         self.update_statistics()
-        self.visualizer.render_drawables(
-            list(self.all_stations.values()) + self.active_rides, time)
+        if self.visualizer is not None:
+            self.visualizer.render_drawables(
+                list(self.all_stations.values()) + list(self.active_rides),
+                time)
 
 
 def create_stations(stations_file: str) -> Dict[str, 'Station']:
@@ -279,36 +923,154 @@ def create_stations(stations_file: str) -> Dict[str, 'Station']:
 
 
 def create_rides(rides_file: str,
-                 stations: Dict[str, 'Station']) -> List['Ride']:
+                 stations: Dict[str, 'Station'],
+                 window: Optional[Tuple[datetime, datetime]] = None
+                 ) -> List['Ride']:
     """Return the rides described in the given CSV file.
 
     Lookup the station ids contained in the rides file in <stations>
     to access the corresponding Station objects.
 
     Ignore any ride whose start or end station is not present in <stations>.
+    If <window> is a (start, end) pair, also ignore any ride that would not
+    be valid in a simulation run from start to end.
 
     Precondition: rides_file matches the format specified in the
                   assignment handout.
     """
     rides = []
+    for chunk in iter_rides(rides_file, stations, window=window):
+        rides.extend(chunk)
+    return rides
+
+
+def iter_rides(rides_file: str, stations: Dict[str, 'Station'],
+               chunk_size: int = RIDE_CHUNK_SIZE,
+               window: Optional[Tuple[datetime, datetime]] = None
+               ) -> Iterator[List['Ride']]:
+    """Yield the rides described in the given CSV file, in lists of at most
+    <chunk_size> rides, in the order they appear in the file.
+
+    Rides are ignored exactly as in create_rides. Ignored rows are skipped
+    before any Ride is created for them.
+    """
+    if window is not None:
+        window_start = time_to_minutes(window[0])
+        window_end = time_to_minutes(window[1])
+    chunk = []
     with open(rides_file) as file:
         for line in csv.reader(file):
             # line is a list of strings, following the format described
             # in the assignment handout.
-            #
-            # Convert between a string and a datetime object
-            # using the function datetime.strptime and the DATETIME_FORMAT
-            # constant we defined above. Example:
-            # >>> datetime.strptime('2017-06-01 8:00', DATETIME_FORMAT)
-            # datetime.datetime(2017, 6, 1, 8, 0)
-            if line[1] in stations and line[3] in stations:
-                r = Ride(stations[line[1]], stations[line[3]],
-                         (datetime.strptime(line[0], DATETIME_FORMAT)\
-                         , datetime.strptime(line[2], DATETIME_FORMAT)))
-                if r.start_time < r.end_time:
-                    rides.append(r)
+            if line[1] not in stations or line[3] not in stations:
+                continue
+            start_minute = parse_minutes(line[0])
+            end_minute = parse_minutes(line[2])
+            if start_minute >= end_minute:
+                continue
+            if window is not None and not valid_ride_times(
+                    start_minute, end_minute, window_start, window_end):
+                continue
+            chunk.append(Ride.from_minutes(stations[line[1]],
+                                           stations[line[3]],
+                                           start_minute, end_minute))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_rides(rides_file: str, stations: Dict[str, 'Station'],
+                 start: datetime, end: datetime,
+                 use_cache: bool = False) -> Iterator['Ride']:
+    """Yield the rides in the given CSV file that a run from <start> to <end>
+    would use, one at a time, in the order they appear in the file.
+
+    If <use_cache> is True, the rides are read through the file's binary
+    cache (see ridecache). Only one chunk of rides is in memory at a time.
+    """
+    if use_cache:
+        # Imported here so that NumPy is only needed when it is used.
+        from ridecache import load_ride_chunks
+        chunks = load_ride_chunks(rides_file, stations, window=(start, end))
+    else:
+        chunks = iter_rides(rides_file, stations, window=(start, end))
+    for chunk in chunks:
+        yield from chunk
 
-    return rides
+
+@lru_cache(maxsize=TIME_CACHE_SIZE)
+def parse_time(text: str) -> datetime:
+    """Return the time described by <text>, which is in DATETIME_FORMAT.
+
+    This gives the same result as datetime.strptime(text, DATETIME_FORMAT),
+    but is much faster, and remembers recently parsed strings.
+
+    >>> parse_time('2017-06-01 8:00')
+    datetime.datetime(2017, 6, 1, 8, 0)
+    """
+    try:
+        day, clock = text.split(' ')
+        year, month, date = day.split('-')
+        hour, minute = clock.split(':')
+        return datetime(int(year), int(month), int(date),
+                        int(hour), int(minute))
+    except ValueError:
+        # Let strptime report (or accept) anything unusual.
+        return datetime.strptime(text, DATETIME_FORMAT)
+
+
+@lru_cache(maxsize=TIME_CACHE_SIZE)
+def parse_minutes(text: str) -> int:
+    """Return the time described by <text>, which is in DATETIME_FORMAT, as
+    a number of whole minutes since bikeshare.EPOCH.
+
+    Repeated strings give the same int object, so rides loaded from the
+    same minute share it.
+
+    >>> parse_minutes('1970-01-01 1:30')
+    90
+    """
+    return time_to_minutes(parse_time(text))
+
+
+class _PeriodicTask:
+    """A task run at regular intervals of simulated time.
+
+    === Attributes ===
+    interval:
+        the simulated time between runs of this task
+    callback:
+        the function to call, with the simulation and the current time
+    next_time:
+        the next time this task is due, or None if it has not been
+        scheduled yet
+    """
+    __slots__ = ('interval', 'callback', 'next_time')
+    interval: timedelta
+    callback: Callable[[Simulation, datetime], None]
+    next_time: Optional[datetime]
+
+    def __init__(self, interval: timedelta,
+                 callback: Callable[[Simulation, datetime], None]) -> None:
+        """Initialize a new periodic task."""
+        self.interval = interval
+        self.callback = callback
+        self.next_time = None
+
+
+def index_rides(rides: List['Ride']) -> Dict[datetime, List['Ride']]:
+    """Return a dictionary mapping each time to the rides in <rides> that
+    start or end at that time.
+
+    The rides for each time are in the same order as in <rides>.
+    """
+    index = {}
+    for ride in rides:
+        index.setdefault(ride.start_time, []).append(ride)
+        index.setdefault(ride.end_time, []).append(ride)
+    return index
 
 
 class Event:
@@ -364,7 +1126,8 @@ class RideStartEvent(Event):
         RideEndEvent which it returns in a list.
         """
         if validate_ride_start_event(self.ride):
-            self.simulation.active_rides.append(self.ride)
+            self.simulation.record_station_change(self.ride.start, self.time)
+            self.simulation.active_rides[self.ride] = None
             # Generate a RideEndEvent
             curr = self.ride
             end_event = RideEndEvent(self.simulation, curr.end_time, curr)
@@ -391,8 +1154,118 @@ class RideEndEvent(Event):
         rideEndEvent does it remove the ride from the active rides list.
         """
         # Remove ride from the list
-        validate_ride_end_event(self.ride)
-        self.simulation.active_rides.remove(self.ride)
+        if validate_ride_end_event(self.ride):
+            self.simulation.record_station_change(self.ride.end, self.time)
+        elif self.simulation.reroute:
+            self.simulation.reroute_ride(self.ride, self.time)
+        del self.simulation.active_rides[self.ride]
+
+
+class RebalancePlanEvent(Event):
+    """An event at which the simulation's rebalancer dispatches its idle
+    trucks, and schedules its next plan.
+
+    === Attributes ===
+    simulation: Is the simulation in which the event is to be processed
+    time: Is a datetime object which stores the time the event occur in the
+        simulation.
+    """
+
+    def process(self) -> List['Event']:
+        """Return the truck moves planned by the simulation's rebalancer,
+        followed by the next plan event.
+        """
+        rebalancer = self.simulation.rebalancer
+        events = rebalancer.plan(self.simulation, self.time)
+        events.append(RebalancePlanEvent(self.simulation,
+                                         self.time + rebalancer.interval))
+        return events
+
+
+class RebalancePickupEvent(Event):
+    """An event at which a rebalancing truck loads bikes at a station, and
+    sets off to drop them at another.
+
+    === Attributes ===
+    simulation: Is the simulation in which the event is to be processed
+    time: Is a datetime object which stores the time the event occur in the
+        simulation.
+    truck: The truck loading the bikes.
+    station: The station the bikes are taken from.
+    target: The station the bikes are taken to.
+    num_bikes: The number of bikes to load, if that many are available.
+    """
+    truck: 'Truck'
+    station: Station
+    target: Station
+    num_bikes: int
+
+    def __init__(self, simulation: 'Simulation', time: datetime,
+                 truck: 'Truck', station: Station, target: Station,
+                 num_bikes: int) -> None:
+        Event.__init__(self, simulation, time)
+        self.truck = truck
+        self.station = station
+        self.target = target
+        self.num_bikes = num_bikes
+
+    def process(self) -> List['Event']:
+        """Move up to num_bikes bikes from the station onto the truck, and
+        return the event of dropping them at the target station.
+
+        Fewer bikes are loaded if the station has fewer, or the truck has
+        no room for them.
+        """
+        truck = self.truck
+        station = self.station
+        bikes = min(self.num_bikes, station.num_bikes,
+                    truck.capacity - truck.load)
+        if bikes > 0:
+            station.num_bikes -= bikes
+            truck.load += bikes
+            self.simulation.record_station_change(station, self.time)
+        truck.station = station
+        travel = self.simulation.rebalancer.travel_time(
+            self.simulation.station_grid.distance(station.location,
+                                                  self.target.location))
+        return [RebalanceDropoffEvent(self.simulation, self.time + travel,
+                                      truck, self.target)]
+
+
+class RebalanceDropoffEvent(Event):
+    """An event at which a rebalancing truck unloads its bikes at a station,
+    and becomes free for its next move.
+
+    === Attributes ===
+    simulation: Is the simulation in which the event is to be processed
+    time: Is a datetime object which stores the time the event occur in the
+        simulation.
+    truck: The truck unloading its bikes.
+    station: The station the bikes are left at.
+    """
+    truck: 'Truck'
+    station: Station
+
+    def __init__(self, simulation: 'Simulation', time: datetime,
+                 truck: 'Truck', station: Station) -> None:
+        Event.__init__(self, simulation, time)
+        self.truck = truck
+        self.station = station
+
+    def process(self) -> None:
+        """Move as many of the truck's bikes to the station as it has free
+        docks for. Any bikes left over stay on the truck.
+        """
+        truck = self.truck
+        station = self.station
+        bikes = min(truck.load, station.capacity - station.num_bikes)
+        if bikes > 0:
+            station.num_bikes += bikes
+            truck.load -= bikes
+            self.simulation.rebalancer.bikes_moved += bikes
+            self.simulation.record_station_change(station, self.time)
+        truck.station = station
+        truck.busy = False
 
 
 #  Helper functions
@@ -429,6 +1302,18 @@ def validate_ride_end_event(ride: 'Ride') -> bool:
     return valid
 
 
+def is_low_availability(station: 'Station') -> bool:
+    """Return whether <station> has at most LOW_THRESHOLD bikes available.
+    """
+    return station.num_bikes <= LOW_THRESHOLD
+
+
+def is_low_unoccupied(station: 'Station') -> bool:
+    """Return whether <station> has at most LOW_THRESHOLD unoccupied spots.
+    """
+    return station.capacity - station.num_bikes <= LOW_THRESHOLD
+
+
 def alpha_order(string1: str, string2: str) -> str:
     """
     Compares <string1>  and  <string2> then retuns the string
@@ -457,17 +1342,31 @@ def valid_ride(ride: 'Ride', sim_start: 'datetime',
     """ A helper function that determines whether a ride is an anomaly
         and return if it is <valid> or not.
     """
+    return valid_ride_times(ride.start_time, ride.end_time, sim_start,
+                            sim_end)
+
+
+def valid_ride_times(start_time: Union['datetime', int],
+                     end_time: Union['datetime', int],
+                     sim_start: Union['datetime', int],
+                     sim_end: Union['datetime', int]) -> bool:
+    """ Return whether a ride from <start_time> to <end_time> is valid in a
+        simulation from <sim_start> to <sim_end>, as in valid_ride.
+
+        The times are either all datetimes or all minutes since
+        bikeshare.EPOCH.
+    """
     valid = True
-    if ride.start_time > sim_end or ride.start_time > ride.end_time:
+    if start_time > sim_end or start_time > end_time:
         # if the ride starts after sim end dont add it or ends before it
         # starts
         valid = False
-    elif ride.start_time < sim_start and ride.end_time <= sim_start:
+    elif start_time < sim_start and end_time <= sim_start:
         # if a ride starts and ends before the sim starts dont count it.
         valid = False
-    elif ride.start_time < sim_start and ride.end_time > sim_end:
+    elif start_time < sim_start and end_time > sim_end:
         valid = False
-    elif ride.start_time > ride.end_time:
+    elif start_time > end_time:
         # if a rides end time is before its start time.
         valid = False
     return valid
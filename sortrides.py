@@ -0,0 +1,227 @@
+"""Assignment 1 - External sort of ride files
+
+=== Module Description ===
+
+This file contains sort_rides, which merges one or more ride CSV files into
+a single file sorted by start time, using an external merge sort so that
+the input can be much larger than memory. Rows that create_rides would
+ignore (unknown stations, or an end time that is not after the start time)
+are dropped.
+
+Sorted ride files can be streamed (see Simulation's stream option), and
+seed the event queue in order. The binary cache of the output (see
+ridecache) can be written during the merge, so it never has to be parsed.
+
+Run this file to sort ride files from the command line, for example:
+
+    python sortrides.py OD_2017-06.csv OD_2017-07.csv -o summer.csv --cache
+"""
+import argparse
+from array import array
+import csv
+import heapq
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from bikeshare import Station
+from simulation import create_stations, parse_minutes
+
+# Default number of rows sorted in memory at a time
+RUN_SIZE = 1 << 20
+# Largest number of sorted runs merged at once
+MERGE_FAN_IN = 64
+
+
+class SortResult(NamedTuple):
+    """What sort_rides did.
+
+    === Attributes ===
+    read:
+        the number of rows read from the input files
+    written:
+        the number of rows written to the output file
+    runs:
+        the number of sorted runs the input was split into
+    """
+    read: int
+    written: int
+    runs: int
+
+
+def sort_rides(ride_files: List[str], stations: Dict[str, Station],
+               output_file: str, write_cache: bool = False,
+               run_size: int = RUN_SIZE,
+               temp_dir: Optional[str] = None) -> SortResult:
+    """Write the rows of <ride_files> between <stations> to <output_file>,
+    sorted by start time, and return what was done.
+
+    Rows are dropped if either station is not in <stations>, or the ride
+    does not end after it starts; this also drops blank and header
+    rows. Rows with the same start time keep their
+    order, with the rows of earlier files first.
+
+    At most <run_size> rows are held in memory at a time; the rest are kept
+    in temporary files in <temp_dir> (by default, the system's temporary
+    directory). If <write_cache> is True, the binary cache of the output
+    file is written too.
+    """
+    with tempfile.TemporaryDirectory(dir=temp_dir) as work_dir:
+        runs = []
+        read = 0
+        rows = []
+        for row in _read_rows(ride_files):
+            read += 1
+            if (len(row) < 4 or row[1] not in stations or
+                    row[3] not in stations):
+                continue
+            start_minute = parse_minutes(row[0])
+            if start_minute >= parse_minutes(row[2]):
+                continue
+            rows.append((start_minute, row))
+            if len(rows) == run_size:
+                runs.append(_write_run(rows, work_dir, len(runs)))
+                rows = []
+        if rows or not runs:
+            runs.append(_write_run(rows, work_dir, len(runs)))
+        num_runs = len(runs)
+
+        # Merge the runs in rounds until they can all be merged at once.
+        merge_round = 0
+        while len(runs) > MERGE_FAN_IN:
+            merge_round += 1
+            merged = []
+            for first in range(0, len(runs), MERGE_FAN_IN):
+                group = runs[first:first + MERGE_FAN_IN]
+                path = os.path.join(work_dir, 'merge{}_{}.csv'.format(
+                    merge_round, len(merged)))
+                with open(path, 'w', newline='') as file:
+                    writer = csv.writer(file, lineterminator='\n')
+                    for minute, row in _merge_runs(group):
+                        writer.writerow([minute] + row)
+                for run in group:
+                    os.remove(run)
+                merged.append(path)
+            runs = merged
+
+        columns = _CacheColumns() if write_cache else None
+        written = 0
+        with open(output_file, 'w', newline='') as file:
+            writer = csv.writer(file, lineterminator='\n')
+            for minute, row in _merge_runs(runs):
+                writer.writerow(row)
+                if columns is not None:
+                    columns.add(minute, row)
+                written += 1
+
+    if columns is not None:
+        # Imported here so that NumPy is only needed when it is used.
+        from ridecache import write_columns
+        write_columns(output_file, columns.arrays())
+    return SortResult(read, written, num_runs)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Sort the ride files named in the command line <args>.
+    """
+    parser = argparse.ArgumentParser(
+        description='Merge ride CSV files into one sorted by start time.')
+    parser.add_argument('ride_files', nargs='+', help='the ride files to sort')
+    parser.add_argument('-o', '--output', required=True,
+                        help='the sorted ride file to write')
+    parser.add_argument('--stations', default='stations.json',
+                        help='only keep rides between these stations')
+    parser.add_argument('--cache', action='store_true',
+                        help='also write the binary cache of the output')
+    parser.add_argument('--run-size', type=int, default=RUN_SIZE,
+                        help='number of rows to sort in memory at a time')
+    parser.add_argument('--temp-dir', default=None,
+                        help='directory for temporary files')
+    options = parser.parse_args(args)
+
+    result = sort_rides(options.ride_files, create_stations(options.stations),
+                        options.output, options.cache, options.run_size,
+                        options.temp_dir)
+    print('Wrote {} of {} rides to {} ({} sorted runs)'.format(
+        result.written, result.read, options.output, result.runs))
+
+
+class _CacheColumns:
+    """The ride cache columns of a file, built one row at a time.
+
+    === Attributes ===
+    station_rows:
+        maps each station id to its index in the station_ids column
+    values:
+        maps each other column name to its values so far
+    """
+    station_rows: Dict[str, int]
+    values: Dict[str, array]
+
+    def __init__(self) -> None:
+        """Initialize the columns of an empty file."""
+        self.station_rows = {}
+        self.values = {'start_index': array('i'), 'start_minute': array('q'),
+                       'end_index': array('i'), 'end_minute': array('q')}
+
+    def add(self, start_minute: int, row: List[str]) -> None:
+        """Add the ride described by the CSV <row>, which starts at
+        <start_minute>.
+        """
+        rows = self.station_rows
+        self.values['start_index'].append(rows.setdefault(row[1], len(rows)))
+        self.values['end_index'].append(rows.setdefault(row[3], len(rows)))
+        self.values['start_minute'].append(start_minute)
+        self.values['end_minute'].append(parse_minutes(row[2]))
+
+    def arrays(self) -> Dict[str, 'np.ndarray']:
+        """Return the columns, as ridecache.parse_ride_columns does.
+        """
+        # Imported here so that NumPy is only needed when it is used.
+        import numpy as np
+        columns = {'station_ids': np.array(list(self.station_rows),
+                                           dtype=str)}
+        for name, values in self.values.items():
+            columns[name] = np.array(values, dtype=(
+                np.int32 if values.typecode == 'i' else np.int64))
+        return columns
+
+
+def _read_rows(ride_files: Iterable[str]) -> Iterator[List[str]]:
+    """Yield the rows of each of <ride_files> in turn.
+    """
+    for ride_file in ride_files:
+        with open(ride_file, newline='') as file:
+            yield from csv.reader(file)
+
+
+def _write_run(rows: List[Tuple[int, List[str]]], work_dir: str,
+               number: int) -> str:
+    """Write the (start minute, row) pairs in <rows>, sorted by start minute,
+    to a new run file in <work_dir>, and return its path.
+    """
+    rows.sort(key=lambda pair: pair[0])
+    path = os.path.join(work_dir, 'run{}.csv'.format(number))
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        for minute, row in rows:
+            writer.writerow([minute] + row)
+    return path
+
+
+def _merge_runs(runs: List[str]) -> Iterator[Tuple[int, List[str]]]:
+    """Yield the (start minute, row) pairs of the files <runs>, merged in
+    order of start minute. Ties go to earlier runs.
+    """
+    files = [open(run, newline='') for run in runs]
+    try:
+        readers = [((int(line[0]), line[1:]) for line in csv.reader(file))
+                   for file in files]
+        yield from heapq.merge(*readers, key=lambda pair: pair[0])
+    finally:
+        for file in files:
+            file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Assignment 1 - Spatial index of stations
+
+=== Module Description ===
+
+This file contains the StationGrid class, which finds the stations nearest
+to a point, or within a distance of it, without looking at every station.
+
+Station locations are (long, lat) pairs. Distances are in metres, using an
+equirectangular projection around the stations' mean latitude, which is
+accurate to well under a metre across a city.
+"""
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bikeshare import Station
+
+# Default side length of a grid cell, in metres
+CELL_SIZE = 500.0
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111320.0
+
+
+class StationGrid:
+    """A uniform grid of square cells, each holding the stations inside it.
+
+    === Attributes ===
+    cell_size:
+        the side length of each cell, in metres
+
+    === Private Attributes ===
+    _x_scale:
+        metres per degree of longitude, at the stations' mean latitude
+    _cells:
+        maps each (column, row) cell to the stations in it, with their
+        projected (x, y) positions in metres
+    _bounds:
+        the smallest and largest (column, row) of any non-empty cell
+    """
+    cell_size: float
+    _x_scale: float
+    _cells: Dict[Tuple[int, int], List[Tuple[float, float, Station]]]
+    _bounds: Tuple[int, int, int, int]
+
+    def __init__(self, stations: Dict[str, Station],
+                 cell_size: float = CELL_SIZE) -> None:
+        """Initialize a grid of <stations>, with cells <cell_size> metres
+        across.
+        """
+        self.cell_size = cell_size
+        latitudes = [station.location[1] for station in stations.values()]
+        mean_latitude = sum(latitudes) / len(latitudes) if latitudes else 0
+        self._x_scale = METRES_PER_DEGREE * math.cos(
+            math.radians(mean_latitude))
+        self._cells = {}
+        for station in stations.values():
+            x, y = self._project(station.location)
+            self._cells.setdefault(self._cell(x, y), []).append(
+                (x, y, station))
+        if self._cells:
+            columns = [cell[0] for cell in self._cells]
+            rows = [cell[1] for cell in self._cells]
+            self._bounds = (min(columns), min(rows), max(columns), max(rows))
+        else:
+            self._bounds = (0, 0, -1, -1)
+
+    def nearest(self, location: Tuple[float, float], k: int = 1,
+                accept: Optional[Callable[[Station], bool]] = None
+                ) -> List[Station]:
+        """Return the <k> stations nearest to the (long, lat) <location>,
+        from nearest to farthest.
+
+        If <accept> is given, only stations for which it returns True are
+        considered. Fewer than <k> stations are returned if there are not
+        enough of them.
+        """
+        x, y = self._project(location)
+        column, row = self._cell(x, y)
+        found = []
+        ring = 0
+        while ring <= self._max_ring(column, row):
+            for station_x, station_y, station in self._ring(column, row,
+                                                            ring):
+                if accept is None or accept(station):
+                    found.append((math.hypot(station_x - x, station_y - y),
+                                  station))
+            found.sort(key=lambda pair: pair[0])
+            # Every station not yet seen is at least this far away.
+            if len(found) >= k and found[k - 1][0] <= ring * self.cell_size:
+                break
+            ring += 1
+        return [station for _, station in found[:k]]
+
+    def within(self, location: Tuple[float, float], radius: float,
+               accept: Optional[Callable[[Station], bool]] = None
+               ) -> List[Station]:
+        """Return the stations at most <radius> metres from the (long, lat)
+        <location>, from nearest to farthest.
+
+        If <accept> is given, only stations for which it returns True are
+        returned.
+        """
+        x, y = self._project(location)
+        column, row = self._cell(x, y)
+        # A station r rings away is at least (r - 1) cells away.
+        rings = min(int(radius // self.cell_size) + 1,
+                    self._max_ring(column, row))
+        found = []
+        for ring in range(rings + 1):
+            for station_x, station_y, station in self._ring(column, row,
+                                                            ring):
+                distance = math.hypot(station_x - x, station_y - y)
+                if distance <= radius and (accept is None or
+                                           accept(station)):
+                    found.append((distance, station))
+        found.sort(key=lambda pair: pair[0])
+        return [station for _, station in found]
+
+    def distance(self, location1: Tuple[float, float],
+                 location2: Tuple[float, float]) -> float:
+        """Return the distance in metres between two (long, lat) locations.
+        """
+        x1, y1 = self._project(location1)
+        x2, y2 = self._project(location2)
+        return math.hypot(x2 - x1, y2 - y1)
+
+    def _project(self, location: Tuple[float, float]) -> Tuple[float, float]:
+        """Return the (x, y) position in metres of a (long, lat) location.
+        """
+        return (location[0] * self._x_scale,
+                location[1] * METRES_PER_DEGREE)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        """Return the (column, row) of the cell containing (x, y).
+        """
+        return (int(math.floor(x / self.cell_size)),
+                int(math.floor(y / self.cell_size)))
+
+    def _max_ring(self, column: int, row: int) -> int:
+        """Return the largest ring around (column, row) that can contain
+        any station.
+        """
+        min_column, min_row, max_column, max_row = self._bounds
+        return max(column - min_column, max_column - column,
+                   row - min_row, max_row - row, 0)
+
+    def _ring(self, column: int, row: int, ring: int
+              ) -> List[Tuple[float, float, Station]]:
+        """Return the stations in the cells exactly <ring> cells away from
+        (column, row), counting diagonal steps as one.
+        """
+        if ring == 0:
+            return self._cells.get((column, row), [])
+        stations = []
+        for i in range(column - ring, column + ring + 1):
+            stations.extend(self._cells.get((i, row - ring), []))
+            stations.extend(self._cells.get((i, row + ring), []))
+        for j in range(row - ring + 1, row + ring):
+            stations.extend(self._cells.get((column - ring, j), []))
+            stations.extend(self._cells.get((column + ring, j), []))
+        return stations
+
+
+def has_free_dock(station: Station) -> bool:
+    """Return whether <station> has room for another bike.
+    """
+    return station.num_bikes < station.capacity
+
+
+def has_bike(station: Station) -> bool:
+    """Return whether <station> has a bike available.
+    """
+    return station.num_bikes > 0
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'math', 'bikeshare'
+        ]
+    })
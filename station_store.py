@@ -0,0 +1,191 @@
+"""Assignment 1 - Columnar station store
+
+=== Module Description ===
+
+This file contains the StationStore class, which keeps the state of every
+station in a simulation in NumPy arrays, one array per attribute. Per-minute
+statistics updates and searches for the station with the largest statistic
+then become a few whole-array operations instead of loops over every station.
+
+It also contains the StationView class: a Station whose num_bikes, capacity
+and stats are read from and written to a StationStore, so that the rest of
+the simulation can keep working with Station objects.
+"""
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from bikeshare import Drawable, Station, STATION_SPRITE, STAT_NAMES
+from simulation import LOW_THRESHOLD
+
+
+class StationStore:
+    """The state of a fixed set of stations, stored column by column.
+
+    Row i of every array describes the station with id ids[i].
+
+    === Attributes ===
+    ids:
+        the id of the station in each row
+    names:
+        the name of the station in each row
+    locations:
+        the (long, lat) location of the station in each row
+    rows:
+        maps each station id to its row
+    num_bikes:
+        the current number of bikes at each station
+    capacity:
+        the total number of bikes each station can store
+    stats:
+        maps each statistic name in STAT_NAMES to the value of that
+        statistic for each station
+
+    === Representation Invariants ===
+    - len(ids) == len(names) == len(num_bikes) == len(capacity)
+    - every array in stats has the same length as num_bikes
+    - 0 <= num_bikes <= capacity, elementwise
+    """
+    ids: List[str]
+    names: List[str]
+    locations: List[Tuple[float, float]]
+    rows: Dict[str, int]
+    num_bikes: np.ndarray
+    capacity: np.ndarray
+    stats: Dict[str, np.ndarray]
+
+    def __init__(self, stations: Dict[str, Station]) -> None:
+        """Initialize this store with a copy of the state of <stations>.
+        """
+        self.ids = list(stations)
+        self.names = [stations[i].name for i in self.ids]
+        self.locations = [stations[i].location for i in self.ids]
+        self.rows = {station_id: row
+                     for row, station_id in enumerate(self.ids)}
+        self.num_bikes = np.array([stations[i].num_bikes for i in self.ids],
+                                  dtype=np.int64)
+        self.capacity = np.array([stations[i].capacity for i in self.ids],
+                                 dtype=np.int64)
+        self.stats = {}
+        for stat in STAT_NAMES:
+            self.stats[stat] = np.array(
+                [stations[i].stats[stat] for i in self.ids], dtype=np.int64)
+
+    def views(self) -> Dict[str, 'StationView']:
+        """Return a dictionary mapping each station id to a StationView of
+        that station's row in this store.
+        """
+        return {station_id: StationView(self, row)
+                for row, station_id in enumerate(self.ids)}
+
+    def add_low_time(self, seconds: int) -> None:
+        """Add <seconds> to the low availability and low unoccupied
+        statistics of every station currently in that state.
+        """
+        self.stats['low_availability'][
+            self.num_bikes <= LOW_THRESHOLD] += seconds
+        self.stats['low_unoccupied'][
+            self.capacity - self.num_bikes <= LOW_THRESHOLD] += seconds
+
+    def optimal_stat(self, stat: str) -> Tuple[Optional[str], int]:
+        """Return the name of the station with the largest value of <stat>,
+        and that value.
+
+        Ties are broken by choosing the name that comes first alphabetically.
+        If there are no stations, return (None, -1).
+        """
+        column = self.stats[stat]
+        if len(column) == 0:
+            return (None, -1)
+        best = column.max()
+        rows = np.flatnonzero(column == best)
+        return (min(self.names[row] for row in rows), int(best))
+
+
+class StationView(Station):
+    """A Bixi station whose state is stored in a row of a StationStore.
+
+    Reading or changing num_bikes, capacity or stats reads or changes the
+    corresponding entries of the store.
+
+    === Public Attributes ===
+    store:
+        the store holding this station's state
+    row:
+        the row of <store> describing this station
+    """
+    store: StationStore
+    row: int
+
+    def __init__(self, store: StationStore, row: int) -> None:
+        """Initialize a view of the station in <row> of <store>.
+        """
+        Drawable.__init__(self, STATION_SPRITE)
+        self.store = store
+        self.row = row
+        self.name = store.names[row]
+        self.location = store.locations[row]
+        self.stats = _StatsView(store, row)
+
+    @property
+    def num_bikes(self) -> int:
+        """The current number of bikes at this station."""
+        return int(self.store.num_bikes[self.row])
+
+    @num_bikes.setter
+    def num_bikes(self, value: int) -> None:
+        self.store.num_bikes[self.row] = value
+
+    @property
+    def capacity(self) -> int:
+        """The total number of bikes this station can store."""
+        return int(self.store.capacity[self.row])
+
+    @capacity.setter
+    def capacity(self, value: int) -> None:
+        self.store.capacity[self.row] = value
+
+
+class _StatsView(MutableMapping):
+    """The statistics of one station in a StationStore, as a dictionary.
+
+    Only the keys in STAT_NAMES are present, and none can be removed.
+    """
+    _store: StationStore
+    _row: int
+
+    def __init__(self, store: StationStore, row: int) -> None:
+        """Initialize a view of the statistics in <row> of <store>.
+        """
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, stat: str) -> int:
+        return int(self._store.stats[stat][self._row])
+
+    def __setitem__(self, stat: str, value: int) -> None:
+        self._store.stats[stat][self._row] = value
+
+    def __delitem__(self, stat: str) -> None:
+        raise TypeError('station statistics cannot be removed')
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(STAT_NAMES)
+
+    def __len__(self) -> int:
+        return len(STAT_NAMES)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'collections',
+            'numpy', 'bikeshare', 'simulation'
+        ],
+        'generated-members': 'numpy.*'
+    })
@@ -0,0 +1,169 @@
+"""Assignment 1 - Parameter sweeps
+
+=== Module Description ===
+
+This file contains run_sweep, which runs the same stations and rides under
+many scenarios (different time windows, initial numbers of bikes or station
+capacities) in parallel worker processes, and collects the results.
+
+The stations and rides are parsed once, before the workers start. Where the
+operating system supports fork, the workers share the parent's parsed data
+copy-on-write; otherwise each worker parses the files once itself (see
+workers.map_shared). Each
+worker then resets the shared stations to their initial state before every
+scenario, and runs it headless with Simulation.run_event_driven.
+"""
+from datetime import datetime
+from functools import partial
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from bikeshare import Ride, Station
+from simulation import Simulation, create_rides, create_stations
+from workers import map_shared, shared
+
+
+class Scenario(NamedTuple):
+    """A configuration to run the simulation under.
+
+    === Attributes ===
+    name:
+        a name identifying this scenario in the results
+    start:
+        the time the simulation run starts
+    end:
+        the time the simulation run ends
+    num_bikes:
+        maps station ids to the number of bikes they start with, replacing
+        the number in the stations file. Stations not listed keep theirs.
+    capacity:
+        maps station ids to their capacity, replacing the capacity in the
+        stations file. Stations not listed keep theirs.
+    """
+    name: str
+    start: datetime
+    end: datetime
+    num_bikes: Optional[Dict[str, int]] = None
+    capacity: Optional[Dict[str, int]] = None
+
+
+class SweepResult(NamedTuple):
+    """The result of running one Scenario.
+
+    === Attributes ===
+    scenario:
+        the name of the scenario
+    statistics:
+        the result of calculate_statistics at the end of the run
+    stations:
+        maps each station id to a dictionary of that station's statistics,
+        plus its 'num_bikes' at the end of the run
+    """
+    scenario: str
+    statistics: Dict[str, Tuple[str, float]]
+    stations: Dict[str, Dict[str, int]]
+
+
+def run_sweep(station_file: str, ride_file: str, scenarios: List[Scenario],
+              max_workers: Optional[int] = None,
+              use_cache: bool = False) -> List[SweepResult]:
+    """Return the results of running every scenario in <scenarios> on the
+    given stations and rides, in the same order as <scenarios>.
+
+    The scenarios are run in up to <max_workers> processes (by default, one
+    per CPU). If <use_cache> is True, the files are loaded through ridecache.
+    """
+    return map_shared(run_scenario, scenarios,
+                      partial(_load, station_file, ride_file, use_cache),
+                      max_workers)
+
+
+def run_scenario(scenario: Scenario) -> SweepResult:
+    """Return the result of running <scenario> on this process's shared
+    stations and rides.
+
+    Precondition: this is run by run_sweep.
+    """
+    stations, rides, initial = shared()
+    reset_stations(stations, initial, scenario)
+
+    sim = Simulation.from_data(stations, rides)
+    sim.run_event_driven(scenario.start, scenario.end)
+
+    station_results = {}
+    for station_id, station in stations.items():
+        station_results[station_id] = dict(station.stats)
+        station_results[station_id]['num_bikes'] = station.num_bikes
+    return SweepResult(scenario.name, sim.calculate_statistics(),
+                       station_results)
+
+
+def reset_stations(stations: Dict[str, Station],
+                   initial: Dict[str, Tuple[int, int]],
+                   scenario: Scenario) -> None:
+    """Reset <stations> to the state <scenario> starts from.
+
+    <initial> maps each station id to its (capacity, num_bikes) in the
+    stations file. Every statistic is reset to 0.
+
+    Raise a ValueError if the scenario gives a station more bikes than its
+    capacity, or a negative number of bikes.
+    """
+    for station_id, station in stations.items():
+        capacity, num_bikes = initial[station_id]
+        if scenario.capacity is not None:
+            capacity = scenario.capacity.get(station_id, capacity)
+        if scenario.num_bikes is not None:
+            num_bikes = scenario.num_bikes.get(station_id, num_bikes)
+        if not 0 <= num_bikes <= capacity:
+            raise ValueError('scenario {} gives station {} {} bikes and '
+                             'capacity {}'.format(scenario.name, station_id,
+                                                  num_bikes, capacity))
+        station.capacity = capacity
+        station.num_bikes = num_bikes
+        for stat in station.stats:
+            station.stats[stat] = 0
+
+
+def sweep_table(results: List[SweepResult]) -> List[Dict[str, Any]]:
+    """Return <results> as a table with one row per scenario and station.
+
+    Each row maps 'scenario' and 'station_id' to the scenario name and the
+    station id, and the rest of its keys to that station's end-of-run
+    statistics. Rows are suitable for csv.DictWriter.
+    """
+    rows = []
+    for result in results:
+        for station_id, values in result.stations.items():
+            row = {'scenario': result.scenario, 'station_id': station_id}
+            row.update(values)
+            rows.append(row)
+    return rows
+
+
+def _load(station_file: str, ride_file: str, use_cache: bool
+          ) -> Tuple[Dict[str, Station], List[Ride],
+                     Dict[str, Tuple[int, int]]]:
+    """Return the stations and rides in the given files, and each station's
+    initial (capacity, num_bikes), to be shared by every scenario.
+    """
+    if use_cache:
+        # Imported here so that NumPy is only needed when it is used.
+        from ridecache import load_stations, load_rides
+        stations = load_stations(station_file)
+        rides = load_rides(ride_file, stations)
+    else:
+        stations = create_stations(station_file)
+        rides = create_rides(ride_file, stations)
+    initial = {station_id: (station.capacity, station.num_bikes)
+               for station_id, station in stations.items()}
+    return stations, rides, initial
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'datetime', 'functools',
+            'bikeshare', 'simulation', 'workers'
+        ]
+    })
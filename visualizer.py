@@ -14,16 +14,20 @@ There's quite a bit in this file, but you aren't responsible for most of it.
 (You'll be doing more with Pygame on Assignment 2, though!)
 
 It also contains the Map class, which is responsible for converting between
-lat/long coordinates and pixel coordinates on the pygame window.
+lat/long coordinates and pixel coordinates on the pygame window. Each frame,
+the positions of all rides are computed together with ride_positions and
+converted to pixels in a single array transform. NumPy is only needed for
+that; without it, each object is positioned on its own.
 
-DO NOT CHANGE ANY CODE IN THIS FILE. You don't need to for this assignment,
-and in fact you aren't even submitting this file!
+The Visualizer also caches sprites and map views, and times each frame.
 """
+from collections import OrderedDict
 from datetime import datetime
 import os
-from typing import List, Tuple
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
 import pygame
-from bikeshare import Drawable
+from bikeshare import Drawable, Ride, ride_positions
 
 
 WHITE = (255, 255, 255)
@@ -34,10 +38,20 @@ MAP_MAX = (-73.471199, 45.425780)
 
 # Window size
 SCREEN_SIZE = (960, 787)
+# Number of scaled map views kept for recently used pan/zoom settings
+VIEW_CACHE_SIZE = 8
 
 
 class Visualizer:
     """Visualizer for the current state of a simulation.
+
+    === Public Attributes ===
+    frame_count:
+        the number of frames rendered so far
+    last_frame_time:
+        the wall-clock time, in seconds, taken to render the last frame
+    total_frame_time:
+        the wall-clock time, in seconds, taken to render all frames so far
     """
     # === Private attributes ===
     # _screen: the pygame window that is shown to the user.
@@ -48,6 +62,9 @@ class Visualizer:
     _screen: pygame.Surface
     _mouse_down: bool
     _map: 'Map'
+    frame_count: int
+    last_frame_time: float
+    total_frame_time: float
 
     def __init__(self) -> None:
         """Initialize this visualization.
@@ -58,6 +75,9 @@ class Visualizer:
         self._screen.fill(WHITE)
         self._mouse_down = False
         self._map = Map(SCREEN_SIZE)
+        self.frame_count = 0
+        self.last_frame_time = 0.0
+        self.total_frame_time = 0.0
 
         # Initial render. Pass in datetime.now() as an dummy value.
         #self.render_drawables([], datetime.now())
@@ -65,6 +85,7 @@ class Visualizer:
     def render_drawables(self, drawables: List[Drawable],
                          time: datetime) -> None:
         """Render the simulation objects to the screen for the given time."""
+        frame_start = perf_counter()
         # Draw the background map onto the screen
         self._screen.fill(WHITE)
         self._screen.blit(self._map.get_current_view(), (0, 0))
@@ -74,6 +95,19 @@ class Visualizer:
         # Show the new image
         pygame.display.flip()
 
+        self.last_frame_time = perf_counter() - frame_start
+        self.total_frame_time += self.last_frame_time
+        self.frame_count += 1
+
+    def average_frame_time(self) -> float:
+        """Return the average time, in seconds, taken to render a frame.
+
+        Return 0.0 if no frames have been rendered.
+        """
+        if self.frame_count == 0:
+            return 0.0
+        return self.total_frame_time / self.frame_count
+
     def handle_window_events(self) -> bool:
         """Handle any user events triggered through the pygame window.
 
@@ -111,9 +145,20 @@ class Map:
     max_coords:
         the maximum lat/long coordinates
     """
+    # === Private attributes ===
+    # _sprites: maps each sprite file name to its loaded image, so that
+    #   every sprite file is only loaded once.
+    # _current_view: the scaled map view for the current pan/zoom settings,
+    #   or None if it has not been computed since they last changed.
+    # _views: the scaled map views for the most recently used pan/zoom
+    #   settings, keyed by (xoffset, yoffset, zoom), from least to most
+    #   recently used. Holds at most VIEW_CACHE_SIZE views.
     image: pygame.image
     min_coords: Tuple[float, float]
     max_coords: Tuple[float, float]
+    _sprites: Dict[str, pygame.Surface]
+    _current_view: Optional[pygame.Surface]
+    _views: 'OrderedDict[Tuple[int, int, float], pygame.Surface]'
 
     def __init__(self, screendims: Tuple[int, int]) -> None:
         """Initialize this map for the given screen dimensions.
@@ -127,6 +172,9 @@ class Map:
         self._yoffset = 0
         self._zoom = 1
         self.screensize = screendims
+        self._sprites = {}
+        self._current_view = None
+        self._views = OrderedDict()
 
     def render_objects(self, drawables: List[Drawable],
                        screen: pygame.Surface, time: datetime) -> None:
@@ -134,13 +182,42 @@ class Map:
 
         Calculate their positions based on the given time.
         """
-        for drawable in drawables:
-            latlong_position = drawable.get_position(time)
-            sprite_position = self._latlong_to_screen(latlong_position)
-            sprite_file = os.path.join(os.path.dirname(__file__),
-                                       drawable.sprite)
-            screen.blit(pygame.image.load(sprite_file),
-                        sprite_position)
+        try:
+            import numpy as np
+        except ImportError:
+            # Without NumPy, each object is positioned on its own.
+            screen.blits([(self._get_sprite(drawable.sprite),
+                           self._latlong_to_screen(
+                               drawable.get_position(time)))
+                          for drawable in drawables], False)
+            return
+        positions = np.empty((len(drawables), 2))
+        ride_rows = []
+        for row, drawable in enumerate(drawables):
+            if isinstance(drawable, Ride):
+                ride_rows.append(row)
+            else:
+                positions[row] = drawable.get_position(time)
+        if ride_rows:
+            positions[ride_rows] = ride_positions(
+                [drawables[row] for row in ride_rows], time)
+
+        points = self._latlong_to_screen_array(positions).tolist()
+        screen.blits([(self._get_sprite(drawable.sprite), tuple(point))
+                      for drawable, point in zip(drawables, points)], False)
+
+    def _get_sprite(self, sprite: str) -> pygame.Surface:
+        """Return the image for the given sprite file, loading it the first
+        time it is used.
+        """
+        image = self._sprites.get(sprite)
+        if image is None:
+            image = pygame.image.load(
+                os.path.join(os.path.dirname(__file__), sprite))
+            if pygame.display.get_surface() is not None:
+                image = image.convert_alpha()
+            self._sprites[sprite] = image
+        return image
 
     def _latlong_to_screen(self,
                            location: Tuple[float, float]) -> Tuple[int, int]:
@@ -161,12 +238,31 @@ class Map:
                   self.image.get_height())
         return x, y
 
+    def _latlong_to_screen_array(self, locations: Any) -> Any:
+        """Convert a NumPy array of lat/long coordinates, one pair per row,
+        into an array of pixel coordinates.
+
+        Each row of the result is equal to _latlong_to_screen of the same
+        row of <locations>.
+        """
+        # Imported here so that NumPy is only needed when it is used.
+        import numpy as np
+        width, height = self.image.get_width(), self.image.get_height()
+        size = np.array([width, height])
+        pixels = np.rint((locations - self.min_coords) /
+                         np.subtract(self.max_coords, self.min_coords) *
+                         size)
+        pixels = np.rint((pixels - (self._xoffset, self._yoffset)) *
+                         self._zoom * self.screensize / size)
+        return pixels.astype(int)
+
     def pan(self, dp: Tuple[int, int]) -> None:
         """Pan the view in the image by (dx, dy) screenspace pixels.
         """
         self._xoffset -= dp[0]
         self._yoffset -= dp[1]
         self._clamp_transformation()
+        self._current_view = None
 
     def zoom(self, dx: float) -> None:
         """Zooms the view by the given amount.
@@ -178,6 +274,7 @@ class Map:
 
         self._zoom += dx
         self._clamp_transformation()
+        self._current_view = None
 
     def _clamp_transformation(self) -> None:
         """Ensure that the transformation parameters are within a fixed range.
@@ -192,6 +289,28 @@ class Map:
 
     def get_current_view(self) -> pygame.Surface:
         """Get the subimage to display to screen from the map.
+
+        The scaled view is only recomputed when the pan/zoom settings have
+        changed to ones that were not used recently.
+        """
+        if self._current_view is None:
+            # Round the zoom so that zooming in and back out finds the
+            # same view despite floating point error.
+            key = (self._xoffset, self._yoffset, round(self._zoom, 6))
+            view = self._views.get(key)
+            if view is None:
+                view = self._scale_view()
+                self._views[key] = view
+                if len(self._views) > VIEW_CACHE_SIZE:
+                    self._views.popitem(last=False)
+            else:
+                self._views.move_to_end(key)
+            self._current_view = view
+        return self._current_view
+
+    def _scale_view(self) -> pygame.Surface:
+        """Return the subimage of the map for the current pan/zoom settings,
+        scaled to the screen size.
         """
         raw_width = self.image.get_width()
         raw_height = self.image.get_height()
@@ -207,8 +326,8 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'doctest', 'python_ta', 'typing',
-            'datetime', 'os', 'pygame',
+            'doctest', 'python_ta', 'typing', 'collections',
+            'datetime', 'numpy', 'os', 'pygame', 'time',
             'bikeshare'
         ],
         'generated-members': 'pygame.*'
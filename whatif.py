@@ -0,0 +1,294 @@
+"""Assignment 1 - What-if sweeps
+
+=== Module Description ===
+
+This file contains run_whatif, which simulates the same rides under many
+scenarios at once, where each scenario gives every station its own initial
+number of bikes (and, optionally, its own capacity).
+
+Whether a ride can start or end only depends on the number of bikes at its
+stations, and the rides that are turned away generate no further events. So
+every scenario processes a subsequence of one and the same event stream, in
+the same order as Simulation.run_event_driven would. That stream is built
+and sorted once, and then processed a single time against arrays holding
+the state of every station in every scenario, so each event updates all of
+the scenarios with a few NumPy operations.
+
+Rerouting, rebalancing trucks and periodic tasks are not modelled; use
+sweep.run_sweep for scenarios that need them.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bikeshare import EPOCH, Ride, Station, STAT_NAMES
+from simulation import LOW_THRESHOLD
+
+# Kinds of event in the stream
+START = 0
+END = 1
+
+
+class WhatIfResult:
+    """The statistics of every station, in every scenario of a what-if sweep.
+
+    Row s of every array describes scenario s, and column i the station with
+    id ids[i].
+
+    === Attributes ===
+    ids:
+        the id of the station in each column
+    names:
+        the name of the station in each column
+    num_bikes:
+        the number of bikes at each station at the end of each scenario
+    stats:
+        maps each statistic name in STAT_NAMES to its value for each station
+        in each scenario
+
+    === Representation Invariants ===
+    - len(ids) == len(names) == num_bikes.shape[1]
+    - every array in stats has the same shape as num_bikes
+    """
+    ids: List[str]
+    names: List[str]
+    num_bikes: np.ndarray
+    stats: Dict[str, np.ndarray]
+
+    def __init__(self, ids: List[str], names: List[str],
+                 num_bikes: np.ndarray, stats: Dict[str, np.ndarray]) -> None:
+        """Initialize the result of a sweep over the stations <ids>.
+        """
+        self.ids = ids
+        self.names = names
+        self.num_bikes = num_bikes
+        self.stats = stats
+
+    def __len__(self) -> int:
+        """Return the number of scenarios in this result.
+        """
+        return self.num_bikes.shape[0]
+
+    def optimal_stat(self, stat: str) -> Tuple[List[str], np.ndarray]:
+        """Return the name of the station with the largest value of <stat>
+        in each scenario, and those values.
+
+        Ties are broken by choosing the name that comes first alphabetically,
+        as Simulation.get_optimal_stat does.
+        """
+        column = self.stats[stat]
+        if column.shape[1] == 0:
+            return [None] * len(self), np.full(len(self), -1, np.int64)
+        by_name = np.array(sorted(range(len(self.names)),
+                                  key=lambda row: self.names[row]),
+                           dtype=np.intp)
+        best = by_name[column[:, by_name].argmax(axis=1)]
+        return ([self.names[row] for row in best],
+                column[np.arange(len(self)), best])
+
+    def calculate_statistics(self) -> Dict[str, Tuple[List[str], np.ndarray]]:
+        """Return the four statistics of Simulation.calculate_statistics,
+        with the station names and values of each scenario.
+        """
+        return {'max_start': self.optimal_stat('ride_starts'),
+                'max_end': self.optimal_stat('ride_finishes'),
+                'max_time_low_availability':
+                    self.optimal_stat('low_availability'),
+                'max_time_low_unoccupied':
+                    self.optimal_stat('low_unoccupied')}
+
+    def scenario_statistics(self, scenario: int
+                            ) -> Dict[str, Tuple[str, int]]:
+        """Return the statistics of <scenario>, as
+        Simulation.calculate_statistics would.
+        """
+        return {stat: (names[scenario], int(values[scenario]))
+                for stat, (names, values)
+                in self.calculate_statistics().items()}
+
+
+def fill_scenarios(stations: Dict[str, Station], fills: Sequence[float]
+                   ) -> np.ndarray:
+    """Return initial numbers of bikes for run_whatif with one scenario per
+    fraction in <fills>, in which every station is filled to that fraction
+    of its capacity, rounded to the nearest bike.
+    """
+    capacity = np.array([station.capacity for station in stations.values()],
+                        dtype=np.int64)
+    return np.rint(np.outer(fills, capacity)).astype(np.int64)
+
+
+def run_whatif(stations: Dict[str, Station], rides: List[Ride],
+               start: datetime, end: datetime, num_bikes: np.ndarray,
+               capacity: Optional[np.ndarray] = None) -> WhatIfResult:
+    """Return the statistics of simulating <rides> from <start> to <end> in
+    every scenario of <num_bikes>, as run_event_driven would.
+
+    Row s of <num_bikes> holds the number of bikes each station starts with
+    in scenario s, in the order of <stations>. <capacity> gives the capacity
+    of each station in the same way, either per scenario or, as a single
+    row, for every scenario; by default the stations keep their own.
+    <stations> themselves are not changed.
+
+    Raise a ValueError if a scenario gives a station a negative number of
+    bikes or more bikes than its capacity.
+    """
+    num_bikes = np.asarray(num_bikes, dtype=np.int64)
+    if capacity is None:
+        capacity = [station.capacity for station in stations.values()]
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=np.int64),
+                               num_bikes.shape)
+    if num_bikes.ndim != 2 or num_bikes.shape[1] != len(stations):
+        raise ValueError('num_bikes must have one column per station')
+    if ((num_bikes < 0) | (num_bikes > capacity)).any():
+        raise ValueError('a scenario gives a station a negative number of '
+                         'bikes, or more bikes than its capacity')
+
+    # The state is stored one row per station, so that the values of a
+    # station in every scenario are contiguous.
+    bikes = num_bikes.T.copy()
+    capacity = capacity.T.copy()
+    stats = {stat: np.zeros_like(bikes) for stat in STAT_NAMES}
+    _process_stream(_event_stream(stations, rides, start, end), bikes,
+                    capacity, stats, _seconds(start), _seconds(end))
+    return WhatIfResult(list(stations),
+                        [station.name for station in stations.values()],
+                        bikes.T.copy(),
+                        {stat: values.T.copy()
+                         for stat, values in stats.items()})
+
+
+def _event_stream(stations: Dict[str, Station], rides: List[Ride],
+                  start: datetime, end: datetime
+                  ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Return the events of simulating <rides> from <start> to <end>, if
+    every ride were able to start, in the order run_event_driven would
+    process them.
+
+    The result is four arrays with one entry per event: its kind (START or
+    END), the position in <stations> of its station, its time in seconds
+    since EPOCH, and the number of the ride that must have started for it
+    to happen (or -1 if there is no such ride).
+    """
+    rows = {station: row for row, station in enumerate(stations.values())}
+    count = len(rides)
+    start_row = np.fromiter((rows[ride.start] for ride in rides), np.intp,
+                            count)
+    end_row = np.fromiter((rows[ride.end] for ride in rides), np.intp, count)
+    start_time = np.fromiter((ride.start_minute for ride in rides),
+                             np.int64, count) * 60
+    end_time = np.fromiter((ride.end_minute for ride in rides), np.int64,
+                           count) * 60
+    sim_start = _seconds(start)
+    sim_end = _seconds(end)
+
+    # The same conditions as valid_ride and create_ride_start_events.
+    early = start_time < sim_start
+    valid = ~((start_time > sim_end) | (start_time > end_time) |
+              (early & (end_time <= sim_start)) |
+              (early & (end_time > sim_end)))
+    under_way = np.flatnonzero(valid & early)
+    starting = np.flatnonzero(valid & ~early)
+    starting = starting[np.argsort(start_time[starting], kind='stable')]
+
+    # Events at the same time are processed in the order they were added to
+    # the queue: first the ends of rides under way at <start>, then the
+    # starts in ride order, then the ends created by processing the starts.
+    order = np.arange(len(starting))
+    kind = np.concatenate([np.full(len(under_way), END, np.int8),
+                           np.full(len(starting), START, np.int8),
+                           np.full(len(starting), END, np.int8)])
+    station = np.concatenate([end_row[under_way], start_row[starting],
+                              end_row[starting]])
+    time = np.concatenate([end_time[under_way], start_time[starting],
+                           end_time[starting]])
+    ride = np.concatenate([np.full(len(under_way), -1, np.int64), order,
+                           order])
+    group = np.repeat(np.arange(3), [len(under_way), len(starting),
+                                     len(starting)])
+    rank = np.concatenate([under_way, starting, order])
+    stream = np.lexsort((rank, group, time))
+    # Events at or after <end> are never processed.
+    stream = stream[time[stream] < sim_end]
+    return kind[stream], station[stream], time[stream], ride[stream]
+
+
+def _process_stream(stream: Tuple[np.ndarray, np.ndarray, np.ndarray,
+                                  np.ndarray],
+                    bikes: np.ndarray, capacity: np.ndarray,
+                    stats: Dict[str, np.ndarray], start: int,
+                    end: int) -> None:
+    """Process the events of <stream>, as returned by _event_stream, from
+    <start> to <end> seconds since EPOCH, updating the <bikes> and <stats>
+    of every station in every scenario.
+
+    Row i of each array describes station i in every scenario.
+    """
+    low_availability = stats['low_availability']
+    low_unoccupied = stats['low_unoccupied']
+    ride_starts = stats['ride_starts']
+    ride_finishes = stats['ride_finishes']
+    since = [start] * len(bikes)
+    # Whether each ride under way started, in each scenario. Rides share
+    # slots, so only as many are needed as rides under way at once.
+    started = np.zeros((0, bikes.shape[1]), dtype=bool)
+    slots = {}
+    free = []
+
+    def add_low_time(row: int, time: int) -> None:
+        """Add the time station <row> spent in its current state in each
+        scenario up to <time> to its low time statistics.
+        """
+        elapsed = (time - since[row]) // 60 * 60
+        if elapsed:
+            available = bikes[row]
+            low_availability[row] += (available <= LOW_THRESHOLD) * elapsed
+            low_unoccupied[row] += (capacity[row] - available <=
+                                    LOW_THRESHOLD) * elapsed
+        since[row] = time
+
+    kinds, rows, times, rides = stream
+    for kind, row, time, ride in zip(kinds.tolist(), rows.tolist(),
+                                     times.tolist(), rides.tolist()):
+        add_low_time(row, time)
+        available = bikes[row]
+        if kind == START:
+            moved = available > 0
+            if not free:
+                free = list(range(len(started), 2 * len(started) + 1))
+                started = np.concatenate([started,
+                                          np.zeros((len(free), len(moved)),
+                                                   dtype=bool)])
+            slot = free.pop()
+            slots[ride] = slot
+            started[slot] = moved
+            available -= moved
+            ride_starts[row] += moved
+        else:
+            moved = available < capacity[row]
+            if ride >= 0:
+                slot = slots.pop(ride)
+                moved &= started[slot]
+                free.append(slot)
+            available += moved
+            ride_finishes[row] += moved
+
+    for row in range(len(bikes)):
+        add_low_time(row, end)
+
+
+def _seconds(time: datetime) -> int:
+    """Return <time> as the number of whole seconds since EPOCH.
+    """
+    return int((time - EPOCH).total_seconds())
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'datetime', 'numpy',
+            'bikeshare', 'simulation'
+        ]
+    })
@@ -0,0 +1,76 @@
+"""Assignment 1 - Worker processes
+
+=== Module Description ===
+
+This file contains map_shared, which runs a function over many items in
+parallel worker processes that all need the same, expensive to build, data:
+for example the parsed stations and rides of a parameter sweep, or the
+fitted model of a set of replicates.
+
+The data is built once per process. Where the operating system supports
+fork, it is built once, before the workers start, and the workers share it
+copy-on-write; otherwise each worker builds it once itself. Functions run
+by map_shared get it with shared().
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Any, Callable, Iterable, List, Optional
+
+# Stands for the shared data when none has been built in this process
+_NOT_LOADED = object()
+# The data shared by every item run in this process
+_shared = _NOT_LOADED
+
+
+def map_shared(function: Callable[[Any], Any], items: Iterable[Any],
+               load: Callable[[], Any],
+               max_workers: Optional[int] = None) -> List[Any]:
+    """Return the results of calling <function> on each of <items>, in the
+    same order, in up to <max_workers> processes (by default, one per CPU).
+
+    <function> can call shared() to get the result of calling <load>, which
+    is only called once in each process. Both must be picklable, such as
+    module-level functions or partials of them, in case the workers cannot
+    be forked.
+    """
+    global _shared
+    context = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Load the data once here; forked workers inherit the result.
+        _shared = load()
+        context = multiprocessing.get_context('fork')
+    try:
+        with ProcessPoolExecutor(max_workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(load,)) as executor:
+            return list(executor.map(function, items))
+    finally:
+        _shared = _NOT_LOADED
+
+
+def shared() -> Any:
+    """Return the data shared by the items of the map_shared call that this
+    process is working on.
+
+    Precondition: this is called by a function that map_shared runs.
+    """
+    return _shared
+
+
+def _init_worker(load: Callable[[], Any]) -> None:
+    """Load the shared data in a worker process, unless it was inherited
+    from the parent process.
+    """
+    global _shared
+    if _shared is _NOT_LOADED:
+        _shared = load()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'concurrent.futures',
+            'multiprocessing'
+        ]
+    })